@@ -0,0 +1,108 @@
+"""
+Micro-benchmark de _cluster_words (agrupamento de words em linhas do fallback de extract_raw).
+
+Compara a implementação com faixas de y (src/extract_raw.py) com a busca linear original
+sobre nuvens sintéticas de words, conferindo que as duas produzem as mesmas linhas.
+
+Uso:
+    python benchmarks/bench_line_clustering.py [--words 10000 20000 50000] [--seed 42]
+"""
+import sys
+import time
+import random
+import argparse
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'src'))
+
+from extract_raw import _cluster_words
+
+class FakePage:
+    """Imita o único método de pdfplumber.Page usado pelo fallback."""
+
+    def __init__(self, words):
+        self._words = words
+
+    def extract_words(self):
+        return self._words
+
+def reconstruct_lines(page, y_tol=3):
+    """Linhas de texto (top -> bottom) a partir dos agrupamentos de _cluster_words."""
+    lines = []
+    for _, items in _cluster_words(page.extract_words(), y_tol):
+        line = " ".join(t for _, t in items).strip()
+        if line:
+            lines.append(line)
+    return lines
+
+def reference_reconstruct_lines(page, x_tol=3, y_tol=3):
+    """Implementação original (busca linear em lines_map, O(words x linhas))."""
+    words = page.extract_words()
+    if not words:
+        return []
+
+    lines_map = []
+    for w in words:
+        y = float(w.get("top") or w.get("doctop") or 0)
+        x = float(w.get("x0") or 0)
+        text = w.get("text", "")
+
+        placed = False
+        for idx, (y_ref, items) in enumerate(lines_map):
+            if abs(y_ref - y) <= y_tol:
+                items.append((x, text))
+                placed = True
+                break
+        if not placed:
+            lines_map.append((y, [(x, text)]))
+
+    lines_map.sort(key=lambda p: p[0])
+    lines = []
+    for _, items in lines_map:
+        items.sort(key=lambda it: it[0])
+        line = " ".join(t for _, t in items).strip()
+        if line:
+            lines.append(line)
+    return lines
+
+def synthetic_words(n_words: int, rng: random.Random) -> list[dict]:
+    """
+    Nuvem de words parecida com uma página densa (tabela ou formulário escaneado):
+    metade alinhada em linhas com pequeno ruído vertical, metade espalhada ao acaso,
+    numa "página" alta o bastante para ter milhares de linhas distintas.
+    """
+    height = n_words * 0.8
+    words = []
+    for i in range(n_words):
+        if i % 2 == 0:
+            top = round(rng.randrange(0, int(height), 12) + rng.uniform(-1.5, 1.5), 3)
+        else:
+            top = round(rng.uniform(0, height), 3)
+        words.append({"text": f"w{i}", "x0": round(rng.uniform(0, 600), 3), "top": top})
+    return words
+
+def run(sizes: list[int], seed: int):
+    rng = random.Random(seed)
+    print(f"{'words':>8} {'linhas':>8} {'original (s)':>14} {'faixas (s)':>12} {'speedup':>9}")
+    for n_words in sizes:
+        page = FakePage(synthetic_words(n_words, rng))
+
+        start = time.perf_counter()
+        expected = reference_reconstruct_lines(page)
+        reference_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        lines = reconstruct_lines(page)
+        new_time = time.perf_counter() - start
+
+        if lines != expected:
+            raise SystemExit(f"ERRO: saídas diferentes para {n_words} words")
+        speedup = reference_time / new_time if new_time > 0 else float('inf')
+        print(f"{n_words:>8} {len(lines):>8} {reference_time:>14.3f} {new_time:>12.3f} {speedup:>8.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--words', type=int, nargs='+', default=[10000, 20000, 50000])
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    run(args.words, args.seed)
@@ -0,0 +1,281 @@
+"""
+Benchmark por etapa do pipeline (extract_raw, normalize_text, detect_structure, extract_tables,
+deduplicate, enrich_metadata) sobre os PDFs de data/input e sobre corpora sintéticos ampliados
+(todas as páginas do corpus repetidas N vezes em um único PDF, montado com pypdf).
+
+Cada etapa de cada entrada roda em um processo novo (spawn), com a entrada já pronta em disco
+(saída da etapa anterior), então o tempo é só o da etapa e o pico de memória (RSS) não herda
+as etapas anteriores. Para cada uma são registrados o tempo (o menor de --repeat execuções),
+páginas/s, parágrafos/s (parágrafos de detect_structure) e o pico de RSS. A deduplicação usa
+um cache temporário, preenchido pelas entradas anteriores da mesma execução, como em um lote.
+
+Os resultados são gravados em JSON (--save). Com uma linha de base (--baseline, padrão
+benchmarks/baselines/pipeline.json), cada etapa é comparada com ela e o script sai com código 1
+se alguma ficou mais lenta (ou usou mais memória) que o limite (--threshold). --update-baseline
+grava os resultados atuais como a nova linha de base. Linhas de base só são comparáveis na mesma
+máquina; o JSON guarda a identificação da máquina e avisa quando ela difere.
+
+Uso:
+    python benchmarks/bench_pipeline.py [PDF ...] [--stages extract_raw detect_structure]
+        [--scale 4 8] [--repeat 3] [--threshold 0.2] [--save resultados.json] [--update-baseline]
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import platform
+import argparse
+import resource
+import tempfile
+import warnings
+import subprocess
+from pathlib import Path
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT))
+sys.path.append(str(ROOT / 'src'))
+
+from document import PDFDocument
+
+STAGES = ('extract_raw', 'normalize_text', 'detect_structure', 'extract_tables', 'deduplicate', 'enrich_metadata')
+# Etapa -> etapas cujas saídas ela lê
+DEPENDENCIES = {
+    'extract_raw': (),
+    'normalize_text': ('extract_raw',),
+    'detect_structure': ('normalize_text',),
+    'extract_tables': (),
+    'deduplicate': ('detect_structure',),
+    'enrich_metadata': ('detect_structure',),
+}
+DEFAULT_BASELINE = ROOT / 'benchmarks' / 'baselines' / 'pipeline.json'
+DEFAULT_THRESHOLD = 0.2
+# Etapas mais rápidas que isso na linha de base não entram na comparação de tempo (só ruído)
+DEFAULT_MIN_SECONDS = 0.05
+
+def _peak_rss_mb() -> float:
+    # Inclui os processos filhos já encerrados (tarefas do Camelot, shards de extract_raw);
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _load(workdir: Path, stage: str):
+    with open(workdir / f"{stage}.pkl", 'rb') as f:
+        return pickle.load(f)
+
+def run_stage(stage: str, pdf_path: str, workdir: str, dedup_dir: str) -> dict:
+    """Executa uma etapa (em um processo novo); a saída fica em <workdir>/<etapa>.pkl."""
+    warnings.filterwarnings('ignore')
+    # O processo é só desta etapa: as mensagens das etapas não se misturam à tabela de resultados
+    sys.stdout = open(os.devnull, 'w')
+    from main import EXTRACT_RAW_PARAMS, DICTIONARIES_PATH, load_dictionaries
+    from extract_raw import extract_raw
+    from normalize_text import get_normalizer, normalize_blocks
+    from detect_structure import detect_structure
+    from extract_tables import extract_tables
+    from deduplicate import CrossDocumentDeduplication
+    from enrich_metadata import enrich_metadata
+
+    workdir = Path(workdir)
+    inputs = {dependency: _load(workdir, dependency) for dependency in DEPENDENCIES[stage]}
+    if stage == 'normalize_text':
+        acronyms, standardization_map = load_dictionaries(ROOT / DICTIONARIES_PATH, verbose=False)
+    rss_before = _peak_rss_mb()
+
+    start = time.perf_counter()
+    if stage == 'extract_raw':
+        with PDFDocument(pdf_path) as document:
+            output = extract_raw(document, **EXTRACT_RAW_PARAMS)
+    elif stage == 'normalize_text':
+        output = list(normalize_blocks(inputs['extract_raw'], get_normalizer(acronyms, standardization_map)))
+    elif stage == 'detect_structure':
+        output = detect_structure(pdf_path, inputs['normalize_text'])
+    elif stage == 'extract_tables':
+        output = extract_tables(pdf_path)
+    elif stage == 'deduplicate':
+        deduplicator = CrossDocumentDeduplication(cache_file=Path(dedup_dir) / 'deduplication.sqlite',
+                                                  space_dir=Path(dedup_dir) / 'tfidf_space')
+        output, _, _ = deduplicator.deduplicate_document(inputs['detect_structure'], Path(pdf_path).stem)
+    else:
+        with PDFDocument(pdf_path) as document:
+            output = enrich_metadata(inputs['detect_structure'], document, {"nome_doc": Path(pdf_path).stem})
+    seconds = time.perf_counter() - start
+
+    with open(workdir / f"{stage}.pkl", 'wb') as f:
+        pickle.dump(output, f)
+    return {"seconds": seconds, "peak_rss_mb": _peak_rss_mb(), "rss_before_mb": rss_before}
+
+def count_paragraphs(structure: dict) -> int:
+    return sum(len(item["paragrafos"]) if "paragrafos" in item else item.get("tipo") == "paragrafo"
+               for item in structure.get("estrutura", []))
+
+def build_synthetic_pdf(pdf_paths: list[Path], scale: int, output_path: Path) -> Path:
+    """PDF com todas as páginas do corpus repetidas scale vezes."""
+    from pypdf import PdfReader, PdfWriter
+    writer = PdfWriter()
+    readers = [PdfReader(str(pdf_path)) for pdf_path in pdf_paths]
+    for _ in range(scale):
+        for reader in readers:
+            for page in reader.pages:
+                writer.add_page(page)
+    with open(output_path, 'wb') as f:
+        writer.write(f)
+    return output_path
+
+def machine_info() -> dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"maquina": platform.node(), "plataforma": platform.platform(), "python": platform.python_version(),
+            "cpus": os.cpu_count(), "commit": commit}
+
+def bench_input(name: str, pdf_path: Path, stages: list[str], repeat: int, tmp_dir: Path, dedup_dir: Path,
+                executor_factory) -> dict:
+    """Roda as etapas pedidas (e as que elas dependem) sobre uma entrada; retorna as métricas por etapa."""
+    workdir = tmp_dir / name
+    workdir.mkdir()
+    needed = []
+    for stage in STAGES:
+        if stage in stages or any(stage in _closure(s) for s in stages):
+            needed.append(stage)
+
+    with PDFDocument(pdf_path) as document:
+        n_pages = document.n_pages
+    results = {}
+    n_paragraphs = None
+    for stage in needed:
+        runs = []
+        for _ in range(repeat if stage in stages else 1):
+            with executor_factory() as executor:
+                runs.append(executor.submit(run_stage, stage, str(pdf_path), str(workdir), str(dedup_dir)).result())
+        if stage == 'detect_structure':
+            n_paragraphs = count_paragraphs(_load(workdir, 'detect_structure'))
+        if stage not in stages:
+            continue
+        seconds = min(run["seconds"] for run in runs)
+        results[stage] = {
+            "seconds": round(seconds, 4),
+            "pages": n_pages,
+            "pages_per_s": round(n_pages / seconds, 2) if seconds > 0 else None,
+            "peak_rss_mb": round(max(run["peak_rss_mb"] for run in runs), 1),
+            "rss_before_mb": round(min(run["rss_before_mb"] for run in runs), 1),
+        }
+    for metrics in results.values():
+        metrics["paragraphs"] = n_paragraphs
+        metrics["paragraphs_per_s"] = (round(n_paragraphs / metrics["seconds"], 2)
+                                       if n_paragraphs is not None and metrics["seconds"] > 0 else None)
+    return results
+
+def _closure(stage: str) -> set[str]:
+    """Etapas das quais stage depende, direta ou indiretamente."""
+    closure = set()
+    for dependency in DEPENDENCIES[stage]:
+        closure |= {dependency} | _closure(dependency)
+    return closure
+
+def compare(results: dict, baseline: dict, threshold: float, min_seconds: float) -> list[str]:
+    """Regressões de cada (entrada, etapa) presente nas duas: tempo ou pico de RSS acima de 1 + threshold."""
+    regressions = []
+    for name, stages in results["resultados"].items():
+        for stage, metrics in stages.items():
+            reference = baseline.get("resultados", {}).get(name, {}).get(stage)
+            if not reference:
+                continue
+            if reference["seconds"] >= min_seconds and metrics["seconds"] > reference["seconds"] * (1 + threshold):
+                regressions.append(f"{name} / {stage}: {reference['seconds']:.3f}s -> {metrics['seconds']:.3f}s "
+                                   f"(+{metrics['seconds'] / reference['seconds'] - 1:.0%})")
+            if metrics["peak_rss_mb"] > reference["peak_rss_mb"] * (1 + threshold):
+                regressions.append(f"{name} / {stage}: pico de RSS {reference['peak_rss_mb']:.0f} MB -> "
+                                   f"{metrics['peak_rss_mb']:.0f} MB")
+    return regressions
+
+def print_results(results: dict, baseline: dict = None):
+    print(f"{'entrada':<32} {'etapa':<17} {'tempo':>9} {'págs/s':>9} {'parág./s':>10} {'RSS MB':>8} {'base':>9}")
+    for name, stages in results["resultados"].items():
+        for stage, metrics in stages.items():
+            reference = (baseline or {}).get("resultados", {}).get(name, {}).get(stage)
+            base = f"{reference['seconds']:>8.3f}s" if reference else f"{'-':>9}"
+            paragraphs_per_s = metrics['paragraphs_per_s']
+            paragraphs_per_s = f"{paragraphs_per_s:>10.1f}" if paragraphs_per_s is not None else f"{'-':>10}"
+            print(f"{name[:32]:<32} {stage:<17} {metrics['seconds']:>8.3f}s {metrics['pages_per_s'] or 0:>9.1f} "
+                  f"{paragraphs_per_s} {metrics['peak_rss_mb']:>8.1f} {base}")
+
+def run(pdf_paths: list[Path], stages: list[str], scales: list[int], repeat: int) -> dict:
+    def executor_factory():
+        # Um processo novo por execução: o pico de RSS é só o da etapa (mais imports e entrada)
+        return ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn'), max_tasks_per_child=1)
+
+    results = {"meta": {**machine_info(), "data": time.strftime('%Y-%m-%dT%H:%M:%S'), "repeticoes": repeat,
+                        "escalas": scales, "etapas": stages},
+               "resultados": {}}
+    with tempfile.TemporaryDirectory(prefix='bench-pipeline-') as tmp:
+        tmp_dir = Path(tmp)
+        dedup_dir = tmp_dir / 'dedup'
+        inputs = [(pdf_path.stem, pdf_path) for pdf_path in pdf_paths]
+        for scale in scales:
+            synthetic = build_synthetic_pdf(pdf_paths, scale, tmp_dir / f"sintetico_x{scale}.pdf")
+            inputs.append((synthetic.stem, synthetic))
+        for name, pdf_path in inputs:
+            print(f"{name}...", flush=True)
+            results["resultados"][name] = bench_input(name, pdf_path, stages, repeat, tmp_dir, dedup_dir,
+                                                      executor_factory)
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark por etapa do pipeline, com linha de base.")
+    parser.add_argument('pdfs', nargs='*', type=Path, help="PDFs (padrão: data/input/*.pdf)")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--scale', nargs='*', type=int, default=[],
+                        help="Corpora sintéticos: todas as páginas repetidas N vezes (p. ex. --scale 4 8).")
+    parser.add_argument('--repeat', type=int, default=1, help="Execuções por etapa; vale a mais rápida.")
+    parser.add_argument('--save', type=Path, default=None, help="Grava os resultados em JSON.")
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true', help="Grava os resultados como linha de base.")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Piora máxima aceita em relação à linha de base (padrão: {DEFAULT_THRESHOLD:.0%}).")
+    parser.add_argument('--min-seconds', type=float, default=DEFAULT_MIN_SECONDS,
+                        help="Etapas mais rápidas que isso na linha de base não têm o tempo comparado.")
+    args = parser.parse_args(argv)
+
+    pdf_paths = args.pdfs or sorted((ROOT / 'data/input').glob('*.pdf'))
+    results = run(pdf_paths, args.stages, args.scale, args.repeat)
+
+    baseline = None
+    if args.baseline.exists() and not args.update_baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print()
+    print_results(results, baseline)
+
+    if args.save:
+        args.save.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.update_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nLinha de base gravada em {args.baseline}")
+        return 0
+    if baseline is None:
+        print(f"\nSem linha de base em {args.baseline} (use --update-baseline para gravar uma).")
+        return 0
+
+    if baseline.get("meta", {}).get("maquina") != results["meta"]["maquina"]:
+        print(f"\nAviso: linha de base gravada em outra máquina ({baseline.get('meta', {}).get('maquina')}).")
+    regressions = compare(results, baseline, args.threshold, args.min_seconds)
+    if regressions:
+        print(f"\nRegressões acima de {args.threshold:.0%}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print(f"\nNenhuma regressão acima de {args.threshold:.0%} em relação a {args.baseline}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
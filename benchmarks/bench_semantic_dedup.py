@@ -0,0 +1,168 @@
+"""
+Compara a busca de similaridades semânticas da deduplicação cruzada: o caminho original
+(TF-IDF ajustado sobre todo o corpus + cosine_similarity densa N x N) contra o índice
+MinHash/LSH do cache SQLite (src/dedup_store.py, src/near_duplicates.py) e o espaço TF-IDF persistente (src/vector_space.py).
+
+O corpus é sintético, montado a partir dos parágrafos reais de data/output: parte dos
+parágrafos "atuais" são variações de parágrafos anteriores (palavras trocadas, removidas ou
+inseridas), o resto é texto novo. A revocação do MinHash e do espaço persistente é medida contra
+os pares que o TF-IDF encontra com similaridade >= 0,85. O tempo de indexação (feito uma vez,
+documento a documento, no uso real) é separado do tempo de consulta de um documento novo.
+
+Uso:
+    python benchmarks/bench_semantic_dedup.py [--sizes 2000 5000 10000 50000] [--current 300]
+"""
+import sys
+import tempfile
+import time
+import random
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / 'src'))
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+from deduplicate import CrossDocumentDeduplication
+from near_duplicates import MinHasher
+from dedup_store import DedupStore
+from vector_space import HashedTfidfSpace
+from output_writer import read_output
+
+# Maior corpus em que o caminho original (matriz densa N x N) ainda é executado
+MAX_DENSE = 12000
+
+def load_paragraphs(output_dir: Path) -> list[str]:
+    texts = []
+    def collect(node):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == "texto" and isinstance(value, str) and len(value) >= 50:
+                    texts.append(value)
+                else:
+                    collect(value)
+        elif isinstance(node, list):
+            for item in node:
+                collect(item)
+    for path in sorted(output_dir.glob('*_output.jsonl*')):
+        collect(read_output(path))
+    preprocess = CrossDocumentDeduplication.preprocess_text_for_deduplication
+    return [preprocess(None, text) for text in texts]
+
+def mutate(words: list[str], vocabulary: list[str], rate: float, rng: random.Random) -> list[str]:
+    words = list(words)
+    for _ in range(max(1, int(len(words) * rate))):
+        op = rng.random()
+        i = rng.randrange(len(words))
+        if op < 0.4:
+            words[i] = rng.choice(vocabulary)
+        elif op < 0.7 and len(words) > 3:
+            del words[i]
+        else:
+            words.insert(i, rng.choice(vocabulary))
+    return words
+
+def synthetic_corpus(base: list[str], n_previous: int, n_current: int, rng: random.Random):
+    tokenized = [text.split() for text in base]
+    vocabulary = [word for words in tokenized for word in words]
+
+    def new_paragraph():
+        # Texto "novo": pedaços de parágrafos diferentes, com mutação pesada
+        words = rng.choice(tokenized)[:rng.randint(10, 30)] + rng.choice(tokenized)[:rng.randint(10, 30)]
+        return mutate(words, vocabulary, 0.5, rng)
+
+    previous = [" ".join(new_paragraph()) for _ in range(n_previous)]
+    current = []
+    for _ in range(n_current):
+        if rng.random() < 0.3:
+            source = rng.choice(previous).split()
+            current.append(" ".join(mutate(source, vocabulary, rng.choice([0.02, 0.05, 0.1, 0.2]), rng)))
+        else:
+            current.append(" ".join(new_paragraph()))
+    return previous, current
+
+def tfidf_dense(previous: list[str], current: list[str], threshold: float) -> set[tuple[int, int]]:
+    """Caminho original: ajusta no corpus inteiro e calcula a matriz de similaridade completa."""
+    all_texts = previous + current
+    vectorizer = TfidfVectorizer(min_df=1, max_df=0.9, stop_words=None)
+    tfidf_matrix = vectorizer.fit_transform(all_texts)
+    cosine_sim = cosine_similarity(tfidf_matrix)
+    pairs = set()
+    for i in range(len(current)):
+        for j in range(len(previous)):
+            if cosine_sim[len(previous) + i][j] >= threshold:
+                pairs.add((i, j))
+    return pairs
+
+def tfidf_reference(previous: list[str], current: list[str], threshold: float) -> set[tuple[int, int]]:
+    """Mesmos pares do caminho original, calculando só o bloco atual x anterior (esparso)."""
+    vectorizer = TfidfVectorizer(min_df=1, max_df=0.9, stop_words=None)
+    tfidf_matrix = vectorizer.fit_transform(previous + current)
+    block = (tfidf_matrix[len(previous):] @ tfidf_matrix[:len(previous)].T).tocoo()
+    return {(int(i), int(j)) for i, j, v in zip(block.row, block.col, block.data) if v >= threshold}
+
+def minhash(previous: list[str], current: list[str], threshold: float, **params):
+    with tempfile.TemporaryDirectory() as db_dir:
+        store = DedupStore(Path(db_dir) / 'deduplication.sqlite', MinHasher(**params), legacy_json_path=None)
+        start = time.perf_counter()
+        store.save_document("anterior", [{"normalized_text": text, "paragraph_numero": j}
+                                         for j, text in enumerate(previous)])
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        pairs = {(i, int(row["paragraph_numero"])) for i, text in enumerate(current)
+                 for row, _ in store.similar_paragraphs(text, threshold)}
+        query_time = time.perf_counter() - start
+        store.close()
+    return pairs, build_time, query_time
+
+def persistent_tfidf(previous: list[str], current: list[str], threshold: float, segment_rows: int = 500):
+    with tempfile.TemporaryDirectory() as space_dir:
+        space = HashedTfidfSpace(space_dir)
+        start = time.perf_counter()
+        # Um segmento por "documento" anterior, como na deduplicação
+        for n, first in enumerate(range(0, len(previous), segment_rows)):
+            space.add_document(f"anterior-{n}", previous[first:first + segment_rows],
+                               [{"j": j} for j in range(first, min(first + segment_rows, len(previous)))])
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        matches = space.top_k(current, k=10, threshold=threshold)
+        query_time = time.perf_counter() - start
+    pairs = {(i, row["j"]) for i, text_matches in enumerate(matches) for _, _, row in text_matches}
+    return pairs, build_time, query_time
+
+def run(sizes: list[int], n_current: int, threshold: float, minhash_threshold: float, seed: int):
+    base = load_paragraphs(ROOT / 'data/output')
+    print(f"{len(base)} parágrafos reais como base | limiar TF-IDF {threshold} | limiar MinHash {minhash_threshold}")
+    print(f"{'N':>7} {'TF-IDF denso':>13} {'pares':>6} | {'MinHash (índice+busca)':>24} {'revoc.':>7} {'extras':>6} "
+          f"| {'TF-IDF persistente':>20} {'revoc.':>7} {'extras':>6}")
+    for n_previous in sizes:
+        rng = random.Random(seed)
+        previous, current = synthetic_corpus(base, n_previous, n_current, rng)
+
+        if n_previous <= MAX_DENSE:
+            start = time.perf_counter()
+            tfidf_dense(previous, current, threshold)
+            dense_time = f"{time.perf_counter() - start:>12.2f}s"
+        else:
+            dense_time = f"{'(pulado)':>13}"
+        reference = tfidf_reference(previous, current, threshold)
+
+        line = f"{n_previous:>7} {dense_time} {len(reference):>6}"
+        for method, method_threshold in ((minhash, minhash_threshold), (persistent_tfidf, threshold)):
+            pairs, build_time, query_time = method(previous, current, method_threshold)
+            recall = len(pairs & reference) / len(reference) if reference else 1.0
+            timing = f"{build_time:.2f}s + {query_time:.2f}s"
+            line += f" | {timing:>{24 if method is minhash else 20}} {recall:>7.1%} {len(pairs - reference):>6}"
+        print(line)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="TF-IDF denso x MinHash/LSH na deduplicação semântica.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 5000, 10000, 50000])
+    parser.add_argument('--current', type=int, default=300, help="Parágrafos do documento atual.")
+    parser.add_argument('--threshold', type=float, default=0.85)
+    parser.add_argument('--minhash-threshold', type=float, default=0.75,
+                        help="Limiar de Jaccard estimado (padrão: o mesmo da deduplicação, 0.75).")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    run(args.sizes, args.current, args.threshold, args.minhash_threshold, args.seed)
@@ -0,0 +1,67 @@
+"""
+Compara a extração de tabelas com o Camelot em todas as páginas (lattice e stream, como antes)
+contra a extração só nas páginas apontadas pelo pré-filtro (src/extract_tables.py: grade de linhas
+desenhadas para o lattice, texto em colunas alinhadas para o stream, stream só onde o lattice
+não encontrou nada).
+
+Além do tempo, mede quantas tabelas "de verdade" da extração completa continuam sendo encontradas:
+tabelas com duas ou mais colunas em que pelo menos metade das linhas preenche duas células ou mais.
+As demais saídas do stream em páginas de texto corrido (um parágrafo por "linha") não contam, nem
+as do stream em páginas onde o lattice já encontrou tabela (releituras da mesma tabela com outro corte
+de linhas e colunas, que a junção dos flavors não reconhecia como repetidas).
+
+Uso:
+    python benchmarks/bench_table_prefilter.py [PDF ...]   (padrão: data/input/*.pdf)
+"""
+import sys
+import time
+import warnings
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / 'src'))
+
+from document import PDFDocument
+from extract_tables import scan_tables
+
+def is_real_table(rows: list[list[str]]) -> bool:
+    if len(rows) < 2 or len(rows[0]) < 2:
+        return False
+    multi_cell_rows = sum(1 for row in rows if sum(1 for cell in row if cell.strip()) >= 2)
+    return multi_cell_rows * 2 >= len(rows)
+
+def table_keys(raw_tables: list[dict]) -> set:
+    lattice_pages = {table["page"] for table in raw_tables if table["flavor"] == "lattice"}
+    return {(table["page"], repr(table["rows"])) for table in raw_tables
+            if is_real_table(table["rows"]) and (table["flavor"] == "lattice" or table["page"] not in lattice_pages)}
+
+def run(pdf_paths: list[Path]):
+    print(f"{'PDF':<40} {'págs':>5} | {'completo':>9} {'tabelas':>7} | {'pré-filtro':>10} {'analisadas':>10} "
+          f"{'tabelas':>7} {'revoc.':>7} {'economia est.':>13}")
+    total_full = total_filtered = 0.0
+    for pdf_path in pdf_paths:
+        with PDFDocument(pdf_path) as document:
+            start = time.perf_counter()
+            full = scan_tables(document, prefilter=False)
+            full_s = time.perf_counter() - start
+            start = time.perf_counter()
+            filtered = scan_tables(document, prefilter=True)
+            filtered_s = time.perf_counter() - start
+        total_full += full_s
+        total_filtered += filtered_s
+
+        reference = table_keys(full["raw_tables"])
+        found = table_keys(filtered["raw_tables"])
+        recall = len(reference & found) / len(reference) if reference else 1.0
+        print(f"{pdf_path.name[:40]:<40} {full['pages_total']:>5} | {full_s:>8.1f}s {len(reference):>7} | "
+              f"{filtered_s:>9.1f}s {filtered['pages_scanned']:>10} {len(found):>7} {recall:>7.1%} "
+              f"{filtered['estimated_saved_s']:>12.1f}s")
+    print(f"Total: {total_full:.1f}s -> {total_filtered:.1f}s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Camelot em todas as páginas x só nas páginas candidatas.")
+    parser.add_argument('pdfs', nargs='*', type=Path)
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')
+    run(args.pdfs or sorted((ROOT / 'data/input').glob('*.pdf')))
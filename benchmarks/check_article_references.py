@@ -0,0 +1,66 @@
+"""
+Regressão da detecção de artigos (src/detect_structure.py): remissões no meio do texto ("do Art. 106,
+III", "no Art. 5º desta Lei") não podem abrir um artigo novo, nem entrar no índice de artigos
+(build_index/find_articles), e os artigos de verdade, com as grafias usadas nos PDFs de data/input,
+continuam sendo encontrados.
+
+Cada caso é um bloco de texto como os de extract_raw (as linhas da página juntas) e os artigos
+esperados, na ordem. Sai com código 1 se algum caso falhar.
+
+Uso:
+    python benchmarks/check_article_references.py
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / 'src'))
+
+from detect_structure import detect_structure, find_articles, article_number
+
+# (texto do bloco, títulos dos artigos esperados)
+CASES = [
+    # Remissões: o texto continua no artigo corrente
+    ("Art. 105. A matrícula será cancelada nos casos dos itens C, D, E e F do Art. 106, III.",
+     ["Art. 105"]),
+    ("Art. 4º Conforme o disposto no Art. 5º desta Lei, o estágio é obrigatório.",
+     ["Art. 4º"]),
+    ("Art. 7º As normas do Art. 47 da Lei nº 9.394, de 20 de dezembro de 1996, aplicam-se aos cursos.",
+     ["Art. 7º"]),
+    ("Art. 8º O pedido, conforme Art. 3º, é feito pelo estudante ao Art. 2º referido.",
+     ["Art. 8º"]),
+    ("Art. 9º Aplica-se o previsto pelo Art. 12-A e nos Art. 13 e 14.",
+     ["Art. 9º"]),
+    ("Os casos omissos serão resolvidos nos termos do Art. 45, § 2º.",
+     []),
+    # Artigos de verdade
+    ("Art. 1º Esta Resolução regulamenta o estágio. Art. 2º O estágio é ato educativo.",
+     ["Art. 1º", "Art. 2º"]),
+    ("Art. 12-A. O colegiado se reúne mensalmente. Art. 13 - Compete ao coordenador: I - convocar;",
+     ["Art. 12-A", "Art. 13"]),
+    ("ART. 3º Os cursos são organizados em semestres. Art.4º A carga horária é definida no PPC.",
+     ["Art. 3º", "Art.4º"]),
+    ("CAPÍTULO II DO ESTÁGIO Art. 10. Estágio é o ato educativo escolar supervisionado.",
+     ["Art. 10"]),
+]
+
+def check() -> bool:
+    ok = True
+    for text, expected in CASES:
+        document = detect_structure("caso", [{"text": text, "page": 1}])
+        found = [element["titulo"] for element in document["estrutura"] if element["tipo"] == "artigo"]
+        if found != expected:
+            print(f"❌ {text!r}\n   esperado: {expected}\n   obtido:   {found}")
+            ok = False
+            continue
+        # Nenhum número fora dos esperados no índice de artigos
+        numbers = {article_number(element) for element in document["estrutura"] if element["tipo"] == "artigo"}
+        if set(document["indice"]["artigos"]) != numbers or any(not find_articles(document, n) for n in numbers):
+            print(f"❌ {text!r}\n   índice de artigos: {sorted(document['indice']['artigos'])}")
+            ok = False
+    if ok:
+        print(f"✔ {len(CASES)} casos: remissões ignoradas e artigos encontrados")
+    return ok
+
+if __name__ == "__main__":
+    sys.exit(0 if check() else 1)
@@ -0,0 +1,87 @@
+"""
+Orçamento de inicialização do pipeline: mede, em interpretadores novos, quanto tempo leva
+`import main` e verifica que uma execução só de texto (--skip-stages tables deduplicate) não
+carrega as dependências pesadas (Camelot/OpenCV, pandas, numpy, scipy, scikit-learn, pyarrow),
+nem ao importar nem ao processar um PDF.
+
+O tempo é o menor de --repeat execuções (cada uma em um processo novo, sem o cache de bytecode
+aquecido só na primeira). Sai com código 1 se o import passar de --budget segundos ou se algum
+módulo pesado for carregado; serve como verificação em CI para que um import no topo de um
+módulo não volte a pesar na inicialização de cada processo.
+
+Uso:
+    python benchmarks/check_import_time.py [--budget 0.75] [--repeat 5] [--pdf data/input/Estágio.pdf]
+"""
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BUDGET_S = 0.75
+DEFAULT_PDF = ROOT / 'data' / 'input' / 'Estágio.pdf'
+# Módulos que uma execução só de texto não deve carregar
+HEAVY_MODULES = ('camelot', 'cv2', 'pandas', 'numpy', 'scipy', 'sklearn', 'pyarrow', 'torch')
+
+# Executado em um interpretador novo; a última linha da saída é o resultado em JSON
+CHILD_SCRIPT = """
+import sys, json, time, tempfile
+from pathlib import Path
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+import main
+import_s = time.perf_counter() - start
+heavy = {heavy!r}
+result = {{"import_s": import_s, "apos_import": sorted(m for m in heavy if m in sys.modules)}}
+pdf = {pdf!r}
+if pdf:
+    skip = ('tables', 'deduplicate')
+    with tempfile.TemporaryDirectory() as output_dir:
+        extracted = main.run_extraction_stages(pdf, {{}}, {{}}, verbose=False, skip_stages=skip)
+        main.finalize_document(Path(pdf), extracted, Path(output_dir), verbose=False, skip_stages=skip)
+    result["apos_execucao"] = sorted(m for m in heavy if m in sys.modules)
+print(json.dumps(result))
+"""
+
+def run_child(pdf: str | None) -> dict:
+    script = CHILD_SCRIPT.format(root=str(ROOT), heavy=HEAVY_MODULES, pdf=pdf)
+    completed = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Processo de medição falhou:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def check(budget: float, repeat: int, pdf: str | None) -> bool:
+    # Só a primeira execução processa o PDF; as outras medem apenas o import
+    runs = [run_child(pdf)] + [run_child(None) for _ in range(repeat - 1)]
+    import_s = min(run["import_s"] for run in runs)
+    ok = True
+
+    print(f"import main: {import_s * 1000:.0f} ms (menor de {repeat}) | orçamento: {budget * 1000:.0f} ms")
+    if import_s > budget:
+        print(f"❌ Inicialização acima do orçamento ({import_s:.3f}s > {budget:.3f}s)")
+        ok = False
+    if runs[0]["apos_import"]:
+        print(f"❌ Módulos pesados carregados por `import main`: {', '.join(runs[0]['apos_import'])}")
+        ok = False
+    if pdf:
+        loaded = runs[0]["apos_execucao"]
+        if loaded:
+            print(f"❌ Módulos pesados carregados na execução só de texto de {Path(pdf).name}: {', '.join(loaded)}")
+            ok = False
+        else:
+            print(f"Execução só de texto de {Path(pdf).name}: nenhum módulo pesado carregado")
+    if ok:
+        print("✔ Inicialização dentro do orçamento")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica o tempo de import e os módulos carregados numa execução só de texto.")
+    parser.add_argument('--budget', type=float, default=DEFAULT_BUDGET_S,
+                        help=f"Tempo máximo de `import main`, em segundos (padrão: {DEFAULT_BUDGET_S}).")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--pdf', default=str(DEFAULT_PDF),
+                        help="PDF processado só com texto para verificar os imports da execução ('' para pular).")
+    args = parser.parse_args()
+    pdf = args.pdf if args.pdf and Path(args.pdf).is_file() else None
+    sys.exit(0 if check(args.budget, max(1, args.repeat), pdf) else 1)
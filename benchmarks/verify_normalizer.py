@@ -0,0 +1,105 @@
+"""
+Confere que o Normalizer (src/normalize_text.py) produz exatamente o mesmo texto que a
+implementação original de normalize_text (uma re.sub por chave) e mede o ganho de tempo.
+
+Por padrão usa os textos das saídas em data/output; com --pdf, extrai o texto dos PDFs de
+data/input com extract_raw (mais lento, mesmo texto que o pipeline normaliza).
+
+Uso:
+    python benchmarks/verify_normalizer.py [--pdf] [--repeat 3]
+"""
+import re
+import sys
+import json
+import time
+import string
+import argparse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / 'src'))
+
+from unidecode import unidecode
+from normalize_text import Normalizer
+from output_writer import read_output
+
+def reference_normalize_text(raw_text: str, acronyms: dict = None, standardization_map: dict = None) -> str:
+    """Implementação original, mantida aqui apenas como referência."""
+    acronyms = acronyms or {}
+    standardization_map = standardization_map or {}
+    normalized_text = re.sub(r'-\n\s*', '', raw_text)
+    normalized_text = normalized_text.replace('\n', ' ')
+    combined_map = {**standardization_map, **acronyms}
+    for key in sorted(combined_map.keys(), key=len, reverse=True):
+        pattern = r'\b' + re.escape(key) + r'\b'
+        normalized_text = re.sub(pattern, combined_map[key], normalized_text, flags=re.IGNORECASE)
+    normalized_text = unidecode(normalized_text.lower())
+    normalized_text = normalized_text.translate(str.maketrans('', '', string.punctuation))
+    return re.sub(r'\s+', ' ', normalized_text).strip()
+
+def _collect_texts(node, texts):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "texto" and isinstance(value, str):
+                texts.append(value)
+            else:
+                _collect_texts(value, texts)
+    elif isinstance(node, list):
+        for item in node:
+            _collect_texts(item, texts)
+
+def corpus_from_outputs(output_dir: Path) -> dict[str, str]:
+    corpus = {}
+    for path in sorted(output_dir.glob('*_output.jsonl*')):
+        texts = []
+        _collect_texts(read_output(path), texts)
+        corpus[path.name] = " ".join(texts)
+    return corpus
+
+def corpus_from_pdfs(input_dir: Path) -> dict[str, str]:
+    from extract_raw import extract_raw
+    return {
+        path.name: " ".join(block["text"] for block in extract_raw(str(path)))
+        for path in sorted(input_dir.glob('*.pdf'))
+    }
+
+def run(use_pdfs: bool, repeat: int) -> bool:
+    with open(ROOT / 'data/input/dicionarios.json', 'r', encoding='utf-8') as f:
+        dictionaries = json.load(f)
+    acronyms = dictionaries.get("acronyms", {})
+    standardization_map = dictionaries.get("standardization_map", {})
+
+    corpus = corpus_from_pdfs(ROOT / 'data/input') if use_pdfs else corpus_from_outputs(ROOT / 'data/output')
+    normalizer = Normalizer(acronyms, standardization_map)
+    print(f"Grupos de chaves: {len(normalizer.phases)} para {len(acronyms) + len(standardization_map)} termos")
+
+    all_equal = True
+    total_reference = total_new = 0.0
+    for name, text in corpus.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            expected = reference_normalize_text(text, acronyms, standardization_map)
+        reference_time = (time.perf_counter() - start) / repeat
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = normalizer.normalize(text)
+        new_time = (time.perf_counter() - start) / repeat
+
+        equal = result == expected
+        all_equal &= equal
+        total_reference += reference_time
+        total_new += new_time
+        print(f"{'OK ' if equal else 'DIF'} {name:<50} {len(text):>9} chars "
+              f"{reference_time:>7.3f}s -> {new_time:>7.3f}s")
+
+    if total_new > 0:
+        print(f"Total: {total_reference:.3f}s -> {total_new:.3f}s ({total_reference / total_new:.1f}x)")
+    return all_equal
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica o Normalizer contra a implementação original.")
+    parser.add_argument('--pdf', action='store_true', help="Extrai o texto dos PDFs em vez de usar data/output.")
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+    sys.exit(0 if run(args.pdf, args.repeat) else 1)
@@ -1,27 +1,474 @@
 import os
 import sys
 import json
+import glob
+import time
+import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 sys.path.append(str(Path(__file__).parent / 'src'))
 
-from extract_raw import extract_raw
-from normalize_text import normalize_text
-from detect_structure import detect_structure
-from extract_tables import extract_tables
-from deduplicate import deduplicate
-from enrich_metadata import enrich_metadata
+from normalize_text import get_normalizer, normalize_blocks
+from detect_structure import detect_structure, build_index
+from extract_tables import merge_tables, DEFAULT_PAGE_TIMEOUT, FAILURE_POLICIES
+from enrich_metadata import enrich_metadata, extract_pdf_metadata
+from document import PDFDocument
+from stage_cache import StageCache, hash_json
+from incremental import extract_incremental, load_manifest, save_manifest, manifest_path_for
+from output_writer import JSONLWriter, output_path_for, read_output, zstandard
+from export_columnar import export_document, pyarrow_available, DEFAULT_EXPORT_DIR, EXPORT_FORMATS
+import instrumentation
 
-def main():
+# --- Configuração de Diretórios ---
+INPUT_DIR = Path('data/input')
+OUTPUT_DIR = Path('data/output')
+# Caminho padrão do arquivo de dicionários, dentro do diretório de entrada.
+DICTIONARIES_PATH = INPUT_DIR / 'dicionarios.json'
+# Parâmetros de extract_raw; fazem parte da chave do cache de etapas.
+EXTRACT_RAW_PARAMS = {"header_height_ratio": 0.15, "footer_height_ratio": 0.12}
+# Etapas que podem ser puladas (--skip-stages); extração de texto, estrutura e metadados sempre rodam.
+# Os módulos pesados delas (Camelot/OpenCV; SQLite, numpy e scikit-learn da deduplicação) só são
+# importados quando a etapa roda.
+OPTIONAL_STAGES = ('tables', 'deduplicate')
+
+
+def load_dictionaries(dictionaries_path: Path, verbose: bool = True) -> tuple[dict, dict]:
+    """
+    Carrega os dicionários de normalização (Equipe 2).
+    Retorna (acronyms, standardization_map); dicionários vazios se o arquivo não existir.
+    """
+    try:
+        with open(dictionaries_path, 'r', encoding='utf-8') as f:
+            dictionaries = json.load(f)
+        if verbose:
+            print("-> Dicionários de normalização carregados com sucesso.")
+        return dictionaries.get("acronyms", {}), dictionaries.get("standardization_map", {})
+    except FileNotFoundError:
+        if verbose:
+            print(f"-> AVISO: Arquivo '{dictionaries_path}' não encontrado. A normalização será limitada.")
+        return {}, {}
+
+
+def run_extraction_stages(input_pdf_path: str, acronyms: dict, standardization_map: dict, verbose: bool = True,
+                          page_workers: int = 1, cache: StageCache = None, manifest_path: Path = None,
+                          previous_manifest_path: Path = None,
+                          table_timeout: float | None = DEFAULT_PAGE_TIMEOUT, table_failure: str = 'stream',
+                          skip_stages: tuple = ()) -> dict:
+    """
+    Executa as etapas independentes por documento (1 a 4): extração, normalização,
+    detecção de estrutura e extração de tabelas.
+    Não toca no cache de deduplicação, por isso pode rodar em processos separados.
+    O PDF é lido e interpretado uma única vez (PDFDocument) e compartilhado entre as etapas;
+    os metadados do PDF também são lidos aqui para o processo principal não reabrir o arquivo.
+    page_workers > 1 divide a extração de texto do documento em faixas de páginas paralelas.
+    Com um StageCache, as saídas de cada etapa são reaproveitadas quando o conteúdo do PDF,
+    os parâmetros e a versão do código não mudaram; nesse caso o PDF nem chega a ser interpretado.
+    Texto e tabelas são extraídos página a página de forma incremental: com o manifesto de páginas
+    de uma revisão anterior (previous_manifest_path, por padrão o próprio manifest_path), só as
+    páginas cujo conteúdo mudou são reextraídas. O novo manifesto é salvo em manifest_path.
+    As tabelas são extraídas em tarefas paralelas (page_workers processos) com table_timeout
+    segundos por página; table_failure define a política para as páginas que falham. Tabelas de
+    uma extração com falhas não entram no cache de etapas, para serem tentadas de novo.
+    As durações, contagens de páginas e acertos de cache registrados no processo (ver
+    instrumentation) voltam em "metrics", para serem somados no processo principal.
+    Com 'tables' em skip_stages, só o texto é extraído (o Camelot nem é importado) e o manifesto de
+    páginas não é lido nem gravado, para não substituir o de uma execução completa.
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    # As etapas engolem erros de leitura; no modo em lote um arquivo ausente deve contar como falha.
+    if not Path(input_pdf_path).is_file():
+        raise FileNotFoundError(f"Arquivo não encontrado: {input_pdf_path}")
+
+    cache = cache or StageCache(enabled=False)
+    hits_before, misses_before = cache.hits, cache.misses
+    start = time.perf_counter()
+
+    with instrumentation.collecting() as metrics, instrumentation.context(doc=Path(input_pdf_path).stem), \
+            PDFDocument(input_pdf_path) as document:
+        doc_hash = document.content_hash
+        dictionaries_params = {"dicionarios": hash_json([acronyms, standardization_map])}
+
+        log("\n1. Extraindo blocos de texto com metadados (página, bbox) e tabelas...")
+        with_tables = 'tables' not in skip_stages
+        text_blocks = cache.get("extract_raw", doc_hash, EXTRACT_RAW_PARAMS)
+        tables_data = cache.get("extract_tables", doc_hash, {}) if with_tables else []
+        table_report = None
+        if text_blocks is None or tables_data is None:
+            if not with_tables:
+                manifest_path = previous_manifest_path = None
+            previous_manifest_path = previous_manifest_path or manifest_path
+            previous_manifest = load_manifest(previous_manifest_path) if previous_manifest_path else None
+            result = extract_incremental(document, previous_manifest, workers=page_workers, extract_tables=with_tables,
+                                         table_timeout=table_timeout, table_failure=table_failure, **EXTRACT_RAW_PARAMS)
+            text_blocks = result["blocks"]
+            tables_data = merge_tables(result["raw_tables"])
+            log(f"   Páginas reextraídas: {result['pages_extracted']} | reaproveitadas: {result['pages_reused']}")
+            table_report = result["table_report"]
+            if table_report:
+                log(f"   Tabelas: {table_report['pages_scanned']} páginas analisadas pelo Camelot | "
+                    f"{table_report['pages_skipped']} puladas pelo pré-filtro | "
+                    f"~{table_report['estimated_saved_s']:.1f}s economizados")
+                for failure in table_report["failures"]:
+                    log(f"   Aviso: tabelas da página {failure['page']} ({failure['flavor']}): {failure['error']}")
+            if manifest_path:
+                save_manifest(result["manifest"], manifest_path)
+            cache.set("extract_raw", doc_hash, EXTRACT_RAW_PARAMS, text_blocks)
+            if with_tables and not (table_report and table_report["failed_pages"]):
+                cache.set("extract_tables", doc_hash, {}, tables_data)
+
+        log("2. Normalizando texto bloco a bloco...")
+        log("3. Detectando estrutura...")
+        # A normalização é um gerador consumido pela detecção de estrutura: só um bloco normalizado
+        # fica em memória por vez, e cada parágrafo recebe o seu "texto_normalizado"
+        normalizer = get_normalizer(acronyms, standardization_map)
+        with instrumentation.span("detect_structure"):
+            structured_content = cache.get_or_compute(
+                "detect_structure", doc_hash, {**EXTRACT_RAW_PARAMS, **dictionaries_params},
+                lambda: detect_structure(document, normalize_blocks(text_blocks, normalizer))
+            )
+        preview = next((p.get("texto_normalizado", "") for item in structured_content["estrutura"]
+                        for p in item.get("paragrafos", [item]) if p.get("texto_normalizado")), "")
+        log(f"   Prévia: '{preview[:100]}...'")
+
+        log(f"4. Tabelas extraídas: {len(tables_data)}" if with_tables else "4. Extração de tabelas pulada.")
+
+        with instrumentation.span("metadata"):
+            pdf_metadata = cache.get_or_compute("metadata", doc_hash, {}, lambda: extract_pdf_metadata(document))
+        instrumentation.increment("documents", stage="extraction")
+        instrumentation.record_span("extraction", time.perf_counter() - start)
+
+        return {
+            "structured_content": structured_content,
+            "tables_data": tables_data,
+            "pdf_metadata": pdf_metadata,
+            "n_pages": pdf_metadata.get("pagina_final") or 0,
+            "content_hash": doc_hash,
+            "table_report": table_report,
+            "cache_hits": cache.hits - hits_before,
+            "cache_misses": cache.misses - misses_before,
+            "metrics": metrics.snapshot(),
+        }
+
+
+def finalize_document(input_pdf_path: Path, extracted: dict, output_dir: Path, verbose: bool = True,
+                      semantic_method: str = 'minhash', output_format: str = 'json',
+                      compression: str = None, export_format: str = None,
+                      export_dir: Path = DEFAULT_EXPORT_DIR, skip_stages: tuple = (),
+                      deduplicator=None, chunker=None, base_name: str = None,
+                      doc_name: str = None) -> tuple[dict, Path]:
+    """
+    Executa as etapas que dependem de estado compartilhado (5 e 6: deduplicação cruzada
+    e metadados) e salva o resultado. Deve rodar no processo principal, um documento por vez.
+    output_format 'json' grava o documento inteiro como um objeto JSON indentado; 'jsonl' grava
+    um registro por linha à medida que as etapas terminam (ver output_writer.JSONLWriter),
+    opcionalmente comprimido ('gzip' ou 'zstd').
+    Com export_format ('arrow' ou 'parquet'), os parágrafos também são exportados em colunas
+    para análise (ver export_columnar.export_document).
+    Com 'deduplicate' em skip_stages, a estrutura é salva sem passar pela deduplicação cruzada
+    (e o cache de deduplicação não é aberto nem alterado). deduplicator reaproveita um
+    CrossDocumentDeduplication já aberto (ver run_deduplication).
+    Com chunker (chunking.ChunkEmbedder), a estrutura final também é dividida em chunks para
+    recuperação, gravados na saída ("chunks"), e os vetores vão para <base>_embeddings.npy.
+    base_name nomeia a saída, os vetores e a partição exportada (padrão: o nome do PDF sem extensão);
+    doc_name é a identidade do documento no cache de deduplicação (padrão: o nome_doc da estrutura).
+    """
+    log = print if verbose else (lambda *args, **kwargs: None)
+    base_name = base_name or input_pdf_path.stem
+    custom_metadata = {
+        "nome_doc": input_pdf_path.stem.replace('_', ' ').replace('-', ' '),
+        "versao": "2023.1",
+        "data_publicacao": "2023-01-01"
+    }
+
+    with instrumentation.context(doc=base_name), instrumentation.span("finalize"):
+        if output_format == 'jsonl':
+            final_document, output_path = _finalize_jsonl(input_pdf_path, extracted, output_dir, custom_metadata, log,
+                                                          semantic_method, compression, skip_stages, deduplicator,
+                                                          chunker, base_name, doc_name)
+        else:
+            final_document, output_path = _finalize_json(input_pdf_path, extracted, output_dir, custom_metadata, log,
+                                                         semantic_method, skip_stages, deduplicator, chunker,
+                                                         base_name, doc_name)
+
+        if export_format:
+            with instrumentation.span("export", format=export_format):
+                export_path = export_document(final_document, base_name, export_dir, export_format)
+            log(f"Parágrafos exportados em '{export_path}'.")
+        instrumentation.increment("output_elements", len(final_document["estrutura"]))
+        instrumentation.increment("output_tables", len(extracted["tables_data"]))
+    return final_document, output_path
+
+
+def run_deduplication(structured_content: dict, semantic_method: str, skip_stages: tuple = (),
+                      deduplicator=None, doc_name: str = None) -> dict:
+    """
+    Etapa de deduplicação cruzada; o módulo deduplicate só é importado quando ela roda.
+    deduplicator é um CrossDocumentDeduplication já aberto, reaproveitado entre documentos;
+    doc_name substitui o nome_doc da estrutura como identidade do documento no cache.
+    """
+    if 'deduplicate' in skip_stages:
+        return structured_content
+    from deduplicate import deduplicate
+    with instrumentation.span("deduplicate", method=semantic_method):
+        return deduplicate(structured_content, semantic_method, deduplicator, doc_name)
+
+
+def run_chunking(estrutura: list[dict], chunker, output_dir: Path, base_name: str, log) -> list[dict]:
+    """Etapa de chunks: divide a estrutura final, calcula os vetores (com cache) e grava <base>_embeddings.npy."""
+    from chunking import embeddings_path_for, save_embeddings
+    log("7. Dividindo em chunks e calculando os vetores...")
+    chunks, vectors = chunker.process(estrutura)
+    embeddings_path = embeddings_path_for(output_dir, base_name)
+    save_embeddings(vectors, embeddings_path)
+    log(f"{len(chunks)} chunks; vetores em '{embeddings_path}'.")
+    return chunks
+
+
+def _finalize_json(input_pdf_path: Path, extracted: dict, output_dir: Path, custom_metadata: dict, log,
+                   semantic_method: str, skip_stages: tuple = (), deduplicator=None,
+                   chunker=None, base_name: str = None, doc_name: str = None) -> tuple[dict, Path]:
+    """finalize_document no formato de um único objeto JSON indentado."""
+    base_name = base_name or input_pdf_path.stem
+
+    log("5. Deduplicando conteúdo..." if 'deduplicate' not in skip_stages else "5. Deduplicação pulada.")
+    deduplicated_content = run_deduplication(extracted["structured_content"], semantic_method, skip_stages,
+                                             deduplicator, doc_name)
+    # A deduplicação pode remover elementos: a hierarquia e o índice de posições são refeitos
+    with instrumentation.span("build_index"):
+        deduplicated_content.update(build_index(deduplicated_content["estrutura"]))
+
+    log("6. Enriquecendo com metadados...")
+    with instrumentation.span("enrich_metadata"):
+        final_document = enrich_metadata(deduplicated_content, str(input_pdf_path), custom_metadata,
+                                         pdf_metadata=extracted["pdf_metadata"])
+
+    if extracted["tables_data"]:
+        final_document["tables"] = [table["rows"] for table in extracted["tables_data"]]
+        final_document["tables_pages"] = [table["page"] for table in extracted["tables_data"]]
+    if chunker is not None:
+        final_document["chunks"] = run_chunking(final_document["estrutura"], chunker, output_dir, base_name, log)
+
+    # --- Salvando o Resultado ---
+    output_filename = f"{base_name}_output.jsonl"
+    output_path = output_dir / output_filename
+    log(f"\nProcessamento concluído. Salvando resultados em '{output_path}'...")
+    with instrumentation.span("write_output", format='json'), open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(final_document, f, ensure_ascii=False, indent=4)
+
+    return final_document, output_path
+
+
+def _finalize_jsonl(input_pdf_path: Path, extracted: dict, output_dir: Path, custom_metadata: dict, log,
+                    semantic_method: str, compression: str, skip_stages: tuple = (),
+                    deduplicator=None, chunker=None, base_name: str = None,
+                    doc_name: str = None) -> tuple[dict, Path]:
+    """
+    finalize_document no formato JSONL: o cabeçalho sai antes da deduplicação (os metadados não
+    dependem dela, que só altera "estrutura"), depois um registro por elemento, a hierarquia e o
+    índice de posições (refeitos sobre a estrutura deduplicada), um registro por tabela e, com
+    chunker, um registro por chunk.
+    """
+    structured_content = extracted["structured_content"]
+    base_name = base_name or input_pdf_path.stem
+    output_path = output_path_for(output_dir, base_name, compression)
+    log(f"5. Enriquecendo com metadados e gravando '{output_path}' registro a registro...")
+    with JSONLWriter(output_path, compression) as writer:
+        with instrumentation.span("enrich_metadata"):
+            header = enrich_metadata({k: v for k, v in structured_content.items()
+                                      if k not in ("estrutura", "hierarquia", "indice")},
+                                     str(input_pdf_path), custom_metadata, pdf_metadata=extracted["pdf_metadata"])
+        writer.write_header(header)
+        writer.flush()
+
+        log("6. Deduplicando conteúdo..." if 'deduplicate' not in skip_stages else "6. Deduplicação pulada.")
+        deduplicated_content = run_deduplication(structured_content, semantic_method, skip_stages, deduplicator,
+                                                 doc_name)
+        with instrumentation.span("write_output", format='jsonl'):
+            for item in deduplicated_content["estrutura"]:
+                writer.write_element(item)
+        with instrumentation.span("build_index"):
+            index = build_index(deduplicated_content["estrutura"])
+        with instrumentation.span("write_output", format='jsonl'):
+            writer.write_index(index)
+            writer.flush()
+            for table in extracted["tables_data"]:
+                writer.write_table(table["rows"], table["page"])
+        chunks = None
+        if chunker is not None:
+            writer.flush()
+            chunks = run_chunking(deduplicated_content["estrutura"], chunker, output_dir, base_name, log)
+            with instrumentation.span("write_output", format='jsonl'):
+                for chunk in chunks:
+                    writer.write_chunk(chunk)
+
+    final_document = {**header, "estrutura": deduplicated_content["estrutura"], **index}
+    if extracted["tables_data"]:
+        final_document["tables"] = [table["rows"] for table in extracted["tables_data"]]
+        final_document["tables_pages"] = [table["page"] for table in extracted["tables_data"]]
+    if chunks is not None:
+        final_document["chunks"] = chunks
+    log(f"\nProcessamento concluído. {writer.n_elements} elementos e {writer.n_tables} tabelas em '{output_path}'.")
+    return final_document, output_path
+
+
+def resolve_inputs(inputs: list[str]) -> list[Path]:
+    """
+    Expande as entradas do modo em lote: diretórios (todos os *.pdf), padrões glob
+    ou caminhos de arquivo. Remove repetições mantendo a ordem.
+    """
+    pdf_paths = []
+    for entry in inputs:
+        path = Path(entry)
+        if path.is_dir():
+            pdf_paths.extend(sorted(path.glob('*.pdf')))
+        elif glob.has_magic(entry):
+            pdf_paths.extend(Path(p) for p in sorted(glob.glob(entry)) if p.lower().endswith('.pdf'))
+        else:
+            pdf_paths.append(path)
+
+    unique_paths = []
+    seen = set()
+    for path in pdf_paths:
+        key = path.resolve()
+        if key not in seen:
+            seen.add(key)
+            unique_paths.append(path)
+    return unique_paths
+
+
+def run_batch(pdf_paths: list[Path], output_dir: Path = OUTPUT_DIR, dictionaries_path: Path = DICTIONARIES_PATH,
+              workers: int = None, page_workers: int = 1, cache: StageCache = None,
+              previous_manifest_path: Path = None, semantic_method: str = 'minhash',
+              table_timeout: float | None = DEFAULT_PAGE_TIMEOUT, table_failure: str = 'stream',
+              output_format: str = 'json', compression: str = None, export_format: str = None,
+              export_dir: Path = DEFAULT_EXPORT_DIR, metrics_log: Path = None, metrics_prom: Path = None,
+              skip_stages: tuple = (), chunker=None) -> dict:
+    """
+    Processa vários PDFs sem interação.
+
+    As etapas 1 a 4 rodam em um pool de processos (um documento por tarefa). A deduplicação
+    e o salvamento acontecem no processo principal, na ordem das entradas, pois o cache de
+    deduplicação é compartilhado entre documentos. Falhas são isoladas por documento.
+    page_workers > 1 também paraleliza as páginas dentro de cada documento.
+    Os acertos/falhas do cache de etapas de todos os processos entram no resumo.
+    Cada documento reaproveita as páginas inalteradas do seu manifesto anterior em output_dir
+    (ou de previous_manifest_path, se informado).
+    As métricas dos processos (durações por etapa e por página, contadores) são somadas no
+    processo principal e, se informados, gravadas em metrics_log (JSON Lines) e metrics_prom
+    (formato de texto do Prometheus) ao final do lote.
+    Com chunker, cada documento também ganha os chunks e os vetores (ver run_chunking).
+
+    Returns:
+        dict: Resumo da execução (documentos, páginas, falhas, tempo e vazão).
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    acronyms, standardization_map = load_dictionaries(dictionaries_path)
+    workers = workers or os.cpu_count() or 1
+
+    print(f"\nProcessando {len(pdf_paths)} documento(s) com {workers} processo(s)...")
+    start = time.perf_counter()
+    processed = []
+    failed = []
+    total_pages = 0
+    cache_hits = 0
+    cache_misses = 0
+    table_totals = {"paginas_analisadas": 0, "paginas_puladas": 0, "tempo_economizado_s": 0.0,
+                    "paginas_com_falha": 0}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            (pdf_path, executor.submit(run_extraction_stages, str(pdf_path), acronyms, standardization_map, False,
+                                      page_workers, cache, manifest_path_for(output_dir, pdf_path.stem),
+                                      previous_manifest_path, table_timeout, table_failure, skip_stages))
+            for pdf_path in pdf_paths
+        ]
+        for pdf_path, future in futures:
+            try:
+                extracted = future.result()
+                instrumentation.merge(extracted["metrics"])
+                _, output_path = finalize_document(pdf_path, extracted, output_dir, verbose=False,
+                                                   semantic_method=semantic_method, output_format=output_format,
+                                                   compression=compression, export_format=export_format,
+                                                   export_dir=export_dir, skip_stages=skip_stages, chunker=chunker)
+            except Exception as e:
+                print(f"❌ {pdf_path.name}: {e}")
+                failed.append({"arquivo": str(pdf_path), "erro": str(e)})
+                instrumentation.increment("document_failures", doc=pdf_path.stem)
+                continue
+            total_pages += extracted["n_pages"]
+            cache_hits += extracted["cache_hits"]
+            cache_misses += extracted["cache_misses"]
+            if extracted["table_report"]:
+                table_totals["paginas_analisadas"] += extracted["table_report"]["pages_scanned"]
+                table_totals["paginas_puladas"] += extracted["table_report"]["pages_skipped"]
+                table_totals["tempo_economizado_s"] += extracted["table_report"]["estimated_saved_s"]
+                table_totals["paginas_com_falha"] += len(extracted["table_report"]["failed_pages"])
+                for failure in extracted["table_report"]["failures"]:
+                    print(f"   {pdf_path.name}: tabelas da página {failure['page']} ({failure['flavor']}): {failure['error']}")
+            processed.append(str(output_path))
+            print(f"✔ {pdf_path.name} ({extracted['n_pages']} páginas) -> {output_path}")
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "documentos": len(processed),
+        "falhas": failed,
+        "paginas": total_pages,
+        "tempo_s": round(elapsed, 2),
+        "docs_por_s": round(len(processed) / elapsed, 3) if elapsed > 0 else 0.0,
+        "paginas_por_s": round(total_pages / elapsed, 3) if elapsed > 0 else 0.0,
+        "cache": {"acertos": cache_hits, "falhas": cache_misses},
+        "tabelas": {**table_totals, "tempo_economizado_s": round(table_totals["tempo_economizado_s"], 2)},
+    }
+    if cache is not None:
+        summary["cache"]["removidas"] = cache.evict()
+
+    print("\n--- Resumo do lote ---")
+    print(f"Documentos processados: {summary['documentos']} | Falhas: {len(failed)}")
+    print(f"Páginas: {summary['paginas']} | Tempo: {summary['tempo_s']}s")
+    print(f"Vazão: {summary['docs_por_s']} docs/s | {summary['paginas_por_s']} páginas/s")
+    print(f"Cache de etapas: {cache_hits} acertos | {cache_misses} falhas")
+    print(f"Tabelas: {table_totals['paginas_analisadas']} páginas analisadas | "
+          f"{table_totals['paginas_puladas']} puladas | ~{summary['tabelas']['tempo_economizado_s']}s economizados | "
+          f"{table_totals['paginas_com_falha']} com falha")
+    print_slowest(instrumentation.registry())
+    write_metrics(metrics_log, metrics_prom, resumo=summary)
+    return summary
+
+
+def write_metrics(metrics_log: Path = None, metrics_prom: Path = None, **fields):
+    """Grava as métricas do processo no log JSON (acrescentando) e no arquivo do Prometheus, se informados."""
+    if metrics_log:
+        instrumentation.write_json_log(metrics_log, **fields)
+        print(f"Métricas (JSON) gravadas em '{metrics_log}'.")
+    if metrics_prom:
+        instrumentation.write_prometheus(metrics_prom)
+        print(f"Métricas (Prometheus) gravadas em '{metrics_prom}'.")
+
+
+def print_slowest(metrics: instrumentation.MetricsRegistry, n: int = 5):
+    """Mostra as etapas que mais somaram tempo por documento e as páginas mais lentas."""
+    stages = sorted(((total, name, dict(key).get("doc")) for (name, key), (_, total, _) in metrics.spans.items()
+                     if name not in ("page", "extraction", "finalize")), reverse=True)[:n]
+    if stages:
+        print("Etapas mais lentas: " + " | ".join(f"{name} ({doc}) {total:.2f}s" for total, name, doc in stages))
+    pages = sorted((event for event in metrics.events if event["name"] == "page"),
+                   key=lambda event: event["seconds"], reverse=True)[:n]
+    if pages:
+        print("Páginas mais lentas: " + " | ".join(
+            f"{event.get('doc')} p.{event['page']} ({event['stage']}) {event['seconds']:.2f}s" for event in pages))
+
+
+def main(output_dir: Path = OUTPUT_DIR, dictionaries_path: Path = DICTIONARIES_PATH, page_workers: int = 1,
+         cache: StageCache = None, previous_manifest_path: Path = None,
+         semantic_method: str = 'minhash', table_timeout: float | None = DEFAULT_PAGE_TIMEOUT,
+         table_failure: str = 'stream', output_format: str = 'json', compression: str = None,
+         export_format: str = None, export_dir: Path = DEFAULT_EXPORT_DIR, metrics_log: Path = None,
+         metrics_prom: Path = None, skip_stages: tuple = (), chunker=None):
     print("\n--- Pipeline de Processamento de Documentos --- ")
 
-    # --- Configuração de Diretórios ---
-    # Ajuste para o caminho correto, já que o script está em project/src/
-    input_dir = Path('data/input')
-    output_dir = Path('data/output')
-    
-    # Define o caminho para o arquivo de dicionários usando a variável 'input_dir' já criada.
-    dictionaries_path = input_dir / 'dicionarios.json'
+    input_dir = INPUT_DIR
+    output_dir = Path(output_dir)
 
     # Cria diretórios se eles não existirem
     input_dir.mkdir(parents=True, exist_ok=True)
@@ -53,62 +500,214 @@ def main():
             print("Entrada inválida. Por favor, digite um número.")
 
     print(f"\nProcessando: {input_pdf_path.name}\n")
-    
-    # CORREÇÃO: A variável 'base_name' é definida aqui, logo após a escolha do arquivo.
-    base_name = input_pdf_path.stem
 
     # --- Carregamento dos Dicionários (Equipe 2) ---
-    try:
-        with open(dictionaries_path, 'r', encoding='utf-8') as f:
-            dictionaries = json.load(f)
-        acronyms = dictionaries.get("acronyms", {})
-        standardization_map = dictionaries.get("standardization_map", {})
-        print("-> Dicionários de normalização carregados com sucesso.")
-    except FileNotFoundError:
-        print(f"-> AVISO: Arquivo '{dictionaries_path}' não encontrado. A normalização será limitada.")
-        acronyms = {}
-        standardization_map = {}
+    acronyms, standardization_map = load_dictionaries(dictionaries_path)
 
     # --- Execução do Pipeline ---
-    print("\n1. Extraindo blocos de texto com metadados (página, bbox)...")
-    text_blocks = extract_raw(str(input_pdf_path))
-
-    # Concatena o texto para a normalização (o normalized_text não é mais usado na detecção de estrutura)
-    raw_text = " ".join(block["text"] for block in text_blocks)
+    extracted = run_extraction_stages(str(input_pdf_path), acronyms, standardization_map,
+                                      page_workers=page_workers, cache=cache,
+                                      manifest_path=manifest_path_for(output_dir, input_pdf_path.stem),
+                                      previous_manifest_path=previous_manifest_path,
+                                      table_timeout=table_timeout, table_failure=table_failure,
+                                      skip_stages=skip_stages)
+    instrumentation.merge(extracted["metrics"])
+    finalize_document(input_pdf_path, extracted, output_dir, semantic_method=semantic_method,
+                      output_format=output_format, compression=compression, export_format=export_format,
+                      export_dir=export_dir, skip_stages=skip_stages, chunker=chunker)
+    if cache is not None:
+        cache.evict()
+        print(f"Cache de etapas: {extracted['cache_hits']} acertos | {extracted['cache_misses']} falhas")
+    print_slowest(instrumentation.registry())
+    write_metrics(metrics_log, metrics_prom)
 
-    print("2. Normalizando texto...")
-    normalized_text = normalize_text(raw_text, acronyms=acronyms, standardization_map=standardization_map)
-    print(f"   Prévia: '{normalized_text[:100]}...'")
+    print("\nPipeline finalizado com sucesso!")
 
-    print("3. Detectando estrutura...")
-    # A função detect_structure agora recebe os blocos de texto com metadados
-    structured_content = detect_structure(str(input_pdf_path), text_blocks)
 
-    print("4. Extraindo tabelas...")
-    tables_data = extract_tables(str(input_pdf_path))
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Pipeline de pré-processamento de PDFs.")
+    parser.add_argument('--batch', nargs='+', metavar='ENTRADA',
+                        help="Modo em lote: diretórios, padrões glob ou arquivos PDF (sem interação).")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Número de processos no modo em lote (padrão: número de CPUs).")
+    parser.add_argument('--page-workers', type=int, default=1,
+                        help="Processos para extrair as páginas de cada documento em paralelo (padrão: 1).")
+    parser.add_argument('--output-dir', type=Path, default=OUTPUT_DIR,
+                        help="Diretório de saída (padrão: data/output).")
+    parser.add_argument('--dicionarios', type=Path, default=DICTIONARIES_PATH,
+                        help="Arquivo JSON de dicionários de normalização.")
+    parser.add_argument('--previous-manifest', type=Path, default=None,
+                        help="Manifesto de páginas (<base>_pages.json) da revisão anterior, quando o nome do PDF mudou.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Desativa o cache de etapas (reprocessa tudo).")
+    parser.add_argument('--cache-max-mb', type=int, default=512,
+                        help="Tamanho máximo do cache de etapas em MB (padrão: 512).")
+    parser.add_argument('--invalidate-cache', nargs='*', metavar='PDF',
+                        help="Remove do cache as entradas dos PDFs informados (ou todas, sem argumentos) e sai.")
+    parser.add_argument('--semantic-method', choices=['minhash', 'tfidf'], default='minhash',
+                        help="Busca de similaridades na deduplicação: índice MinHash/LSH (padrão) ou TF-IDF completo.")
+    parser.add_argument('--table-timeout', type=float, default=DEFAULT_PAGE_TIMEOUT,
+                        help=f"Segundos por página na extração de tabelas (padrão: {DEFAULT_PAGE_TIMEOUT:g}; 0 = sem limite).")
+    parser.add_argument('--table-failure', choices=FAILURE_POLICIES, default='stream',
+                        help="Páginas de tabela que falham ou passam do tempo: pular, tentar de novo ou usar o stream (padrão).")
+    parser.add_argument('--output-format', choices=['json', 'jsonl'], default='json',
+                        help="Saída como um objeto JSON indentado (padrão) ou JSONL, um registro por linha gravado em fluxo.")
+    parser.add_argument('--compression', choices=['gzip', 'zstd'], default=None,
+                        help="Comprime a saída JSONL (.jsonl.gz ou .jsonl.zst; zstd requer o pacote zstandard).")
+    parser.add_argument('--export', choices=EXPORT_FORMATS, default=None, dest='export_format',
+                        help="Exporta também os parágrafos em colunas (Arrow IPC, lido com mmap, ou Parquet), por documento.")
+    parser.add_argument('--export-dir', type=Path, default=DEFAULT_EXPORT_DIR,
+                        help=f"Diretório da exportação colunar (padrão: {DEFAULT_EXPORT_DIR}).")
+    parser.add_argument('--export-outputs', nargs='*', metavar='SAIDA',
+                        help="Exporta em colunas saídas já gravadas (padrão: todas em --output-dir) e sai.")
+    parser.add_argument('--skip-stages', nargs='+', choices=OPTIONAL_STAGES, default=[],
+                        help="Etapas a pular, p. ex. --skip-stages tables deduplicate para extrair só o texto.")
+    parser.add_argument('--metrics-log', type=Path, default=None,
+                        help="Acrescenta ao arquivo (JSON Lines) um evento por etapa/página e o resumo das métricas.")
+    parser.add_argument('--metrics-prom', type=Path, default=None,
+                        help="Grava as métricas no formato de texto do Prometheus (p. ex. para o textfile collector).")
+    parser.add_argument('--profile', nargs='+', metavar='ETAPA', default=None,
+                        help="Etapas (spans) executadas sob o profiler, p. ex. extract_raw detect_structure deduplicate.")
+    parser.add_argument('--profiler', choices=instrumentation.PROFILERS, default='cprofile',
+                        help="Profiler de --profile: cprofile (.prof, padrão) ou pyinstrument (.html).")
+    parser.add_argument('--profile-dir', type=Path, default=Path('data/profiles'),
+                        help="Diretório dos perfis gerados por --profile (padrão: data/profiles).")
+    parser.add_argument('--retire-document', nargs='+', metavar='NOME',
+                        help="Remove documentos (pelo nome_doc, p. ex. normas revogadas) do cache de deduplicação e sai.")
+    parser.add_argument('--chunks', action='store_true',
+                        help="Divide a saída em chunks para recuperação (RAG) e calcula os vetores, com cache "
+                             "pelo hash do texto (ver src/chunking.py).")
+    parser.add_argument('--encoder', default='hashing', metavar='CODIFICADOR',
+                        help="Codificador dos chunks: hashing[:dim] (local, determinístico) ou "
+                             "sentence-transformers[:modelo] (padrão: hashing).")
+    parser.add_argument('--chunk-max-chars', type=int, default=1000,
+                        help="Tamanho máximo de um chunk, em caracteres (padrão: 1000).")
+    parser.add_argument('--serve', action='store_true',
+                        help="Modo serviço: mantém o pipeline carregado e recebe PDFs por HTTP (ver service.py).")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="Endereço do serviço (padrão: 127.0.0.1).")
+    parser.add_argument('--port', type=int, default=8765,
+                        help="Porta do serviço (padrão: 8765).")
+    parser.add_argument('--socket', type=Path, default=None,
+                        help="Atende em um socket Unix neste caminho em vez de TCP.")
+    parser.add_argument('--queue-size', type=int, default=16,
+                        help="Máximo de PDFs aguardando na fila do serviço; acima disso responde 503 (padrão: 16).")
+    parser.add_argument('--max-upload-mb', type=int, default=200,
+                        help="Tamanho máximo de um PDF enviado ao serviço, em MB (padrão: 200).")
+    parser.add_argument('--watch', nargs='?', type=Path, const=INPUT_DIR, default=None, metavar='PASTA',
+                        help="Modo ingestão contínua: processa os PDFs novos ou alterados na pasta "
+                             "(padrão: data/input) por uma fila persistente (ver watcher.py).")
+    parser.add_argument('--queue-path', type=Path, default=Path('data/cache/ingest_queue.sqlite'),
+                        help="Banco da fila de ingestão (padrão: data/cache/ingest_queue.sqlite).")
+    parser.add_argument('--max-attempts', type=int, default=3,
+                        help="Tentativas por documento na ingestão contínua antes de desistir (padrão: 3).")
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help="Segundos sem mudanças para um PDF ser considerado completo (padrão: 2).")
+    parser.add_argument('--poll-interval', type=float, default=2.0,
+                        help="Intervalo entre as verificações da pasta, em segundos (padrão: 2).")
+    parser.add_argument('--queue-status', action='store_true',
+                        help="Mostra o estado da fila de ingestão (profundidade, latência, falhas) e sai.")
+    return parser.parse_args(argv)
 
-    print("5. Deduplicando conteúdo...")
-    deduplicated_content = deduplicate(structured_content) 
 
-    print("6. Enriquecendo com metadados...")
-    custom_metadata = {
-        "nome_doc": base_name.replace('_', ' ').replace('-', ' '),
-        "versao": "2023.1",
-        "data_publicacao": "2023-01-01" 
-    }
-    final_document = enrich_metadata(deduplicated_content, str(input_pdf_path), custom_metadata)
+def export_outputs(output_paths: list[str], output_dir: Path, export_dir: Path, export_format: str) -> int:
+    """Exporta em colunas saídas já gravadas (JSON ou JSONL), sem reprocessar os PDFs."""
+    paths = [Path(p) for p in output_paths] or sorted(output_dir.glob('*_output.jsonl*'))
+    for path in paths:
+        try:
+            export_path = export_document(read_output(path), path.name.split('_output.')[0], export_dir, export_format)
+        except Exception as e:
+            print(f"❌ {path.name}: {e}")
+            continue
+        print(f"✔ {path.name} -> {export_path}")
+    return len(paths)
 
-    if tables_data:
-        final_document["tables"] = tables_data
 
-    # --- Salvando o Resultado ---
-    output_filename = f"{base_name}_output.jsonl"
-    output_path = output_dir / output_filename
-    print(f"\nProcessamento concluído. Salvando resultados em '{output_path}'...")
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(final_document, f, ensure_ascii=False, indent=4)
+def invalidate_cache(cache: StageCache, pdf_paths: list[str]) -> int:
+    """Remove do cache de etapas as entradas dos PDFs informados, ou todas se a lista for vazia."""
+    if not pdf_paths:
+        removed = cache.invalidate()
+    else:
+        removed = 0
+        for pdf_path in resolve_inputs(pdf_paths):
+            with PDFDocument(pdf_path) as document:
+                removed += cache.invalidate(content_hash=document.content_hash)
+    print(f"Cache de etapas: {removed} entrada(s) removida(s).")
+    return removed
 
-    print("\nPipeline finalizado com sucesso!")
 
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    cache = StageCache(max_bytes=args.cache_max_mb * 1024 * 1024, enabled=not args.no_cache)
+    if args.invalidate_cache is not None:
+        invalidate_cache(cache, args.invalidate_cache)
+        sys.exit(0)
+    if args.retire_document:
+        from deduplicate import retire_document
+        for doc_name in args.retire_document:
+            retire_document(doc_name)
+        sys.exit(0)
+    if (args.export_format or args.export_outputs is not None) and not pyarrow_available():
+        print("ERRO: A exportação colunar requer o pacote pyarrow (pip install pyarrow).")
+        sys.exit(1)
+    if args.export_outputs is not None:
+        export_outputs(args.export_outputs, args.output_dir, args.export_dir, args.export_format or 'arrow')
+        sys.exit(0)
+    if args.profile:
+        try:
+            instrumentation.configure_profiling(args.profile, args.profile_dir, args.profiler)
+        except RuntimeError as e:
+            print(f"ERRO: {e}.")
+            sys.exit(1)
+    table_timeout = args.table_timeout or None
+    if args.compression and args.output_format != 'jsonl' and not args.serve:
+        print("ERRO: --compression só vale com --output-format jsonl.")
+        sys.exit(1)
+    if args.compression == 'zstd' and zstandard is None:
+        print("ERRO: Compressão zstd requer o pacote zstandard (pip install zstandard).")
+        sys.exit(1)
+    chunker = None
+    if args.chunks:
+        from chunking import ChunkEmbedder, get_encoder
+        try:
+            chunker = ChunkEmbedder(get_encoder(args.encoder), max_chars=args.chunk_max_chars)
+        except ValueError as e:
+            print(f"ERRO: {e}.")
+            sys.exit(1)
+    if args.queue_status:
+        from watcher import queue_status
+        print(json.dumps(queue_status(args.queue_path), ensure_ascii=False, indent=2))
+        sys.exit(0)
+    if args.watch:
+        from watcher import IngestDaemon
+        daemon = IngestDaemon(args.watch, args.output_dir, args.dicionarios, args.workers or os.cpu_count() or 1,
+                              args.page_workers, cache, args.semantic_method, table_timeout, args.table_failure,
+                              args.output_format, args.compression, args.export_format, args.export_dir,
+                              tuple(args.skip_stages), args.queue_path, args.poll_interval, args.settle,
+                              args.max_attempts, metrics_prom=args.metrics_prom, chunker=chunker)
+        daemon.run()
+        sys.exit(0)
+    if args.serve:
+        from service import PipelineService, serve
+        service = PipelineService(args.output_dir, args.dicionarios, args.workers or os.cpu_count() or 1,
+                                  args.page_workers, args.queue_size, cache, args.semantic_method, table_timeout,
+                                  args.table_failure, args.compression, args.export_format, args.export_dir,
+                                  tuple(args.skip_stages), chunker=chunker)
+        serve(service, args.host, args.port, args.socket, args.max_upload_mb)
+        sys.exit(0)
+    if args.batch:
+        pdf_paths = resolve_inputs(args.batch)
+        if not pdf_paths:
+            print("ERRO: Nenhum arquivo PDF encontrado nas entradas informadas.")
+            sys.exit(1)
+        summary = run_batch(pdf_paths, args.output_dir, args.dicionarios, args.workers, args.page_workers, cache,
+                            args.previous_manifest, args.semantic_method, table_timeout, args.table_failure,
+                            args.output_format, args.compression, args.export_format, args.export_dir,
+                            args.metrics_log, args.metrics_prom, tuple(args.skip_stages), chunker)
+        sys.exit(1 if summary["falhas"] else 0)
+    main(output_dir=args.output_dir, dictionaries_path=args.dicionarios, page_workers=args.page_workers,
+         cache=cache, previous_manifest_path=args.previous_manifest,
+         semantic_method=args.semantic_method, table_timeout=table_timeout, table_failure=args.table_failure,
+         output_format=args.output_format, compression=args.compression, export_format=args.export_format,
+         export_dir=args.export_dir, metrics_log=args.metrics_log, metrics_prom=args.metrics_prom,
+         skip_stages=tuple(args.skip_stages), chunker=chunker)
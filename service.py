@@ -0,0 +1,533 @@
+import re
+import sys
+import json
+import time
+import uuid
+import queue
+import shutil
+import signal
+import threading
+import socketserver
+from pathlib import Path
+from collections import Counter, OrderedDict, deque
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(str(Path(__file__).parent / 'src'))
+
+import instrumentation
+from main import run_extraction_stages, finalize_document, load_dictionaries, OUTPUT_DIR, DICTIONARIES_PATH
+from stage_cache import StageCache
+from incremental import manifest_path_for
+from extract_tables import DEFAULT_PAGE_TIMEOUT
+from export_columnar import DEFAULT_EXPORT_DIR
+
+UPLOAD_DIR = Path('data/service/uploads')
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_SIZE = 16
+DEFAULT_MAX_UPLOAD_MB = 200
+# Tempo máximo de espera de uma requisição com ?wait=1
+DEFAULT_WAIT_TIMEOUT = 600.0
+# Jobs encerrados mantidos em memória para consulta de status e resultado
+MAX_FINISHED_JOBS = 1000
+# Janela de jobs recentes usada nas estatísticas de latência
+LATENCY_WINDOW = 500
+CHUNK_SIZE = 1 << 16
+# A cada quantos documentos concluídos o cache de etapas é podado (no lote, só ao final)
+CACHE_EVICT_EVERY = 20
+
+_UNSAFE_NAME_RE = re.compile(r'[^\w.\- ]+')
+
+
+def upload_doc_name(content_hash: str) -> str:
+    """
+    Identidade de um PDF enviado ao serviço no cache de deduplicação: o hash do conteúdo, não o nome
+    do arquivo. Envios nunca compartilham identidade com documentos do lote (que usam o nome do
+    arquivo) nem entre si, salvo quando os bytes são os mesmos: reenviar o mesmo PDF substitui as
+    próprias impressões digitais em vez de encontrá-las como duplicatas de outro documento.
+    """
+    return f"upload-{content_hash[:16]}"
+
+
+class Job:
+    """
+    Um PDF enviado ao serviço: estado, horários e saída.
+    A saída, o manifesto de páginas, os vetores e a partição exportada levam o id do job no nome
+    (base_name), então dois envios com o mesmo nome de arquivo não se sobrescrevem nem substituem a
+    saída de um lote em output_dir; o nome original só aparece como metadado ("arquivo", nome_doc).
+    """
+
+    def __init__(self, pdf_path: Path):
+        self.id = uuid.uuid4().hex[:12]
+        self.pdf_path = pdf_path
+        self.base_name = f"{pdf_path.stem}-{self.id}"
+        self.doc_name = None
+        self.status = 'na_fila'  # na_fila -> processando -> concluido | falhou | cancelado
+        self.received = time.time()
+        self.started = None
+        self.finished = None
+        self.output_path = None
+        self.pages = None
+        self.error = None
+        self.done = threading.Event()
+
+    def finish(self, status: str, output_path: Path = None, pages: int = None, error: str = None):
+        self.status = status
+        self.output_path = output_path
+        self.pages = pages
+        self.error = error
+        self.finished = time.time()
+        self.done.set()
+
+    def to_dict(self) -> dict:
+        return {
+            "job": self.id,
+            "arquivo": self.pdf_path.name,
+            "status": self.status,
+            "recebido": self.received,
+            "inicio": self.started,
+            "fim": self.finished,
+            "espera_s": round((self.started or time.time()) - self.received, 3),
+            "latencia_s": round(self.finished - self.received, 3) if self.finished else None,
+            "paginas": self.pages,
+            "saida": str(self.output_path) if self.output_path else None,
+            "documento_dedup": self.doc_name,
+            "erro": self.error,
+        }
+
+
+class PipelineService:
+    """
+    O pipeline residente: dicionários, módulos pesados (Camelot, scikit-learn) e o cache de
+    deduplicação ficam carregados entre documentos, em vez de a cada execução do main.py.
+
+    Os PDFs recebidos entram em uma fila limitada (queue_size); com a fila cheia, submit recusa o
+    job (o servidor responde 503, para o cliente tentar depois). As etapas 1 a 4 rodam em um pool
+    de workers processos, criados por fork depois do pré-carregamento, então já nascem com os
+    módulos importados. A deduplicação e a gravação da saída (JSONL) rodam em uma única thread,
+    na ordem em que as extrações terminam, com o mesmo CrossDocumentDeduplication aberto.
+    """
+
+    def __init__(self, output_dir: Path = OUTPUT_DIR, dictionaries_path: Path = DICTIONARIES_PATH,
+                 workers: int = 2, page_workers: int = 1, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 cache: StageCache = None, semantic_method: str = 'minhash',
+                 table_timeout: float | None = DEFAULT_PAGE_TIMEOUT, table_failure: str = 'stream',
+                 compression: str = None, export_format: str = None, export_dir: Path = DEFAULT_EXPORT_DIR,
+                 skip_stages: tuple = (), upload_dir: Path = UPLOAD_DIR, chunker=None):
+        self.output_dir = Path(output_dir)
+        self.dictionaries_path = Path(dictionaries_path)
+        self.workers = max(1, workers)
+        self.page_workers = page_workers
+        self.cache = cache
+        self.semantic_method = semantic_method
+        self.table_timeout = table_timeout
+        self.table_failure = table_failure
+        self.compression = compression
+        self.export_format = export_format
+        self.export_dir = export_dir
+        self.skip_stages = tuple(skip_stages)
+        self.upload_dir = Path(upload_dir)
+        self.chunker = chunker
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.slots = threading.Semaphore(self.workers)
+        self.finalize_queue = queue.Queue()
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        # Métricas do serviço: as dos documentos são somadas aqui pela thread de finalização
+        self.metrics = instrumentation.MetricsRegistry()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.totals = Counter()
+        self.started = time.time()
+        self.stopping = threading.Event()
+        self.executor = None
+        self.threads = []
+        self._dictionaries = ({}, {})
+        self._dictionaries_mtime = None
+
+    # --- Ciclo de vida ---
+
+    def start(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.upload_dir.mkdir(parents=True, exist_ok=True)
+        self.dictionaries()
+        self._preload()
+        self.executor = ProcessPoolExecutor(max_workers=self.workers)
+        for target, name in ((self._dispatch_loop, 'despacho'), (self._finalize_loop, 'finalizacao')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _preload(self):
+        """Importa antes de criar o pool os módulos que as etapas carregariam sob demanda."""
+        if 'tables' not in self.skip_stages:
+            import camelot  # noqa: F401
+        if 'deduplicate' not in self.skip_stages:
+            import deduplicate  # noqa: F401
+            import vector_space  # noqa: F401
+
+    def stop(self):
+        """Para de aceitar jobs, cancela os que ainda estão na fila e espera os que estão em andamento."""
+        self.stopping.set()
+        while True:
+            try:
+                job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            job.finish('cancelado', error="serviço encerrado")
+            self._remove_upload(job)
+        self.queue.put(None)
+        self.threads[0].join()
+        self.executor.shutdown(wait=True)
+        self.finalize_queue.put(None)
+        self.threads[1].join()
+
+    def dictionaries(self) -> tuple[dict, dict]:
+        """Dicionários de normalização; só são relidos se o arquivo mudou desde a última leitura."""
+        try:
+            mtime = self.dictionaries_path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._dictionaries_mtime or self._dictionaries_mtime is None:
+            self._dictionaries = load_dictionaries(self.dictionaries_path, verbose=self._dictionaries_mtime is None)
+            self._dictionaries_mtime = mtime
+        return self._dictionaries
+
+    # --- Jobs ---
+
+    def submit(self, pdf_path: Path) -> Job | None:
+        """Enfileira o PDF. Retorna None se a fila está cheia ou o serviço está encerrando."""
+        job = Job(pdf_path)
+        if self.stopping.is_set():
+            return None
+        with self.lock:
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                self.totals["rejeitados"] += 1
+                return None
+            self.jobs[job.id] = job
+            self.totals["recebidos"] += 1
+            self._prune_jobs()
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def _prune_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done.is_set()]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def _dispatch_loop(self):
+        while True:
+            # Um slot livre antes de tirar o job da fila: os que esperam continuam contando nela
+            self.slots.acquire()
+            job = self.queue.get()
+            if job is None:
+                return
+            job.status = 'processando'
+            job.started = time.time()
+            acronyms, standardization_map = self.dictionaries()
+            try:
+                future = self.executor.submit(
+                    run_extraction_stages, str(job.pdf_path), acronyms, standardization_map, False,
+                    self.page_workers, self.cache, manifest_path_for(self.output_dir, job.base_name), None,
+                    self.table_timeout, self.table_failure, self.skip_stages)
+            except RuntimeError as e:
+                self.slots.release()
+                self._fail(job, e)
+                continue
+
+            def done(future, job=job):
+                self.slots.release()
+                self.finalize_queue.put((job, future))
+            future.add_done_callback(done)
+
+    def _finalize_loop(self):
+        deduplicator = None
+        if 'deduplicate' not in self.skip_stages:
+            # Aberto nesta thread (a conexão SQLite não pode mudar de thread) e mantido entre documentos
+            from deduplicate import CrossDocumentDeduplication
+            deduplicator = CrossDocumentDeduplication(self.semantic_method)
+        while True:
+            item = self.finalize_queue.get()
+            if item is None:
+                return
+            job, future = item
+            try:
+                extracted = future.result()
+                if deduplicator is not None:
+                    job.doc_name = upload_doc_name(extracted["content_hash"])
+                # finalize_document registra no registro global, usado só por esta thread
+                with instrumentation.collecting() as doc_metrics:
+                    _, output_path = finalize_document(
+                        job.pdf_path, extracted, self.output_dir, verbose=False, semantic_method=self.semantic_method,
+                        output_format='jsonl', compression=self.compression, export_format=self.export_format,
+                        export_dir=self.export_dir, skip_stages=self.skip_stages, deduplicator=deduplicator,
+                        chunker=self.chunker, base_name=job.base_name, doc_name=job.doc_name)
+            except Exception as e:
+                self._fail(job, e)
+                continue
+            finally:
+                self._remove_upload(job)
+            job.finish('concluido', output_path, extracted["n_pages"])
+            with self.lock:
+                # Os eventos por página não são guardados: o serviço fica no ar indefinidamente
+                self.metrics.merge({**extracted["metrics"], "events": []})
+                self.metrics.merge({**doc_metrics.snapshot(), "events": []})
+                self.latencies.append(job.finished - job.received)
+                self.totals["concluidos"] += 1
+                self.totals["paginas"] += extracted["n_pages"]
+                evict = self.cache is not None and self.totals["concluidos"] % CACHE_EVICT_EVERY == 0
+            if evict:
+                self.cache.evict()
+            print(f"✔ {job.pdf_path.name} ({extracted['n_pages']} páginas, "
+                  f"{job.finished - job.received:.1f}s) -> {output_path}")
+
+    def _fail(self, job: Job, error: Exception):
+        job.finish('falhou', error=f"{type(error).__name__}: {error}")
+        with self.lock:
+            self.totals["falhas"] += 1
+            self.metrics.increment("document_failures", 1, {"doc": job.pdf_path.stem})
+        print(f"❌ {job.pdf_path.name}: {error}")
+
+    def _remove_upload(self, job: Job):
+        if job.pdf_path.parent.parent == self.upload_dir:
+            shutil.rmtree(job.pdf_path.parent, ignore_errors=True)
+
+    # --- Estado ---
+
+    def stats(self) -> dict:
+        with self.lock:
+            statuses = Counter(job.status for job in self.jobs.values())
+            latencies = sorted(self.latencies)
+            totals = dict(self.totals)
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3) if latencies else None
+
+        uptime = time.time() - self.started
+        return {
+            "fila": self.queue.qsize(),
+            "capacidade_fila": self.queue.maxsize,
+            "processando": statuses.get('processando', 0),
+            "workers": self.workers,
+            "jobs": dict(statuses),
+            "totais": totals,
+            "latencia_s": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0),
+                           "media": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                           "amostras": len(latencies)},
+            "paginas_por_s": round(totals.get("paginas", 0) / uptime, 3) if uptime > 0 else 0.0,
+            "no_ar_s": round(uptime, 1),
+            "etapas_puladas": list(self.skip_stages),
+        }
+
+    def healthy(self) -> bool:
+        return not self.stopping.is_set() and all(thread.is_alive() for thread in self.threads)
+
+    def prometheus_text(self) -> str:
+        with self.lock:
+            text = instrumentation.prometheus_text(self.metrics)
+        prefix = instrumentation.METRIC_PREFIX
+        stats = self.stats()
+        return text + "".join(
+            f"# TYPE {prefix}_{name} gauge\n{prefix}_{name} {value}\n"
+            for name, value in (("queue_depth", stats["fila"]), ("jobs_in_progress", stats["processando"]))
+        )
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    API do serviço (JSON, exceto os resultados, que são a própria saída JSONL):
+
+        POST /jobs?name=<arquivo.pdf>[&wait=1]   corpo: o PDF. 202 com o job (ou, com wait=1,
+                                                  200 com a saída JSONL assim que ficar pronta);
+                                                  503 com Retry-After se a fila está cheia
+        GET  /jobs/<id>                           estado do job
+        GET  /jobs/<id>/result[?wait=1]           saída JSONL do job concluído
+        GET  /health                              200 se o serviço aceita jobs, senão 503
+        GET  /stats                               fila, jobs por estado, latência e vazão
+        GET  /metrics                             métricas no formato de texto do Prometheus
+    """
+    server_version = 'PipelineService/1'
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def service(self) -> PipelineService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        # Sem o IP do cliente: em um socket Unix não há endereço
+        sys.stderr.write(f"[{self.log_date_time_string()}] {format % args}\n")
+
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, headers: dict = None):
+        self._send_json(status, {"erro": message}, headers)
+
+    def _send_result(self, job: Job):
+        """Envia a saída JSONL do job em blocos, sem carregá-la em memória."""
+        path = Path(job.output_path)
+        content_type = {'.gz': 'application/gzip', '.zst': 'application/zstd'}.get(path.suffix, 'application/x-ndjson')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(path.stat().st_size))
+        self.send_header('X-Job-Id', job.id)
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+    def _wait_and_send(self, job: Job, wait: bool):
+        if wait:
+            job.done.wait(self.server.wait_timeout)
+        if job.status == 'concluido':
+            self._send_result(job)
+        elif job.status in ('falhou', 'cancelado'):
+            self._send_json(500 if job.status == 'falhou' else 503, job.to_dict())
+        else:
+            self._send_json(202, job.to_dict())
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        if parts == ['health']:
+            healthy = self.service.healthy()
+            self._send_json(200 if healthy else 503, {"status": "ok" if healthy else "indisponivel",
+                                                      "fila": self.service.queue.qsize()})
+        elif parts == ['stats']:
+            self._send_json(200, self.service.stats())
+        elif parts == ['metrics']:
+            body = self.service.prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif len(parts) in (2, 3) and parts[0] == 'jobs' and (len(parts) == 2 or parts[2] == 'result'):
+            job = self.service.get(parts[1])
+            if job is None:
+                self._send_error(404, f"Job não encontrado: {parts[1]}")
+            elif len(parts) == 2:
+                self._send_json(200, job.to_dict())
+            else:
+                self._wait_and_send(job, _flag(params, 'wait'))
+        else:
+            self._send_error(404, f"Caminho não encontrado: {url.path}")
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path.rstrip('/') != '/jobs':
+            self._send_error(404, f"Caminho não encontrado: {url.path}")
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            self._send_error(411, "Envie o PDF no corpo da requisição, com Content-Length")
+            return
+        if length > self.server.max_upload_bytes:
+            self._send_error(413, f"PDF maior que o limite de {self.server.max_upload_bytes // (1024 * 1024)} MB")
+            self.close_connection = True
+            return
+
+        name = (params.get('name') or [_header_text(self.headers.get('X-Filename')) or 'documento.pdf'])[0]
+        name = _UNSAFE_NAME_RE.sub('_', Path(name).name).strip(' ._') or 'documento.pdf'
+        if not name.lower().endswith('.pdf'):
+            name += '.pdf'
+        upload_dir = self.service.upload_dir / uuid.uuid4().hex[:12]
+        upload_dir.mkdir(parents=True)
+        pdf_path = upload_dir / name
+        with open(pdf_path, 'wb') as f:
+            remaining = length
+            while remaining:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+        with open(pdf_path, 'rb') as f:
+            is_pdf = f.read(5) == b'%PDF-'
+        if remaining or not is_pdf:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            self._send_error(400, "Corpo incompleto" if remaining else "O corpo não é um arquivo PDF")
+            return
+
+        job = self.service.submit(pdf_path)
+        if job is None:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            self._send_error(503, "Fila cheia, tente novamente mais tarde" if not self.service.stopping.is_set()
+                             else "Serviço encerrando", {"Retry-After": "5"})
+            return
+        if _flag(params, 'wait'):
+            self._wait_and_send(job, True)
+        else:
+            self._send_json(202, job.to_dict(), {"Location": f"/jobs/{job.id}"})
+
+
+def _header_text(value: str | None) -> str | None:
+    """http.server decodifica os cabeçalhos como latin-1; nomes de arquivo costumam vir em UTF-8."""
+    if value is None:
+        return None
+    try:
+        return value.encode('latin-1').decode('utf-8')
+    except UnicodeError:
+        return value
+
+
+def _flag(params: dict, name: str) -> bool:
+    return (params.get(name) or ['0'])[0].lower() in ('1', 'true', 'sim', 'yes')
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """HTTP sobre um socket Unix (p. ex. curl --unix-socket), uma thread por conexão."""
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler espera um endereço (host, porta)
+        return request, ('unix', 0)
+
+
+def serve(service: PipelineService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, socket_path: Path = None,
+          max_upload_mb: int = DEFAULT_MAX_UPLOAD_MB, wait_timeout: float = DEFAULT_WAIT_TIMEOUT):
+    """Inicia o serviço e atende requisições até SIGINT/SIGTERM; ao sair, espera os jobs em andamento."""
+    if socket_path:
+        socket_path = Path(socket_path)
+        if socket_path.exists():
+            socket_path.unlink()
+        server = UnixHTTPServer(str(socket_path), ServiceRequestHandler)
+        address = f"unix:{socket_path}"
+    else:
+        server = ThreadingHTTPServer((host, port), ServiceRequestHandler)
+        address = f"http://{host}:{server.server_address[1]}"
+    server.service = service
+    server.max_upload_bytes = max_upload_mb * 1024 * 1024
+    server.wait_timeout = wait_timeout
+
+    service.start()
+    # SIGTERM (p. ex. do systemd) encerra como o Ctrl+C
+    signal.signal(signal.SIGTERM, lambda *args: threading.Thread(target=server.shutdown).start())
+    print(f"Serviço no ar em {address} ({service.workers} workers, fila de {service.queue.maxsize})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("Encerrando: aguardando os jobs em andamento...")
+        server.server_close()
+        service.stop()
+        if socket_path and socket_path.exists():
+            socket_path.unlink()
+        print("Serviço encerrado.")
@@ -0,0 +1,372 @@
+import os
+import re
+import sqlite3
+import hashlib
+import tempfile
+import unicodedata
+from pathlib import Path
+from contextlib import contextmanager
+import numpy as np
+from detect_structure import LEVELS
+import instrumentation
+
+DEFAULT_CACHE_DIR = Path('data/cache/embeddings')
+# Tamanho máximo de um chunk, em caracteres (~250 tokens, o limite do all-MiniLM-L6-v2 é 256)
+DEFAULT_MAX_CHARS = 1000
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_HASHING_DIM = 384
+DEFAULT_MODEL = 'sentence-transformers/all-MiniLM-L6-v2'
+ENCODERS = ('hashing', 'sentence-transformers')
+# Linhas reservadas de uma vez no arquivo de vetores (a capacidade dobra quando enche)
+INITIAL_CAPACITY = 1024
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.;:!?])\s+")
+_TOKEN_RE = re.compile(r"\w+")
+_UNSAFE_KEY_RE = re.compile(r"[^\w.-]+")
+# Limite de parâmetros por consulta (o mínimo garantido pelas versões antigas do SQLite é 999)
+_MAX_SQL_PARAMS = 900
+
+# --- Chunks ---
+
+def _split_long(text: str, max_chars: int) -> list[str]:
+    """Divide um parágrafo maior que max_chars em fim de frase e, se preciso, entre palavras."""
+    pieces = []
+    current = ""
+    for sentence in _SENTENCE_END_RE.split(text):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(sentence[:cut].rstrip())
+            sentence = sentence[cut:].lstrip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            pieces.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        pieces.append(current)
+    return pieces
+
+def _division_label(division: dict) -> str:
+    return f"{division['titulo']} - {division['nome']}" if division.get("nome") else division["titulo"]
+
+def chunk_structure(estrutura: list[dict], max_chars: int = DEFAULT_MAX_CHARS) -> list[dict]:
+    """
+    Divide "estrutura" em chunks para recuperação (RAG), respeitando os limites de artigos e parágrafos.
+
+    Os parágrafos de um artigo são agrupados em ordem até max_chars; um artigo nunca divide um chunk
+    com outro, e só um parágrafo maior que max_chars é cortado (em fim de frase). Parágrafos fora de
+    artigos consecutivos são agrupados da mesma forma até a próxima divisão ou artigo. O texto de cada
+    chunk começa pelo contexto (divisões abertas e o rótulo do artigo), para ser autossuficiente.
+
+    Returns:
+        list[dict]: [{"texto", "hash" (SHA-1 do texto), "artigo", "divisoes": [...],
+                      "paginas": [primeira, última], "posicoes": [primeira, última] em "estrutura"}]
+    """
+    chunks = []
+    open_divisions = []
+
+    def emit(pieces: list[tuple[str, int | None, int]], article: str | None):
+        """Empacota (texto, página, posição) em chunks de até max_chars, com o contexto à frente."""
+        labels = [_division_label(division) for division in open_divisions]
+        context = " > ".join(labels + ([article] if article else []))
+        # Nomes de divisões longos não podem reduzir o texto a quase nada: o contexto ocupa no máximo metade
+        budget = max(max_chars // 2, max_chars - len(context) - 1) if context else max_chars
+        group = []
+
+        def flush():
+            if not group:
+                return
+            body = " ".join(text for text, _, _ in group)
+            text = f"{context}\n{body}" if context else body
+            pages = [page for _, page, _ in group if page is not None]
+            chunks.append({
+                "texto": text,
+                "hash": hashlib.sha1(text.encode('utf-8')).hexdigest(),
+                "artigo": article,
+                "divisoes": labels,
+                "paginas": [min(pages), max(pages)] if pages else None,
+                "posicoes": [group[0][2], group[-1][2]],
+            })
+            group.clear()
+
+        size = 0
+        for text, page, position in pieces:
+            for part in _split_long(text, budget) if len(text) > budget else [text]:
+                if group and size + 1 + len(part) > budget:
+                    flush()
+                    size = 0
+                group.append((part, page, position))
+                size += len(part) + (1 if size else 0)
+        flush()
+
+    loose = []
+    for position, element in enumerate(estrutura):
+        tipo = element.get("tipo")
+        if tipo != "paragrafo" and loose:
+            emit(loose, None)
+            loose = []
+        if tipo == "artigo":
+            pieces = []
+            for paragraph in element.get("paragrafos", []):
+                text = (paragraph.get("texto") or "").strip()
+                if text:
+                    numero = paragraph.get("numero")
+                    pieces.append((f"{numero} {text}" if numero else text, _page(paragraph), position))
+            if pieces:
+                emit(pieces, element.get("titulo"))
+        elif tipo in LEVELS:
+            while open_divisions and LEVELS[open_divisions[-1]["tipo"]] >= LEVELS[tipo]:
+                open_divisions.pop()
+            open_divisions.append(element)
+        elif (element.get("texto") or "").strip():
+            loose.append((element["texto"].strip(), _page(element), position))
+    if loose:
+        emit(loose, None)
+    return chunks
+
+def _page(element: dict) -> int | None:
+    try:
+        return int(element.get("pagina"))
+    except (TypeError, ValueError):
+        return None
+
+# --- Codificadores ---
+
+class HashingEncoder:
+    """
+    Codificador local e determinístico: unigramas e bigramas (sem acentos, minúsculos) espalhados em dim
+    posições por um hash estável (BLAKE2b, não o hash() do Python) com sinal, e normalizados (L2).
+    Não captura sinônimos, mas não baixa modelo nem depende de GPU; serve para testes e como base.
+    """
+
+    def __init__(self, dim: int = DEFAULT_HASHING_DIM):
+        self.dim = dim
+        self.key = f"hashing-{dim}"
+
+    def _features(self, text: str):
+        text = unicodedata.normalize('NFKD', text.lower())
+        tokens = _TOKEN_RE.findall(''.join(c for c in text if not unicodedata.combining(c)))
+        yield from tokens
+        yield from (f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for feature in self._features(text):
+                h = int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'little')
+                vectors[i, h % self.dim] += 1.0 if h >> 63 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+class SentenceTransformerEncoder:
+    """Modelo do sentence-transformers (o mesmo do notebook da Equipe 5), carregado no primeiro uso."""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, device: str = 'cpu', batch_size: int = 32):
+        self.model_name = model_name
+        self.device = device
+        self.batch_size = batch_size
+        self.key = "st-" + _UNSAFE_KEY_RE.sub('_', model_name)
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer
+            except ImportError:
+                raise RuntimeError("O codificador sentence-transformers requer o pacote sentence-transformers "
+                                   "(pip install sentence-transformers)") from None
+            self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        vectors = self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                    convert_to_numpy=True, show_progress_bar=False)
+        return np.asarray(vectors, dtype=np.float32)
+
+def get_encoder(spec: str = 'hashing'):
+    """'hashing', 'hashing:<dim>', 'sentence-transformers' ou 'sentence-transformers:<modelo>'."""
+    name, _, option = spec.partition(':')
+    if name == 'hashing':
+        return HashingEncoder(int(option) if option else DEFAULT_HASHING_DIM)
+    if name == 'sentence-transformers':
+        return SentenceTransformerEncoder(option or DEFAULT_MODEL)
+    raise ValueError(f"Codificador inválido: {spec!r} (use {' ou '.join(ENCODERS)})")
+
+# --- Cache de vetores ---
+
+class EmbeddingCache:
+    """
+    Vetores já calculados, pelo hash do texto do chunk: uma matriz float32 em um arquivo mapeado em
+    memória (vectors.f32, uma linha por texto) e um índice SQLite hash -> linha. Um cache por
+    codificador (cache_dir/<encoder.key>), então trocar de modelo não mistura vetores.
+
+    Linhas só são acrescentadas: um documento revisado reaproveita os vetores dos chunks que não
+    mudaram, e os novos ocupam as linhas seguintes. Os vetores são gravados antes de o índice apontar
+    para eles, na mesma transação (BEGIN IMMEDIATE), então vários processos podem usar o mesmo cache.
+    A conexão é aberta no primeiro uso, na thread que vai usá-la.
+    """
+
+    def __init__(self, cache_dir: Path, dim: int, timeout: float = 30.0):
+        self.cache_dir = Path(cache_dir)
+        self.dim = dim
+        self.timeout = timeout
+        self.vectors_path = self.cache_dir / 'vectors.f32'
+        self._conn = None
+        self._reader = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            # isolation_level=None: as transações são abertas explicitamente em _transaction
+            self._conn = sqlite3.connect(self.cache_dir / 'index.sqlite', timeout=self.timeout, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+            self._conn.executescript("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);"
+                                     "CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, row INTEGER NOT NULL);")
+            self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dim', ?)", (str(self.dim),))
+            stored_dim = int(self._conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()[0])
+            if stored_dim != self.dim:
+                raise ValueError(f"Cache de vetores em '{self.cache_dir}' tem dimensão {stored_dim}, não {self.dim}")
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        """Transação de escrita: BEGIN IMMEDIATE reserva o banco e espera outros escritores."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._reader = None
+
+    def lookup(self, hashes: list[str]) -> dict[str, int]:
+        """Linhas dos hashes já presentes no cache."""
+        rows = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), _MAX_SQL_PARAMS):
+            batch = unique[start:start + _MAX_SQL_PARAMS]
+            rows.update(self.conn.execute(
+                f"SELECT hash, row FROM embeddings WHERE hash IN ({','.join('?' * len(batch))})", batch).fetchall())
+        return rows
+
+    def add(self, hashes: list[str], vectors: np.ndarray) -> dict[str, int]:
+        """Acrescenta os vetores de hashes (únicos) que ainda não estão no cache; retorna as linhas de todos."""
+        with self._transaction() as conn:
+            rows = self.lookup(hashes)
+            new = [i for i, h in enumerate(hashes) if h not in rows]
+            if new:
+                first_row = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                matrix = self._writable(first_row + len(new))
+                matrix[first_row:first_row + len(new)] = vectors[new]
+                matrix.flush()
+                del matrix
+                assigned = {hashes[i]: first_row + k for k, i in enumerate(new)}
+                conn.executemany("INSERT INTO embeddings (hash, row) VALUES (?, ?)", assigned.items())
+                rows.update(assigned)
+        return rows
+
+    def _writable(self, n_rows: int) -> np.memmap:
+        """Matriz gravável com pelo menos n_rows linhas (o arquivo cresce dobrando a capacidade)."""
+        row_bytes = self.dim * 4
+        size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        capacity = size // row_bytes
+        if capacity < n_rows:
+            capacity = max(capacity, INITIAL_CAPACITY)
+            while capacity < n_rows:
+                capacity *= 2
+            with open(self.vectors_path, 'ab') as f:
+                f.truncate(capacity * row_bytes)
+            self._reader = None
+        return np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+
+    def vectors(self, rows: list[int]) -> np.ndarray:
+        """Cópia das linhas pedidas (só essas páginas do arquivo são lidas)."""
+        if not rows:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        if self._reader is None or max(rows) >= self._reader.shape[0]:
+            capacity = self.vectors_path.stat().st_size // (self.dim * 4)
+            self._reader = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(capacity, self.dim))
+        return np.asarray(self._reader[rows])
+
+# --- Etapa ---
+
+class ChunkEmbedder:
+    """
+    Etapa de chunks (depois de enrich_metadata): divide a estrutura final em chunks (chunk_structure)
+    e calcula os vetores em lotes de batch_size com o codificador, consultando antes o EmbeddingCache.
+    Reprocessar um documento revisado só codifica os chunks cujo texto mudou.
+    """
+
+    def __init__(self, encoder=None, cache_dir: Path = DEFAULT_CACHE_DIR, max_chars: int = DEFAULT_MAX_CHARS,
+                 batch_size: int = DEFAULT_BATCH_SIZE):
+        self.encoder = encoder or HashingEncoder()
+        self.cache_dir = Path(cache_dir)
+        self.max_chars = max_chars
+        self.batch_size = batch_size
+        self._cache = None
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        # Criado no primeiro uso: a dimensão de um modelo do sentence-transformers exige carregá-lo
+        if self._cache is None:
+            self._cache = EmbeddingCache(self.cache_dir / self.encoder.key, self.encoder.dim)
+        return self._cache
+
+    def embed(self, texts: list[str], hashes: list[str]) -> np.ndarray:
+        """Vetores dos textos (uma linha por texto); só os hashes fora do cache passam pelo codificador."""
+        rows = self.cache.lookup(hashes)
+        missing = {}
+        for text, h in zip(texts, hashes):
+            if h not in rows:
+                missing.setdefault(h, text)
+        instrumentation.increment("embedding_cache_hits", len(hashes) - sum(h not in rows for h in hashes))
+        instrumentation.increment("embedding_cache_misses", len(missing))
+        pending = list(missing.items())
+        for start in range(0, len(pending), self.batch_size):
+            batch = pending[start:start + self.batch_size]
+            with instrumentation.span("encode", encoder=self.encoder.key):
+                vectors = self.encoder.encode([text for _, text in batch])
+            rows.update(self.cache.add([h for h, _ in batch], vectors))
+        return self.cache.vectors([rows[h] for h in hashes])
+
+    def process(self, estrutura: list[dict]) -> tuple[list[dict], np.ndarray]:
+        """Chunks da estrutura e a matriz (n_chunks x dim, float32) dos seus vetores, na mesma ordem."""
+        with instrumentation.span("chunk"):
+            chunks = chunk_structure(estrutura, self.max_chars)
+        with instrumentation.span("embed", encoder=self.encoder.key):
+            vectors = self.embed([chunk["texto"] for chunk in chunks], [chunk["hash"] for chunk in chunks])
+        instrumentation.increment("chunks", len(chunks))
+        return chunks, vectors
+
+def embeddings_path_for(output_dir: Path, base_name: str) -> Path:
+    """Vetores dos chunks salvos ao lado da saída: <base>_embeddings.npy (linha i = chunk i)."""
+    return Path(output_dir) / f"{base_name}_embeddings.npy"
+
+def save_embeddings(vectors: np.ndarray, path: Path):
+    """Grava a matriz em .npy de forma atômica (np.load(path, mmap_mode='r') a abre sem copiar)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        np.save(f, vectors)
+    os.replace(tmp_path, path)
@@ -0,0 +1,384 @@
+import json
+import time
+import sqlite3
+from pathlib import Path
+from contextlib import contextmanager
+import numpy as np
+from near_duplicates import MinHasher
+
+DEFAULT_DB_PATH = Path('data/cache/deduplication.sqlite')
+# Cache JSON das versões anteriores; importado uma única vez para o banco
+LEGACY_JSON_PATH = Path('data/cache/deduplication_cache.json')
+
+# Limites padrão do cache: documentos usados há mais tempo saem primeiro (None = sem limite)
+DEFAULT_MAX_DOCUMENTS = None
+DEFAULT_MAX_PARAGRAPHS = 500_000
+DEFAULT_TTL_DAYS = None
+
+# Versão do texto de que saem as impressões digitais (ver _check_fingerprint_version); bancos com
+# outra versão são esvaziados na abertura
+FINGERPRINT_VERSION = '2'
+
+# Tamanho das prévias guardadas no lugar dos textos completos
+PREVIEW_LENGTH = 100
+
+# Limite de parâmetros por consulta (o mínimo garantido pelas versões antigas do SQLite é 999)
+_MAX_SQL_PARAMS = 900
+
+def _hex_to_fingerprint(content_hash: str) -> int:
+    """Hash MD5 hexadecimal antigo -> impressão digital de 64 bits (8 primeiros bytes, com sinal)."""
+    return int.from_bytes(bytes.fromhex(content_hash[:16]), 'big', signed=True)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    fingerprint INTEGER PRIMARY KEY,
+    document TEXT
+);
+CREATE INDEX IF NOT EXISTS fingerprints_document ON fingerprints (document);
+CREATE TABLE IF NOT EXISTS paragraphs (
+    id INTEGER PRIMARY KEY,
+    document TEXT NOT NULL,
+    artigo TEXT,
+    paragraph_numero TEXT,
+    preview TEXT,
+    fingerprint INTEGER,
+    minhash BLOB
+);
+CREATE INDEX IF NOT EXISTS paragraphs_document ON paragraphs (document);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    key BLOB NOT NULL,
+    paragraph_id INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bands_key ON bands (band, key);
+CREATE INDEX IF NOT EXISTS bands_paragraph ON bands (paragraph_id);
+"""
+
+class DedupStore:
+    """
+    Armazenamento transacional da deduplicação cruzada (SQLite em modo WAL).
+
+    Substitui o deduplication_cache.json, que era lido e regravado por inteiro a cada documento.
+    Cada documento grava apenas as suas impressões digitais, parágrafos e faixas MinHash em uma única
+    transação; as consultas (impressão já vista, candidatos LSH) usam índices do banco e não carregam
+    o corpus para a memória. As impressões digitais são inteiros de 64 bits na chave primária da
+    tabela fingerprints (a árvore B do rowid do SQLite), sem strings hexadecimais.
+    O modo WAL e o busy_timeout permitem que vários processos usem o mesmo arquivo.
+
+    O cache é compacto e limitado: de cada parágrafo ficam só a impressão digital, a assinatura
+    MinHash e uma prévia curta. Impressões e parágrafos pertencem a um documento, que pode ser
+    aposentado (retire_document) e sai do cache por idade (ttl_days, contada a partir do último uso)
+    ou, passando de max_documents/max_paragraphs, do menos usado para o mais usado (evict).
+    """
+
+    def __init__(self, db_path: Path = DEFAULT_DB_PATH, minhasher: MinHasher = None,
+                 legacy_json_path: Path = LEGACY_JSON_PATH, timeout: float = 30.0):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.minhasher = minhasher or MinHasher()
+        # isolation_level=None: as transações são abertas explicitamente em _transaction
+        self.conn = sqlite3.connect(self.db_path, timeout=timeout, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+        self._migrate()
+        self.conn.executescript(_SCHEMA)
+        self._check_minhash_params()
+        self._check_fingerprint_version()
+        if legacy_json_path:
+            self._import_legacy_json(Path(legacy_json_path))
+
+    @contextmanager
+    def _transaction(self):
+        """Transação de escrita: BEGIN IMMEDIATE reserva o banco e espera outros escritores."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    # --- Manutenção ---
+
+    def _columns(self, table: str) -> set[str]:
+        return {row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+
+    def _migrate(self):
+        """
+        Atualiza bancos criados por versões anteriores: a tabela de hashes MD5 em texto é descartada
+        (foram calculados sobre outro texto normalizado, ver _check_fingerprint_version), parágrafos
+        com textos completos viram a forma compacta (prévia) e documentos ganham as datas usadas na
+        remoção por idade.
+        """
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        needs_migration = ('hashes' in tables
+                           or ('paragraphs' in tables and 'full_text' in self._columns('paragraphs'))
+                           or ('documents' in tables and 'last_used' not in self._columns('documents')))
+        if not needs_migration:
+            return
+        with self._transaction() as conn:
+            if 'hashes' in tables:
+                conn.execute("DROP TABLE hashes")
+            if 'paragraphs' in tables and 'full_text' in self._columns('paragraphs'):
+                fingerprint = 'fingerprint' if 'fingerprint' in self._columns('paragraphs') else 'NULL'
+                conn.execute("ALTER TABLE paragraphs RENAME TO paragraphs_old")
+                conn.execute("DROP INDEX IF EXISTS paragraphs_document")
+                conn.execute("CREATE TABLE paragraphs (id INTEGER PRIMARY KEY, document TEXT NOT NULL, artigo TEXT, "
+                             "paragraph_numero TEXT, preview TEXT, fingerprint INTEGER, minhash BLOB)")
+                conn.execute(
+                    f"INSERT INTO paragraphs (id, document, artigo, paragraph_numero, preview, fingerprint, minhash) "
+                    f"SELECT id, document, artigo, paragraph_numero, substr(paragraph_text, 1, {PREVIEW_LENGTH}), "
+                    f"{fingerprint}, minhash FROM paragraphs_old")
+                conn.execute("DROP TABLE paragraphs_old")
+            if 'documents' in tables and 'last_used' not in self._columns('documents'):
+                conn.execute("ALTER TABLE documents RENAME TO documents_old")
+                conn.execute("CREATE TABLE documents (name TEXT PRIMARY KEY, created_at REAL NOT NULL, last_used REAL NOT NULL)")
+                conn.execute("INSERT INTO documents (name, created_at, last_used) "
+                             "SELECT name, updated_at, updated_at FROM documents_old")
+                conn.execute("DROP TABLE documents_old")
+
+    def _minhash_params(self) -> str:
+        return json.dumps(self.minhasher.params(), sort_keys=True)
+
+    def _check_minhash_params(self):
+        """
+        Assinaturas calculadas com outros parâmetros do MinHash não são comparáveis e os textos
+        não são guardados para recalculá-las: nesse caso o índice semântico é descartado.
+        """
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'minhash'").fetchone()
+        params = self._minhash_params()
+        if row and row[0] == params:
+            return
+        with self._transaction() as conn:
+            if row:
+                print("Parâmetros do MinHash mudaram; o índice semântico da deduplicação foi descartado.")
+                conn.execute("DELETE FROM bands")
+                conn.execute("UPDATE paragraphs SET minhash = NULL")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('minhash', ?)", (params,))
+
+    def _check_fingerprint_version(self):
+        """
+        Impressões digitais e assinaturas MinHash de bancos sem a versão atual (FINGERPRINT_VERSION)
+        foram calculadas sobre o "texto_normalizado" da detecção de estrutura, e não sobre o texto de
+        preprocess_text_for_deduplication: não coincidem com as novas. O banco é esvaziado e o cache
+        JSON antigo, cujos hashes voltam a coincidir, é importado de novo.
+        """
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row and row[0] == FINGERPRINT_VERSION:
+            return
+        with self._transaction() as conn:
+            stale = any(conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone()
+                        for table in ('documents', 'fingerprints', 'paragraphs'))
+            if stale:
+                print("Impressões digitais da deduplicação calculadas sobre outro texto normalizado; "
+                      f"o cache {self.db_path} foi esvaziado.")
+                for table in ('documents', 'fingerprints', 'paragraphs', 'bands'):
+                    conn.execute(f"DELETE FROM {table}")
+                conn.execute("DELETE FROM meta WHERE key = 'legacy_json'")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('fingerprint', ?)", (FINGERPRINT_VERSION,))
+
+    def _import_legacy_json(self, json_path: Path):
+        """Importa o cache JSON antigo na primeira abertura do banco (só uma vez, mesmo após clear)."""
+        if self.conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_json'").fetchone():
+            return
+        try:
+            with open(json_path, 'r', encoding='utf-8') as f:
+                cache_data = json.load(f)
+        except FileNotFoundError:
+            cache_data = None
+        except Exception as e:
+            print(f"Erro ao importar cache JSON de deduplicação: {e}")
+            return
+        with self._transaction() as conn:
+            # Outro processo pode ter importado enquanto o JSON era lido
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_json'").fetchone():
+                return
+            conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_json', ?)", (str(json_path),))
+            if cache_data is None:
+                return
+            conn.executemany("INSERT OR IGNORE INTO fingerprints (fingerprint, document) VALUES (?, NULL)",
+                             ((_hex_to_fingerprint(h),) for h in cache_data.get('global_hashes', [])))
+            for doc_name, texts in cache_data.get('processed_docs', {}).items():
+                self._replace_paragraphs(conn, doc_name, texts)
+        if cache_data is not None:
+            print(f"Cache JSON de deduplicação importado para {self.db_path}")
+
+    def clear(self):
+        with self._transaction() as conn:
+            for table in ('documents', 'fingerprints', 'paragraphs', 'bands'):
+                conn.execute(f"DELETE FROM {table}")
+
+    def close(self):
+        self.conn.close()
+
+    # --- Escrita ---
+
+    def _insert_minhash(self, conn, paragraph_id: int, normalized_text: str):
+        signature = self.minhasher.signature(normalized_text)
+        conn.execute("UPDATE paragraphs SET minhash = ? WHERE id = ?", (signature.tobytes(), paragraph_id))
+        conn.executemany("INSERT INTO bands (band, key, paragraph_id) VALUES (?, ?, ?)",
+                         ((band, key, paragraph_id) for band, key in enumerate(self.minhasher.band_keys(signature))))
+
+    def _delete_document(self, conn, doc_name: str):
+        conn.execute("DELETE FROM bands WHERE paragraph_id IN (SELECT id FROM paragraphs WHERE document = ?)", (doc_name,))
+        conn.execute("DELETE FROM paragraphs WHERE document = ?", (doc_name,))
+        conn.execute("DELETE FROM fingerprints WHERE document = ?", (doc_name,))
+        conn.execute("DELETE FROM documents WHERE name = ?", (doc_name,))
+
+    def _replace_paragraphs(self, conn, doc_name: str, paragraphs: list[dict]):
+        conn.execute("DELETE FROM bands WHERE paragraph_id IN (SELECT id FROM paragraphs WHERE document = ?)", (doc_name,))
+        conn.execute("DELETE FROM paragraphs WHERE document = ?", (doc_name,))
+        for paragraph in paragraphs:
+            # Números de parágrafo/artigo podem não ser strings; o banco guarda texto
+            artigo, numero = (None if v is None else str(v)
+                              for v in (paragraph.get('artigo'), paragraph.get('paragraph_numero')))
+            preview = (paragraph.get('paragraph_text') or '')[:PREVIEW_LENGTH]
+            cursor = conn.execute(
+                "INSERT INTO paragraphs (document, artigo, paragraph_numero, preview, fingerprint) VALUES (?, ?, ?, ?, ?)",
+                (doc_name, artigo, numero, preview, paragraph.get('fingerprint')))
+            self._insert_minhash(conn, cursor.lastrowid, paragraph.get('normalized_text') or "")
+        now = time.time()
+        conn.execute("INSERT INTO documents (name, created_at, last_used) VALUES (?, ?, ?) "
+                     "ON CONFLICT (name) DO UPDATE SET last_used = excluded.last_used", (doc_name, now, now))
+
+    def save_document(self, doc_name: str, paragraphs: list[dict], fingerprints=()):
+        """
+        Grava, em uma única transação, as impressões digitais e os parágrafos do documento,
+        substituindo os de uma execução anterior do mesmo documento (uma nova revisão com o
+        mesmo nome não é comparada com a antiga).
+        """
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM fingerprints WHERE document = ?", (doc_name,))
+            conn.executemany("INSERT OR IGNORE INTO fingerprints (fingerprint, document) VALUES (?, ?)",
+                             ((fp, doc_name) for fp in fingerprints))
+            self._replace_paragraphs(conn, doc_name, paragraphs)
+
+    def retire_document(self, doc_name: str) -> bool:
+        """Remove do cache as impressões e os parágrafos do documento. Retorna se ele existia."""
+        with self._transaction() as conn:
+            existed = conn.execute("SELECT 1 FROM documents WHERE name = ?", (doc_name,)).fetchone() is not None
+            self._delete_document(conn, doc_name)
+        return existed
+
+    def touch_documents(self, doc_names):
+        """Marca os documentos como usados agora (entraram em uma comparação com resultado)."""
+        doc_names = sorted(set(doc_names) - {None})
+        if not doc_names:
+            return
+        now = time.time()
+        with self._transaction() as conn:
+            conn.executemany("UPDATE documents SET last_used = ? WHERE name = ?", ((now, name) for name in doc_names))
+
+    def evict(self, max_documents: int = DEFAULT_MAX_DOCUMENTS, max_paragraphs: int = DEFAULT_MAX_PARAGRAPHS,
+              ttl_days: float = DEFAULT_TTL_DAYS, keep: str = None) -> list[str]:
+        """
+        Remove os documentos sem uso há mais de ttl_days e, se o cache ainda passar de
+        max_documents ou max_paragraphs, os usados há mais tempo. O documento keep (o que acabou
+        de ser gravado) nunca é removido. Retorna os nomes removidos.
+        """
+        rows = self.conn.execute(
+            "SELECT d.name, d.last_used, (SELECT COUNT(*) FROM paragraphs p WHERE p.document = d.name) "
+            "FROM documents d ORDER BY d.last_used").fetchall()
+        n_documents = len(rows)
+        n_paragraphs = sum(count for _, _, count in rows)
+        cutoff = time.time() - ttl_days * 86400 if ttl_days is not None else None
+
+        evicted = []
+        for name, last_used, count in rows:
+            expired = cutoff is not None and last_used < cutoff
+            too_many_documents = max_documents is not None and n_documents > max_documents
+            too_many_paragraphs = max_paragraphs is not None and n_paragraphs > max_paragraphs
+            if not (expired or too_many_documents or too_many_paragraphs):
+                # Ordenado por último uso: os seguintes também estão dentro dos limites
+                break
+            if name == keep:
+                continue
+            evicted.append(name)
+            n_documents -= 1
+            n_paragraphs -= count
+
+        if evicted:
+            with self._transaction() as conn:
+                for name in evicted:
+                    self._delete_document(conn, name)
+        return evicted
+
+    # --- Consulta ---
+
+    def known_fingerprints(self, fingerprints, exclude_document: str = None) -> dict[int, str]:
+        """
+        Quais das impressões digitais informadas já estão no banco, vindas de outros documentos
+        (consulta em lotes). Retorna {impressão: documento de origem}.
+        """
+        fingerprints = sorted(set(fingerprints))
+        known = {}
+        for start in range(0, len(fingerprints), _MAX_SQL_PARAMS):
+            chunk = fingerprints[start:start + _MAX_SQL_PARAMS]
+            known.update(self.conn.execute(
+                f"SELECT fingerprint, document FROM fingerprints WHERE fingerprint IN ({', '.join('?' * len(chunk))}) "
+                f"AND document IS NOT ?", [*chunk, exclude_document]))
+        return known
+
+    def fingerprint_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+    def document_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def paragraph_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM paragraphs").fetchone()[0]
+
+    def document_names(self) -> list[str]:
+        return [row[0] for row in self.conn.execute("SELECT name FROM documents ORDER BY name")]
+
+    def stats(self) -> dict:
+        """Tamanho e idade do cache, para o relatório de deduplicação."""
+        oldest, newest = self.conn.execute("SELECT MIN(last_used), MAX(last_used) FROM documents").fetchone()
+        page_count = self.conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = self.conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            'documents': self.document_count(),
+            'paragraphs': self.paragraph_count(),
+            'fingerprints': self.fingerprint_count(),
+            'size_bytes': page_count * page_size,
+            'oldest_last_used': oldest,
+            'newest_last_used': newest,
+        }
+
+    def similar_paragraphs(self, normalized_text: str, threshold: float, exclude_document: str = None) -> list[tuple[dict, float]]:
+        """
+        Parágrafos guardados com similaridade MinHash estimada >= threshold. Só os parágrafos que
+        coincidem em alguma faixa (tabela bands, indexada) são lidos e comparados.
+        """
+        signature = self.minhasher.signature(normalized_text)
+        candidate_ids = set()
+        for band, key in enumerate(self.minhasher.band_keys(signature)):
+            candidate_ids.update(row[0] for row in self.conn.execute(
+                "SELECT paragraph_id FROM bands WHERE band = ? AND key = ?", (band, key)))
+        if not candidate_ids:
+            return []
+
+        results = []
+        candidate_ids = sorted(candidate_ids)
+        for start in range(0, len(candidate_ids), _MAX_SQL_PARAMS):
+            chunk = candidate_ids[start:start + _MAX_SQL_PARAMS]
+            rows = self.conn.execute(
+                f"SELECT document, artigo, paragraph_numero, preview, minhash FROM paragraphs "
+                f"WHERE id IN ({', '.join('?' * len(chunk))}) AND document IS NOT ? AND minhash IS NOT NULL",
+                [*chunk, exclude_document])
+            for document, artigo, paragraph_numero, preview, minhash in rows:
+                similarity = float((np.frombuffer(minhash, dtype=np.uint32) == signature).mean())
+                if similarity >= threshold:
+                    results.append(({'document': document, 'artigo': artigo, 'paragraph_numero': paragraph_numero,
+                                     'preview': preview}, similarity))
+        return results
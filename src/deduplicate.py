@@ -1,75 +1,94 @@
 import re
+import shutil
 import hashlib
-import json
 from typing import List, Dict, Any, Optional
 from pathlib import Path
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import unicodedata
+from dedup_store import (DedupStore, DEFAULT_DB_PATH, LEGACY_JSON_PATH, DEFAULT_MAX_DOCUMENTS,
+                         DEFAULT_MAX_PARAGRAPHS, DEFAULT_TTL_DAYS)
+import instrumentation
+
+_NON_WORD_RE = re.compile(r'[^\w\s]')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+def fingerprint(normalized_text: str) -> int:
+    """
+    Impressão digital de 64 bits (inteiro com sinal, cabe em um INTEGER do SQLite) do texto
+    normalizado: os 8 primeiros bytes do MD5, compatíveis com os hashes hexadecimais antigos.
+    """
+    return int.from_bytes(hashlib.md5(normalized_text.encode()).digest()[:8], 'big', signed=True)
+
+def preprocess_text_for_deduplication(text: str) -> str:
+    """Normalização para deduplicação cruzada"""
+    if not text:
+        return ""
+
+    # Converter para minúsculas
+    text = text.lower()
+
+    # Normalizar caracteres (remover acentos)
+    text = unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII')
+
+    # Remover pontuação e caracteres especiais
+    text = _NON_WORD_RE.sub(' ', text)
+
+    # Remover espaços extras
+    text = _WHITESPACE_RE.sub(' ', text).strip()
+
+    return text
+
+def paragraph_normalized_text(item: Dict, paragraph: Dict) -> str:
+    """
+    Texto de que sai a impressão digital de um parágrafo: preprocess_text_for_deduplication do
+    artigo e do parágrafo, o mesmo do cache JSON antigo (e dos hashes importados dele). Não usa o
+    "texto_normalizado" da detecção de estrutura, que expande siglas e apaga a pontuação em vez de
+    trocá-la por espaço: com ele, as impressões já guardadas no cache deixariam de coincidir.
+    """
+    return preprocess_text_for_deduplication(f"{item.get('artigo', '')} {paragraph.get('texto', '')}")
 
 class CrossDocumentDeduplication:
-    def __init__(self):
+    def __init__(self, semantic_method: str = 'minhash', max_documents: Optional[int] = DEFAULT_MAX_DOCUMENTS,
+                 max_paragraphs: Optional[int] = DEFAULT_MAX_PARAGRAPHS, ttl_days: Optional[float] = DEFAULT_TTL_DAYS,
+                 cache_file: Path = DEFAULT_DB_PATH, space_dir: Optional[Path] = None):
         self.exact_similarity_threshold = 1.0    # 100% igual
         self.semantic_similarity_threshold = 0.85 # 85% similar
+        self.semantic_top_k = 10  # Máximo de parágrafos anteriores parecidos relatados por parágrafo
+        # Jaccard estimado (palavras) equivalente ao limiar de cosseno do TF-IDF; ver benchmarks/bench_semantic_dedup.py
+        self.minhash_similarity_threshold = 0.75
         self.min_text_length = 50
+        if semantic_method not in ('minhash', 'tfidf'):
+            raise ValueError(f"semantic_method inválido: {semantic_method!r} (use 'minhash' ou 'tfidf')")
+        self.semantic_method = semantic_method
+        self._vector_space = None
+        self.space_dir = space_dir
+        # Limites do cache: ao passar deles, os documentos usados há mais tempo são removidos
+        self.max_documents = max_documents
+        self.max_paragraphs = max_paragraphs
+        self.ttl_days = ttl_days
+        self.evicted_documents = []
         
-        # Cache global para deduplicação entre execuções
-        self.global_content_hashes = set()
-        self.processed_documents_cache = {}
-        self.cache_file = Path('data/cache/deduplication_cache.json')
-        self._load_cache()
-
-    def _load_cache(self):
-        """Carrega cache de documentos processados anteriormente"""
-        try:
-            if self.cache_file.exists():
-                with open(self.cache_file, 'r', encoding='utf-8') as f:
-                    cache_data = json.load(f)
-                    self.global_content_hashes = set(cache_data.get('global_hashes', []))
-                    self.processed_documents_cache = cache_data.get('processed_docs', {})
-                print(f"Cache carregado: {len(self.global_content_hashes)} hashes globais")
-        except Exception as e:
-            print(f"Erro ao carregar cache: {e}")
-
-    def _save_cache(self):
-        """Salva cache para uso futuro"""
-        try:
-            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
-            cache_data = {
-                'global_hashes': list(self.global_content_hashes),
-                'processed_docs': self.processed_documents_cache
-            }
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(cache_data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print(f"Erro ao salvar cache: {e}")
+        # Cache global para deduplicação entre execuções (SQLite; ver dedup_store.py)
+        # Um cache_file fora do padrão (p. ex. nos benchmarks) fica isolado: não importa o JSON antigo
+        self.cache_file = Path(cache_file)
+        legacy_json_path = LEGACY_JSON_PATH if self.cache_file == DEFAULT_DB_PATH else None
+        self.store = DedupStore(self.cache_file, legacy_json_path=legacy_json_path)
+        print(f"Cache carregado: {self.store.fingerprint_count()} hashes globais")
 
     def preprocess_text_for_deduplication(self, text: str) -> str:
         """Normalização para deduplicação cruzada"""
-        if not text:
-            return ""
-            
-        # Converter para minúsculas
-        text = text.lower()
-        
-        # Normalizar caracteres (remover acentos)
-        text = unicodedata.normalize('NFKD', text).encode('ASCII', 'ignore').decode('ASCII')
-        
-        # Remover pontuação e caracteres especiais
-        text = re.sub(r'[^\w\s]', ' ', text)
-        
-        # Remover espaços extras
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        return text
+        return preprocess_text_for_deduplication(text)
 
-    def extract_text_from_structure(self, content: Dict) -> List[Dict]:
-        """Extrai todo o texto da estrutura para comparação cruzada"""
-        texts = []
-        
+    def _analyze(self, content: Dict) -> List[Dict]:
+        """
+        Normaliza e calcula a impressão digital de cada parágrafo da estrutura uma única vez.
+        Retorna uma entrada por parágrafo (inclusive os curtos, que também são deduplicados),
+        com 'item' e 'paragraph' apontando para os objetos originais e 'long' indicando se o
+        texto tem o tamanho mínimo para entrar nos relatórios, no cache e na busca semântica.
+        """
+        entries = []
         if not content or 'estrutura' not in content:
-            return texts
-            
+            return entries
+
         for item in content['estrutura']:
             # Texto do artigo
             artigo_text = f"{item.get('artigo', '')} "
@@ -77,179 +96,263 @@ class CrossDocumentDeduplication:
             # Texto dos parágrafos
             for paragraph in item.get('paragrafos', []):
                 full_text = artigo_text + paragraph.get('texto', '')
-                if len(full_text.strip()) >= self.min_text_length:
-                    texts.append({
-                        'full_text': full_text.strip(),
-                        'artigo': item.get('artigo'),
-                        'capitulo': item.get('capitulo'),
-                        'secao': item.get('secao'),
-                        'paragraph_numero': paragraph.get('numero'),
-                        'paragraph_text': paragraph.get('texto', ''),
-                        'normalized_text': self.preprocess_text_for_deduplication(full_text)
-                    })
-        
-        return texts
+                normalized_text = paragraph_normalized_text(item, paragraph)
+                entries.append({
+                    'item': item,
+                    'paragraph': paragraph,
+                    'long': len(full_text.strip()) >= self.min_text_length,
+                    'full_text': full_text.strip(),
+                    'artigo': item.get('artigo'),
+                    'capitulo': item.get('capitulo'),
+                    'secao': item.get('secao'),
+                    'paragraph_numero': paragraph.get('numero'),
+                    'paragraph_text': paragraph.get('texto', ''),
+                    'normalized_text': normalized_text,
+                    'fingerprint': fingerprint(normalized_text),
+                })
+        return entries
+
+    def _text_infos(self, entries: List[Dict]) -> List[Dict]:
+        """Parágrafos com o tamanho mínimo, no formato de extract_text_from_structure."""
+        return [{key: value for key, value in entry.items() if key not in ('item', 'paragraph', 'long')}
+                for entry in entries if entry['long']]
+
+    def extract_text_from_structure(self, content: Dict) -> List[Dict]:
+        """Extrai todo o texto da estrutura para comparação cruzada"""
+        return self._text_infos(self._analyze(content))
+
+    def _exact_duplicate_report(self, text_info: Dict, doc_name: str) -> Dict:
+        return {
+            'type': 'exact_cross_document',
+            'current_document': doc_name,
+            'artigo': text_info['artigo'],
+            'paragraph_numero': text_info['paragraph_numero'],
+            'text_preview': text_info['paragraph_text'][:100] + '...',
+            'hash': f"{text_info['fingerprint'] & 0xFFFFFFFFFFFFFFFF:016x}"
+        }
 
     def find_cross_document_exact_duplicates(self, current_doc: Dict, doc_name: str) -> List[Dict]:
-        """Encontra duplicatas exatas comparando com documentos anteriores"""
-        exact_duplicates = []
-        current_texts = self.extract_text_from_structure(current_doc)
-        
+        """Encontra duplicatas exatas comparando com documentos anteriores (não altera o cache)"""
+        text_infos = self.extract_text_from_structure(current_doc)
+        known = self.store.known_fingerprints((info['fingerprint'] for info in text_infos), exclude_document=doc_name)
+        return [self._exact_duplicate_report(info, doc_name) for info in text_infos if info['fingerprint'] in known]
+
+    def find_cross_document_semantic_similarities(self, current_doc: Dict, doc_name: str) -> List[Dict]:
+        """Encontra similaridades semânticas com documentos anteriores"""
+        return self._find_semantic_similarities(self.extract_text_from_structure(current_doc), doc_name)
+
+    def _find_semantic_similarities(self, text_infos: List[Dict], doc_name: str) -> List[Dict]:
+        if self.semantic_method == 'minhash':
+            return self._find_semantic_similarities_minhash(text_infos, doc_name)
+        return self._find_semantic_similarities_tfidf(text_infos, doc_name)
+
+    def _find_semantic_similarities_minhash(self, current_texts: List[Dict], doc_name: str) -> List[Dict]:
+        """
+        Busca no índice MinHash/LSH do banco: só os parágrafos anteriores que dividem alguma faixa
+        da assinatura são lidos e comparados, em vez da matriz de similaridade do corpus inteiro.
+        """
+        semantic_similarities = []
         for text_info in current_texts:
-            content_hash = hashlib.md5(text_info['normalized_text'].encode()).hexdigest()
-            
-            # Verificar contra cache global
-            if content_hash in self.global_content_hashes:
-                exact_duplicates.append({
-                    'type': 'exact_cross_document',
+            matches = self.store.similar_paragraphs(text_info['normalized_text'], self.minhash_similarity_threshold,
+                                                    exclude_document=doc_name)
+            for previous, similarity in matches:
+                semantic_similarities.append({
+                    'type': 'semantic_cross_document',
                     'current_document': doc_name,
-                    'artigo': text_info['artigo'],
-                    'paragraph_numero': text_info['paragraph_numero'],
-                    'text_preview': text_info['paragraph_text'][:100] + '...',
-                    'hash': content_hash
+                    'previous_document': previous['document'],
+                    'current_artigo': text_info['artigo'],
+                    'similarity': similarity,
+                    'current_preview': text_info['paragraph_text'][:100] + '...',
+                    'previous_preview': (previous['preview'] or '') + '...'
                 })
-            else:
-                # Adicionar ao cache global
-                self.global_content_hashes.add(content_hash)
-        
-        return exact_duplicates
+        return semantic_similarities
 
-    def find_cross_document_semantic_similarities(self, current_doc: Dict, doc_name: str) -> List[Dict]:
-        """Encontra similaridades semânticas com documentos anteriores"""
+    @property
+    def vector_space(self) -> 'HashedTfidfSpace':
+        """
+        Espaço TF-IDF persistente, aberto na primeira vez que for usado (só com semantic_method='tfidf').
+        vector_space (scikit-learn e scipy) só é importado aqui, para não pesar na inicialização de
+        quem não deduplica ou usa o MinHash. Só entram no espaço os documentos deduplicados com o
+        TF-IDF: o banco guarda apenas prévias, não os textos para vetorizar os demais.
+        """
+        if self._vector_space is None:
+            from vector_space import HashedTfidfSpace, DEFAULT_SPACE_DIR
+            self._vector_space = HashedTfidfSpace(self.space_dir or DEFAULT_SPACE_DIR)
+            # Com o MinHash o espaço não é atualizado: segmentos de documentos que saíram do cache
+            # nesse meio-tempo (aposentados, removidos por limite ou idade) são descartados agora
+            for stale in self._vector_space.documents() - set(self.store.document_names()):
+                self._vector_space.remove_document(stale)
+        return self._vector_space
+
+    def _add_to_vector_space(self, doc_name: str, texts: List[Dict]):
+        rows = [{'artigo': text['artigo'], 'preview': text['full_text'][:100]} for text in texts]
+        self.vector_space.add_document(doc_name, [text['normalized_text'] for text in texts], rows)
+
+    def _find_semantic_similarities_tfidf(self, current_texts: List[Dict], doc_name: str) -> List[Dict]:
+        """
+        Similaridade de cosseno TF-IDF contra o espaço vetorial persistente: os parágrafos anteriores
+        já estão vetorizados, só os do documento atual são transformados, e a busca percorre o
+        corpus em blocos guardando os semantic_top_k melhores por parágrafo.
+        """
         semantic_similarities = []
-        
-        # Coletar textos de documentos anteriores do cache
-        previous_texts = []
-        previous_info = []
-        
-        for prev_doc_name, prev_texts in self.processed_documents_cache.items():
-            if prev_doc_name != doc_name:  # Não comparar com ele mesmo
-                previous_texts.extend(prev_texts)
-                previous_info.extend([{
-                    'document': prev_doc_name,
-                    'text': text_data['full_text']
-                } for text_data in prev_texts])
-        
-        current_texts = self.extract_text_from_structure(current_doc)
-        current_texts_list = [text['normalized_text'] for text in current_texts]
-        
-        if not previous_texts or not current_texts_list:
+        if not current_texts:
             return semantic_similarities
-        
-        # Combinar todos os textos para TF-IDF
-        all_texts = previous_texts + current_texts_list
-        
+
         try:
-            vectorizer = TfidfVectorizer(min_df=1, max_df=0.9, stop_words=None)
-            tfidf_matrix = vectorizer.fit_transform(all_texts)
-            cosine_sim = cosine_similarity(tfidf_matrix)
-            
-            # Comparar textos atuais com textos anteriores
-            num_previous = len(previous_texts)
-            num_current = len(current_texts_list)
-            
-            for i in range(num_current):
-                current_idx = num_previous + i
-                for j in range(num_previous):
-                    similarity = cosine_sim[current_idx][j]
-                    
-                    if similarity >= self.semantic_similarity_threshold:
-                        semantic_similarities.append({
-                            'type': 'semantic_cross_document',
-                            'current_document': doc_name,
-                            'previous_document': previous_info[j]['document'],
-                            'current_artigo': current_texts[i]['artigo'],
-                            'similarity': similarity,
-                            'current_preview': current_texts[i]['paragraph_text'][:100] + '...',
-                            'previous_preview': previous_info[j]['text'][:100] + '...'
-                        })
-                        
+            matches = self.vector_space.top_k([text['normalized_text'] for text in current_texts],
+                                              k=self.semantic_top_k,
+                                              threshold=self.semantic_similarity_threshold,
+                                              exclude_document=doc_name)  # Não comparar com ele mesmo
+            for text_info, text_matches in zip(current_texts, matches):
+                for similarity, previous_document, row in text_matches:
+                    semantic_similarities.append({
+                        'type': 'semantic_cross_document',
+                        'current_document': doc_name,
+                        'previous_document': previous_document,
+                        'current_artigo': text_info['artigo'],
+                        'similarity': similarity,
+                        'current_preview': text_info['paragraph_text'][:100] + '...',
+                        'previous_preview': row.get('preview', '') + '...'
+                    })
         except Exception as e:
             print(f"Erro na detecção de similaridades semânticas cruzadas: {e}")
         
         return semantic_similarities
 
-    def remove_cross_document_duplicates(self, content: Dict, doc_name: str) -> Dict:
-        """Remove duplicatas cruzadas e atualiza cache"""
+    def deduplicate_document(self, content: Dict, doc_name: str) -> tuple[Dict, List[Dict], List[Dict]]:
+        """
+        Deduplicação em uma única passada: cada parágrafo é normalizado e recebe a sua impressão
+        digital uma vez; as impressões são consultadas no banco em lote. Parágrafos já vistos em
+        outros documentos são removidos (e relatados, se tiverem o tamanho mínimo); os restantes
+        são comparados semanticamente com os documentos anteriores e gravados no cache.
+
+        Returns:
+            (conteúdo sem duplicatas, duplicatas exatas removidas, similaridades semânticas)
+        """
         if not content or 'estrutura' not in content:
-            return content
-            
-        exact_duplicates = self.find_cross_document_exact_duplicates(content, doc_name)
-        
-        if not exact_duplicates:
-            # Ainda assim atualizar o cache
-            self._update_document_cache(content, doc_name)
-            self._save_cache()
-            return content
-            
-        print(f"Removendo {len(exact_duplicates)} duplicatas cruzadas...")
-        
-        # Criar novo conteúdo sem duplicatas
-        new_estrutura = []
-        seen_hashes = set()
-        
-        for item in content['estrutura']:
-            new_item = item.copy()
-            new_item['paragrafos'] = []
-            
-            for paragraph in item.get('paragrafos', []):
-                full_text = f"{item.get('artigo', '')} {paragraph.get('texto', '')}"
-                normalized_text = self.preprocess_text_for_deduplication(full_text)
-                content_hash = hashlib.md5(normalized_text.encode()).hexdigest()
-                
-                # Só manter se não for duplicata global
-                if content_hash not in self.global_content_hashes:
-                    self.global_content_hashes.add(content_hash)
-                    new_item['paragrafos'].append(paragraph)
-                # else: duplicata é silenciosamente removida
-            
-            # Só manter itens com parágrafos
-            if new_item['paragrafos']:
-                new_estrutura.append(new_item)
-        
-        content['estrutura'] = new_estrutura
-        
+            return content, [], []
+
+        entries = self._analyze(content)
+        # Uma revisão anterior com o mesmo nome não conta: ela é substituída ao gravar
+        known = self.store.known_fingerprints((entry['fingerprint'] for entry in entries), exclude_document=doc_name)
+        self.store.touch_documents(known.values())
+        exact_duplicates = []
+        removed = set()
+        for entry in entries:
+            if entry['fingerprint'] in known:
+                removed.add(id(entry['paragraph']))
+                if entry['long']:
+                    exact_duplicates.append(self._exact_duplicate_report(entry, doc_name))
+        # Acertos: parágrafos cuja impressão digital já estava no cache (de outro documento)
+        instrumentation.increment("dedup_paragraphs", len(entries))
+        instrumentation.increment("dedup_cache_hits", len(removed))
+
+        if removed:
+            print(f"Removendo {len(removed)} duplicatas cruzadas...")
+            new_estrutura = []
+            for item in content['estrutura']:
+                paragraphs = item.get('paragrafos')
+                if not paragraphs:
+                    new_estrutura.append(item)
+                    continue
+                kept = [p for p in paragraphs if id(p) not in removed]
+                # Só mantém artigos que ainda têm parágrafos
+                if len(kept) == len(paragraphs):
+                    new_estrutura.append(item)
+                elif kept:
+                    new_estrutura.append({**item, 'paragrafos': kept})
+            content['estrutura'] = new_estrutura
+
+        kept_entries = [entry for entry in entries if id(entry['paragraph']) not in removed]
+        text_infos = self._text_infos(kept_entries)
+        with instrumentation.span("semantic_search", method=self.semantic_method):
+            semantic_similarities = self._find_semantic_similarities(text_infos, doc_name)
+        instrumentation.increment("dedup_semantic_similarities", len(semantic_similarities))
+
         # Atualizar cache
-        self._update_document_cache(content, doc_name)
-        self._save_cache()
-        
-        return content
+        self._update_document_cache(doc_name, text_infos, {entry['fingerprint'] for entry in kept_entries})
+        return content, exact_duplicates, semantic_similarities
 
-    def _update_document_cache(self, content: Dict, doc_name: str):
-        """Atualiza cache com textos do documento atual"""
-        current_texts = self.extract_text_from_structure(content)
-        self.processed_documents_cache[doc_name] = current_texts
+    def remove_cross_document_duplicates(self, content: Dict, doc_name: str) -> Dict:
+        """Remove duplicatas cruzadas e atualiza cache"""
+        clean_content, _, _ = self.deduplicate_document(content, doc_name)
+        return clean_content
+
+    def replace_document(self, old_name: str, content: Dict, doc_name: Optional[str] = None) -> tuple[Dict, List[Dict], List[Dict]]:
+        """
+        Deduplica uma nova versão de um documento no lugar da anterior: old_name é aposentado
+        antes, então os parágrafos mantidos da versão antiga não removem os da nova.
+        """
+        self.retire_document(old_name)
+        return self.deduplicate_document(content, doc_name or old_name)
+
+    def retire_document(self, doc_name: str) -> bool:
+        """Remove o documento do cache (impressões, parágrafos e segmento TF-IDF). Retorna se ele existia."""
+        existed = self.store.retire_document(doc_name)
+        if self.semantic_method == 'tfidf':
+            self.vector_space.remove_document(doc_name)
+        return existed
+
+    def _update_document_cache(self, doc_name: str, text_infos: List[Dict], fingerprints: set):
+        """Atualiza cache com textos do documento atual (impressões novas e parágrafos, em uma transação)"""
+        try:
+            self.store.save_document(doc_name, text_infos, fingerprints)
+            evicted = self.store.evict(self.max_documents, self.max_paragraphs, self.ttl_days, keep=doc_name)
+            if self.semantic_method == 'tfidf':
+                self._add_to_vector_space(doc_name, text_infos)
+                for evicted_name in evicted:
+                    self.vector_space.remove_document(evicted_name)
+            if evicted:
+                print(f"{len(evicted)} documentos removidos do cache de deduplicação (limites de tamanho/idade)")
+            self.evicted_documents.extend(evicted)
+        except Exception as e:
+            print(f"Erro ao salvar cache: {e}")
 
     def get_deduplication_report(self, doc_name: str) -> Dict:
         """Gera relatório de deduplicação para o documento atual"""
         # Esta função pode ser usada para obter estatísticas
+        stats = self.store.stats()
         return {
             'document': doc_name,
-            'global_hashes_count': len(self.global_content_hashes),
-            'processed_documents_count': len(self.processed_documents_cache),
+            'global_hashes_count': stats['fingerprints'],
+            'processed_documents_count': stats['documents'],
+            'paragraphs_count': stats['paragraphs'],
+            'cache_size_bytes': stats['size_bytes'],
+            'oldest_last_used': stats['oldest_last_used'],
+            'newest_last_used': stats['newest_last_used'],
+            'limits': {
+                'max_documents': self.max_documents,
+                'max_paragraphs': self.max_paragraphs,
+                'ttl_days': self.ttl_days,
+            },
+            'evicted_documents': list(self.evicted_documents),
             'cache_file': str(self.cache_file)
         }
 
 # Função principal que se encaixa no seu pipeline
-def deduplicate(structured_content: Dict) -> Dict:
+def deduplicate(structured_content: Dict, semantic_method: str = 'minhash',
+                deduplicator: Optional[CrossDocumentDeduplication] = None,
+                doc_name: Optional[str] = None) -> Dict:
     """
-    Função de deduplicação cruzada que se encaixa no pipeline existente
-    SEM alterar a assinatura da função!
+    Função de deduplicação cruzada que se encaixa no pipeline existente.
+    structured_content é o único argumento obrigatório; os demais são opcionais.
+    semantic_method escolhe a busca de similaridades: 'minhash' (índice MinHash/LSH persistente)
+    ou 'tfidf' (cosseno TF-IDF em um espaço vetorial persistente, ver vector_space.py).
+    Um deduplicator já aberto (p. ex. o do modo serviço, que o mantém entre documentos) é
+    reaproveitado em vez de abrir o cache de novo; ele deve ser usado sempre na mesma thread.
+    doc_name, se informado, é a identidade do documento no cache no lugar do nome_doc do conteúdo.
     """
     print("   Aplicando deduplicação cruzada...")
     
     # Obter nome do documento do conteúdo (se disponível)
-    doc_name = structured_content.get('nome_doc', 'documento_atual')
+    doc_name = doc_name or structured_content.get('nome_doc', 'documento_atual')
     doc_id = structured_content.get('doc_id', 'unknown')
     
-    deduplicator = CrossDocumentDeduplication()
-    
-    # Aplicar deduplicação cruzada
-    clean_content = deduplicator.remove_cross_document_duplicates(structured_content, doc_name)
+    deduplicator = deduplicator or CrossDocumentDeduplication(semantic_method)
     
-    # Encontrar duplicatas e similaridades (apenas para logging)
-    exact_duplicates = deduplicator.find_cross_document_exact_duplicates(structured_content, doc_name)
-    semantic_similarities = deduplicator.find_cross_document_semantic_similarities(structured_content, doc_name)
+    # Aplicar deduplicação cruzada; duplicatas e similaridades saem da mesma passada (apenas para logging)
+    clean_content, exact_duplicates, semantic_similarities = deduplicator.deduplicate_document(
+        structured_content, doc_name)
     
     # Log das estatísticas
     if exact_duplicates:
@@ -265,11 +368,29 @@ def deduplicate(structured_content: Dict) -> Dict:
     return clean_content
 
 
+def retire_document(doc_name: str) -> bool:
+    """Aposenta um documento (p. ex. norma revogada) do cache de deduplicação"""
+    store = DedupStore(DEFAULT_DB_PATH, legacy_json_path=None)
+    try:
+        existed = store.retire_document(doc_name)
+    finally:
+        store.close()
+    from vector_space import HashedTfidfSpace
+    HashedTfidfSpace().remove_document(doc_name)
+    print(f"Documento {doc_name} removido do cache de deduplicação" if existed
+          else f"ℹDocumento {doc_name} não está no cache de deduplicação")
+    return existed
+
+
 def clear_deduplication_cache():
     """Limpa o cache de deduplicação"""
-    cache_file = Path('data/cache/deduplication_cache.json')
-    if cache_file.exists():
-        cache_file.unlink()
+    if DEFAULT_DB_PATH.exists():
+        # Sem importar o JSON antigo: depois de limpo, o banco não deve ser repovoado por ele
+        store = DedupStore(DEFAULT_DB_PATH, legacy_json_path=None)
+        store.clear()
+        store.close()
+        from vector_space import DEFAULT_SPACE_DIR
+        shutil.rmtree(DEFAULT_SPACE_DIR, ignore_errors=True)
         print("Cache de deduplicação limpo")
     else:
         print("ℹNenhum cache encontrado para limpar")
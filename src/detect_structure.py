@@ -2,19 +2,188 @@ import re
 import json
 import pdfplumber
 from pathlib import Path
+from typing import Iterable
+from document import PDFDocument
+from normalize_text import map_to_normalized
 
-def detect_structure(pdf_path: str, text_blocks: list[dict], metadata: dict = None) -> dict:
+# Os blocos de extract_raw juntam as linhas da página, então as marcas de estrutura aparecem no meio do
+# texto: um único padrão compilado as encontra todas em uma passada (finditer) e o texto entre duas
+# marcas pertence à primeira. Marcas que também aparecem em remissões ("art. 5º", "no § 2º",
+# "nos incisos II e III", "na Seção II") só valem com a grafia de dispositivo: "Art." e divisões em
+# maiúsculas em qualquer posição, divisões só com inicial maiúscula quando seguidas de travessão
+# ("Seção II - Do ...") ou após pontuação, e §, incisos e alíneas no início do bloco ou depois de
+# pontuação (". ", "; ", ": ", ") ") ou de "; e ". Numerações incluídas por alteração ("Art. 12-A",
+# "Seção XIII - A") fazem parte da marca. "Art. N" precedido de preposição ("no Art. 5º", "conforme
+# Art. 5º") ou seguido de vírgula ou de minúscula ("do Art. 106, III", "Art. 5º desta Lei") é remissão
+# e não abre artigo (ver _is_article_reference).
+_AFTER_SPACE = r"(?:^|(?<=\s))"
+_AFTER_BREAK = r"(?:^|(?<=[.:;)!?]\s)|(?<=\se\s))"
+_DIVISION_WORDS = r"(?i:t[íi]tulo|cap[íi]tulo|subse[çc][ãa]o|se[çc][ãa]o)"
+_DIVISION_ORDER = r"\s+(?:[IVXLCDM]+|\d+|(?i:[úu]nic[oa]))\b(?:\s*[-–]?\s*[A-Z]\b(?=\s*[-–—]))?"
+_MARKER_RE = re.compile(rf"""
+    (?P<divisao>
+        {_AFTER_SPACE}(?:TÍTULO|CAPÍTULO|SUBSEÇÃO|SEÇÃO){_DIVISION_ORDER}
+      | {_AFTER_SPACE}{_DIVISION_WORDS}{_DIVISION_ORDER}(?=\s*[-–—])
+      | {_AFTER_BREAK}{_DIVISION_WORDS}{_DIVISION_ORDER})
+  | (?P<artigo>{_AFTER_SPACE}(?:Art|ART)\.?\s*\d+(?:\s*[º°])?(?:\s*-\s*[A-Z]\b)?(?:\.(?=\s))?)
+  | (?P<paragrafo>{_AFTER_BREAK}(?:§\s*\d+\s*[º°]?|(?i:parágrafo\s+único)|[IVXLCDM]+\s*[-–—]|[a-z]\)))
+""", re.VERBOSE)
+_REFERENCE_BEFORE_RE = re.compile(r"\b(?:no|nos|do|dos|ao|aos|pelo|pelos|conforme)\s+$", re.IGNORECASE)
+_REFERENCE_AFTER_RE = re.compile(r"\s*,|\s+[a-zà-ÿ]")
+_ARTICLE_NUMBER_RE = re.compile(r"(\d+)(?:\s*[º°])?(?:\s*-\s*([A-Z])\b)?")
+# Separadores entre o rótulo de uma divisão e o seu nome ("Seção II - Do Funcionamento")
+_DIVISION_SEPARATORS = " .:–—-"
+# Nome seguido de número de página: entrada do sumário, não uma divisão do texto
+_TOC_ENTRY_RE = re.compile(r"^\d+\b|\b\d+$")
+# Profundidade de cada divisão na hierarquia; artigos ficam abaixo da divisão mais interna
+LEVELS = {"titulo": 0, "capitulo": 1, "secao": 2, "subsecao": 3, "artigo": 4}
+_LEVEL_NAMES = {"título": "titulo", "titulo": "titulo", "capítulo": "capitulo", "capitulo": "capitulo",
+                "seção": "secao", "secão": "secao", "seçao": "secao", "secao": "secao",
+                "subseção": "subsecao", "subsecão": "subsecao", "subseçao": "subsecao", "subsecao": "subsecao"}
+# Nome de uma divisão: o texto até a próxima marca, se for curto (senão fica como parágrafo)
+MAX_DIVISION_NAME_LENGTH = 200
+
+def _normalized_slice(block: dict, start: int, end: int) -> str | None:
     """
-    Detecta a estrutura de um documento PDF e retorna um JSON padrão.
-    Parágrafos que não são artigos recebem título como null.
+    Recorta do bloco normalizado (normalize_blocks) o trecho que corresponde a block["text"][start:end].
+    Retorna None se o bloco não foi normalizado.
+    """
+    offsets = block.get("offsets")
+    if offsets is None:
+        return None
+    normalized = block["normalized"]
+    return normalized[map_to_normalized(offsets, start):map_to_normalized(offsets, end)].strip()
+
+def _strip_span(text: str, start: int, end: int, chars: str = None) -> tuple[int, int]:
+    """Trecho text[start:end] sem os caracteres das pontas (como .strip(chars)), em posições do texto."""
+    value = text[start:end]
+    start += len(value) - len(value.lstrip(chars))
+    return start, max(start, end - (len(value) - len(value.rstrip(chars))))
+
+def _paragraph(numero, texto, page_num, block, span) -> dict:
+    paragraph = {"numero": numero, "texto": texto, "pagina": page_num}
+    texto_normalizado = _normalized_slice(block, *span)
+    if texto_normalizado is not None:
+        paragraph["texto_normalizado"] = texto_normalizado
+    return paragraph
+
+def _marker_kind(match) -> str:
+    return next(kind for kind in ("divisao", "artigo", "paragrafo") if match.group(kind) is not None)
+
+def _is_article_reference(text: str, match) -> bool:
+    """Marca de artigo que é uma remissão no meio do texto ("do Art. 106, III", "Art. 5º desta Lei")."""
+    return (match.group("artigo") is not None
+            and bool(_REFERENCE_BEFORE_RE.search(text, max(0, match.start() - 12), match.start())
+                     or _REFERENCE_AFTER_RE.match(text, match.end())))
+
+def _is_table_of_contents(text: str, markers: list) -> bool:
+    """Bloco de sumário: só divisões, a maioria com o número da página junto do nome."""
+    divisions = [(i, m) for i, m in enumerate(markers) if _marker_kind(m) == "divisao"]
+    if len(divisions) < 3 or len(divisions) != len(markers):
+        return False
+    toc_entries = 0
+    for i, marker in divisions:
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+        toc_entries += bool(_TOC_ENTRY_RE.search(text[marker.end():end].strip(_DIVISION_SEPARATORS)))
+    return toc_entries * 2 > len(divisions)
+
+def _enclosing(open_divisions: list[dict], level: str) -> str | None:
+    return next((division["titulo"] for division in open_divisions if division["tipo"] == level), None)
+
+def _element_pages(element: dict) -> list[int]:
+    pages = [paragraph.get("pagina") for paragraph in element.get("paragrafos", [element])]
+    return [page for page in pages if page is not None]
+
+def article_number(element: dict) -> str | None:
+    """Número do artigo ("Art. 45º" -> "45", "Art. 12-A" -> "12-A"), ou None se o elemento não é um artigo."""
+    if element.get("tipo") != "artigo":
+        return None
+    match = _ARTICLE_NUMBER_RE.search(element.get("titulo") or "")
+    if not match:
+        return None
+    return f"{match.group(1)}-{match.group(2)}" if match.group(2) else match.group(1)
+
+def build_index(estrutura: list[dict]) -> dict:
+    """
+    Monta, em uma passada por "estrutura", a árvore de divisões e artigos e o índice de posições:
+
+        "hierarquia": [{"tipo", "titulo", "nome", "posicao", "paginas": [primeira, última], "filhos": [...]}]
+        "indice": {"artigos": {"45": [posições]}, "paginas": {"12": [primeira posição, última posição]}}
+
+    "posicao" é o índice do elemento em "estrutura". Um número de artigo pode ter mais de uma posição
+    (redações alteradas repetem o artigo). Deve ser refeito quando "estrutura" muda (p. ex. na deduplicação).
+    """
+    hierarchy = []
+    stack = []
+    articles = {}
+    pages = {}
+    for position, element in enumerate(estrutura):
+        element_pages = _element_pages(element)
+        for page in element_pages:
+            span = pages.setdefault(str(page), [position, position])
+            span[1] = position
+        level = element.get("tipo")
+        if level not in LEVELS:
+            continue
+        node = {"tipo": level, "titulo": element.get("titulo"), "posicao": position,
+                "paginas": [min(element_pages), max(element_pages)] if element_pages else None}
+        if level == "artigo":
+            number = article_number(element)
+            if number is not None:
+                articles.setdefault(number, []).append(position)
+        else:
+            node["nome"] = element.get("nome")
+            node["filhos"] = []
+        while stack and LEVELS[stack[-1]["tipo"]] >= LEVELS[level]:
+            stack.pop()
+        (stack[-1]["filhos"] if stack else hierarchy).append(node)
+        # As páginas de uma divisão vão até a última página dos seus artigos
+        if node["paginas"]:
+            for parent in stack:
+                if parent["paginas"] is None:
+                    parent["paginas"] = list(node["paginas"])
+                else:
+                    parent["paginas"][1] = max(parent["paginas"][1], node["paginas"][1])
+        if level != "artigo":
+            stack.append(node)
+    return {"hierarquia": hierarchy, "indice": {"artigos": articles, "paginas": pages}}
+
+def _document_index(document: dict) -> dict:
+    # Saídas anteriores ao índice ganham um na primeira consulta (uma passada), depois as consultas são O(1)
+    if "indice" not in document:
+        document.update(build_index(document.get("estrutura", [])))
+    return document["indice"]
+
+def find_articles(document: dict, number: int | str) -> list[dict]:
+    """Elementos do artigo pelo número (45 para "Art. 45", "12-A" para "Art. 12-A"), pelo "indice" do documento."""
+    positions = _document_index(document)["artigos"].get(str(number), [])
+    return [document["estrutura"][position] for position in positions]
+
+def elements_on_page(document: dict, page: int) -> list[dict]:
+    """Elementos com conteúdo na página, pelo "indice" do documento."""
+    span = _document_index(document)["paginas"].get(str(page))
+    return document["estrutura"][span[0]:span[1] + 1] if span else []
+
+def detect_structure(pdf_path: str | PDFDocument, text_blocks: Iterable[dict], metadata: dict = None) -> dict:
+    """
+    Detecta a estrutura de um documento PDF e retorna um JSON padrão, em uma única passada pelos blocos.
+    "estrutura" é a sequência de elementos: divisões (Título, Capítulo, Seção, Subseção, com "nome"),
+    artigos (com "capitulo" e "secao" em que estão e os "paragrafos": caput, §, incisos e alíneas)
+    e parágrafos fora de artigos, que recebem título como null. "hierarquia" e "indice" vêm de build_index.
+    text_blocks pode ser um gerador (p. ex. normalize_blocks); blocos normalizados fazem cada
+    parágrafo ganhar "texto_normalizado", recortado pelo mapa de posições do bloco.
     """
     metadata = metadata or {}
     doc_id = metadata.get("doc_id", "")
-    nome_doc = metadata.get("nome_doc", Path(pdf_path).stem if isinstance(pdf_path, (str, Path)) else str(pdf_path))
+    if isinstance(pdf_path, PDFDocument):
+        default_name = pdf_path.name
+    else:
+        default_name = Path(pdf_path).stem if isinstance(pdf_path, (str, Path)) else str(pdf_path)
+    nome_doc = metadata.get("nome_doc", default_name)
     versao = metadata.get("versao", "1.0")
     data_publicacao = metadata.get("data_publicacao", "")
     pagina_inicial = metadata.get("pagina_inicial", 1)
-    pagina_final = metadata.get("pagina_final", len(text_blocks))
+    pagina_final = metadata.get("pagina_final")
 
     structure = {
         "doc_id": doc_id,
@@ -27,53 +196,84 @@ def detect_structure(pdf_path: str, text_blocks: list[dict], metadata: dict = No
     }
 
     current_article = None
+    # Divisões abertas (Título, Capítulo...), da mais externa para a mais interna
+    open_divisions = []
+    # Divisão cujo rótulo terminou o bloco: o início do próximo bloco é o nome
+    unnamed_division = None
+    n_blocks = 0
+
+    def add_text(numero, block, span):
+        """Parágrafo no artigo corrente ou, fora de artigos, como elemento próprio."""
+        paragraph = _paragraph(numero, block["text"][span[0]:span[1]], block["page"], block, span)
+        if current_article:
+            current_article["paragrafos"].append(paragraph)
+        else:
+            structure["estrutura"].append({"tipo": "paragrafo", "titulo": None, **paragraph})
 
     for block in text_blocks:
-        line = block["text"].strip()
+        n_blocks += 1
+        text = block["text"]
         page_num = block["page"]
 
-        if not line:
+        if not text.strip():
             continue
 
-        # Detecta artigos
-        match_artigo = re.match(r"^(art\.?\s*\d+º?)(.*)", line, re.IGNORECASE)
-        if match_artigo:
-            artigo_titulo = match_artigo.group(1).capitalize()
-            artigo_texto = match_artigo.group(2).strip()
-            new_article = {"tipo": "artigo", "titulo": artigo_titulo, "paragrafos": []}
-            if artigo_texto:
-                new_article["paragrafos"].append({"numero": None, "texto": artigo_texto, "pagina": page_num})
-            structure["estrutura"].append(new_article)
-            current_article = new_article
-            continue
+        markers = [marker for marker in _MARKER_RE.finditer(text) if not _is_article_reference(text, marker)]
+        if _is_table_of_contents(text, markers):
+            markers = []
 
-        # Detecta parágrafos numerados ou incisos
-        match_paragrafo = re.match(r"^(§\s*\d+º|parágrafo único|\b[ivxlcdm]+\s*[-–—])\s*(.*)", line, re.IGNORECASE)
-        if match_paragrafo:
-            paragraph_number = match_paragrafo.group(1).strip()
-            paragraph_text = match_paragrafo.group(2).strip()
-            if current_article:
-                current_article["paragrafos"].append({"numero": paragraph_number, "texto": paragraph_text, "pagina": page_num})
+        # Texto antes da primeira marca: continuação do elemento corrente (p. ex. após a quebra de página)
+        span = _strip_span(text, 0, markers[0].start() if markers else len(text))
+        if span[0] < span[1]:
+            if unnamed_division is not None and span[1] - span[0] <= MAX_DIVISION_NAME_LENGTH:
+                unnamed_division["nome"] = text[span[0]:span[1]]
             else:
-                structure["estrutura"].append({
-                    "tipo": "paragrafo",
-                    "titulo": None,
-                    "numero": paragraph_number,
-                    "texto": paragraph_text,
-                    "pagina": page_num
-                })
-            continue
+                add_text(None, block, span)
+        unnamed_division = None
 
-        # Qualquer outro texto que não seja artigo ou parágrafo numerado
-        if current_article:
-            current_article["paragrafos"].append({"numero": None, "texto": line, "pagina": page_num})
-        else:
-            structure["estrutura"].append({
-                "tipo": "paragrafo",
-                "titulo": None,
-                "numero": None,
-                "texto": line,
-                "pagina": page_num
-            })
+        for i, marker in enumerate(markers):
+            kind = _marker_kind(marker)
+            end = markers[i + 1].start() if i + 1 < len(markers) else len(text)
+
+            # Divisões: fecham as de nível igual ou mais interno e encerram o artigo corrente
+            if kind == "divisao":
+                label = " ".join(marker.group("divisao").split())
+                level = _LEVEL_NAMES.get(label.split()[0].lower(), "secao")
+                name_span = _strip_span(text, marker.end(), end, _DIVISION_SEPARATORS)
+                name = text[name_span[0]:name_span[1]]
+                division = {"tipo": level, "titulo": label,
+                            "nome": name if 0 < len(name) <= MAX_DIVISION_NAME_LENGTH else None,
+                            "pagina": page_num}
+                while open_divisions and LEVELS[open_divisions[-1]["tipo"]] >= LEVELS[level]:
+                    open_divisions.pop()
+                open_divisions.append(division)
+                structure["estrutura"].append(division)
+                current_article = None
+                if not name and i + 1 == len(markers):
+                    unnamed_division = division
+                elif len(name) > MAX_DIVISION_NAME_LENGTH:
+                    add_text(None, block, name_span)
+                continue
+
+            span = _strip_span(text, marker.end(), end)
+            # Detecta artigos
+            if kind == "artigo":
+                label = " ".join(marker.group("artigo").split()).rstrip(".")
+                new_article = {"tipo": "artigo", "titulo": "Art" + label[3:],
+                               "capitulo": _enclosing(open_divisions, "capitulo"),
+                               "secao": _enclosing(open_divisions, "secao"), "paragrafos": []}
+                structure["estrutura"].append(new_article)
+                current_article = new_article
+                if span[0] < span[1]:
+                    add_text(None, block, span)
+                continue
+
+            # Parágrafos numerados, incisos e alíneas
+            add_text(marker.group("paragrafo").strip(), block, span)
+
+    # Sem pagina_final nos metadados, mantém o padrão anterior (quantidade de blocos)
+    if pagina_final is None:
+        structure["pagina_final"] = n_blocks
 
+    structure.update(build_index(structure["estrutura"]))
     return structure
@@ -0,0 +1,76 @@
+import io
+import hashlib
+from contextlib import contextmanager
+from pathlib import Path
+import pdfplumber
+
+class PDFDocument:
+    """
+    Handle compartilhado de um PDF durante uma execução do pipeline.
+
+    Lê os bytes do arquivo uma única vez e abre o pdfplumber sob demanda a partir da memória.
+    As páginas do pdfplumber guardam o layout já interpretado, então extract_raw, a detecção
+    de estrutura, a extração de tabelas e os metadados reaproveitam o mesmo parse em vez de
+    reabrir o arquivo em cada etapa.
+    """
+
+    def __init__(self, pdf_path):
+        self.path = str(pdf_path)
+        self.name = Path(pdf_path).stem
+        with open(self.path, 'rb') as f:
+            self.data = f.read()
+        self._pdf = None
+        self._content_hash = None
+
+    @property
+    def content_hash(self) -> str:
+        """SHA-256 dos bytes do arquivo (identidade do conteúdo, independente do nome)."""
+        if self._content_hash is None:
+            self._content_hash = hashlib.sha256(self.data).hexdigest()
+        return self._content_hash
+
+    @property
+    def pdf(self):
+        """Objeto pdfplumber.PDF, aberto na primeira vez que for usado."""
+        if self._pdf is None:
+            self._pdf = pdfplumber.open(io.BytesIO(self.data))
+        return self._pdf
+
+    @property
+    def pages(self):
+        return self.pdf.pages
+
+    @property
+    def n_pages(self) -> int:
+        return len(self.pages)
+
+    @property
+    def metadata(self) -> dict:
+        """Dicionário Info do PDF (chaves sem a barra: 'Title', 'CreationDate', ...)."""
+        return self.pdf.metadata or {}
+
+    def close(self):
+        if self._pdf is not None:
+            self._pdf.close()
+            self._pdf = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __repr__(self):
+        return f"PDFDocument({self.path!r})"
+
+@contextmanager
+def open_document(source):
+    """
+    Aceita um caminho ou um PDFDocument já aberto.
+    Só fecha o documento ao final se ele tiver sido aberto aqui.
+    """
+    if isinstance(source, PDFDocument):
+        yield source
+    else:
+        with PDFDocument(source) as document:
+            yield document
@@ -2,24 +2,20 @@ import json
 import os
 import re
 from datetime import datetime
-from pypdf import PdfReader
+from document import PDFDocument, open_document
 
-def enrich_metadata(structured_data: dict, pdf_path: str = None, custom_metadata: dict = None) -> dict:
+def extract_pdf_metadata(pdf_path: str | PDFDocument = None) -> dict:
     """
-    Enriquece a estrutura do documento com metadados, extraindo-os do PDF e combinando com metadados personalizados.
+    Lê os metadados do próprio PDF (título, data de criação/modificação e número de páginas).
 
     Args:
-        structured_data (dict): A estrutura do documento processada.
-        pdf_path (str, optional): O caminho para o arquivo PDF original, usado para inferir nome do documento e extrair metadados.
-        custom_metadata (dict, optional): Um dicionário com metadados personalizados para adicionar ou sobrescrever.
-                                         Pode incluir: doc_id, nome_doc, versao, data_publicacao,
-                                         pagina_inicial, pagina_final.
+        pdf_path (str | PDFDocument, optional): Caminho do PDF ou documento compartilhado da execução.
+                                                Com o documento compartilhado, reaproveita o parse
+                                                já feito pelas etapas anteriores.
 
     Returns:
-        dict: A estrutura do documento enriquecida com metadados.
+        dict: Metadados no formato da saída (nome_doc, data_publicacao, pagina_final, ...).
     """
-    enriched_data = structured_data.copy()
-
     metadata = {
         "doc_id": "",
         "nome_doc": "Documento Desconhecido",
@@ -29,32 +25,61 @@ def enrich_metadata(structured_data: dict, pdf_path: str = None, custom_metadata
         "pagina_final": None,
     }
 
-    if pdf_path and os.path.exists(pdf_path):
+    path = pdf_path.path if isinstance(pdf_path, PDFDocument) else pdf_path
+
+    if path and os.path.exists(path):
         try:
-            reader = PdfReader(pdf_path)
-            pdf_info = reader.metadata
-            
-            if pdf_info:
-                if "/Title" in pdf_info: metadata["nome_doc"] = pdf_info["/Title"]
-                elif "/Subject" in pdf_info: metadata["nome_doc"] = pdf_info["/Subject"]
-                else: metadata["nome_doc"] = os.path.basename(pdf_path)
-
-                if "/CreationDate" in pdf_info:
-                    date_str = pdf_info["/CreationDate"]
-                    match = re.search(r"\d{4}(\d{2})(\d{2})", date_str)
-                    if match: metadata["data_publicacao"] = f"{match.group(0)[:4]}-{match.group(1)}-{match.group(2)}"
-                elif "/ModDate" in pdf_info:
-                    date_str = pdf_info["/ModDate"]
-                    match = re.search(r"\d{4}(\d{2})(\d{2})", date_str)
-                    if match: metadata["data_publicacao"] = f"{match.group(0)[:4]}-{match.group(1)}-{match.group(2)}"
-
-            metadata["pagina_final"] = len(reader.pages)
+            with open_document(pdf_path) as document:
+                pdf_info = document.metadata
+
+                if pdf_info:
+                    if "Title" in pdf_info: metadata["nome_doc"] = str(pdf_info["Title"])
+                    elif "Subject" in pdf_info: metadata["nome_doc"] = str(pdf_info["Subject"])
+                    else: metadata["nome_doc"] = os.path.basename(path)
+
+                    if "CreationDate" in pdf_info:
+                        date_str = str(pdf_info["CreationDate"])
+                        match = re.search(r"\d{4}(\d{2})(\d{2})", date_str)
+                        if match: metadata["data_publicacao"] = f"{match.group(0)[:4]}-{match.group(1)}-{match.group(2)}"
+                    elif "ModDate" in pdf_info:
+                        date_str = str(pdf_info["ModDate"])
+                        match = re.search(r"\d{4}(\d{2})(\d{2})", date_str)
+                        if match: metadata["data_publicacao"] = f"{match.group(0)[:4]}-{match.group(1)}-{match.group(2)}"
+
+                metadata["pagina_final"] = document.n_pages
 
         except Exception as e:
-            print(f"Aviso: Não foi possível extrair metadados do PDF {pdf_path} usando pypdf: {e}")
-            metadata["nome_doc"] = os.path.basename(pdf_path)
+            print(f"Aviso: Não foi possível extrair metadados do PDF {path}: {e}")
+            metadata["nome_doc"] = os.path.basename(path)
+    else:
+        metadata["nome_doc"] = os.path.basename(path) if path else "Documento Desconhecido"
+
+    return metadata
+
+def enrich_metadata(structured_data: dict, pdf_path: str | PDFDocument = None, custom_metadata: dict = None,
+                    pdf_metadata: dict = None) -> dict:
+    """
+    Enriquece a estrutura do documento com metadados, extraindo-os do PDF e combinando com metadados personalizados.
+
+    Args:
+        structured_data (dict): A estrutura do documento processada.
+        pdf_path (str | PDFDocument, optional): O caminho para o arquivo PDF original (ou o documento compartilhado),
+                                                usado para inferir nome do documento e extrair metadados.
+        custom_metadata (dict, optional): Um dicionário com metadados personalizados para adicionar ou sobrescrever.
+                                         Pode incluir: doc_id, nome_doc, versao, data_publicacao,
+                                         pagina_inicial, pagina_final.
+        pdf_metadata (dict, optional): Metadados já extraídos com extract_pdf_metadata (p. ex. em outro processo).
+                                       Quando informado, o PDF não é lido novamente.
+
+    Returns:
+        dict: A estrutura do documento enriquecida com metadados.
+    """
+    enriched_data = structured_data.copy()
+
+    if pdf_metadata is not None:
+        metadata = dict(pdf_metadata)
     else:
-        metadata["nome_doc"] = os.path.basename(pdf_path) if pdf_path else "Documento Desconhecido"
+        metadata = extract_pdf_metadata(pdf_path)
 
     if custom_metadata:
         metadata.update(custom_metadata)
@@ -62,4 +87,4 @@ def enrich_metadata(structured_data: dict, pdf_path: str = None, custom_metadata
     final_enriched_data = metadata
     final_enriched_data.update(enriched_data)
 
-    return final_enriched_data
\ No newline at end of file
+    return final_enriched_data
@@ -0,0 +1,147 @@
+import os
+import re
+import tempfile
+import importlib.util
+from pathlib import Path
+
+# pyarrow é opcional: sem ele o pipeline roda normalmente, só a exportação colunar fica indisponível.
+# É importado na primeira exportação (_require_pyarrow), não ao carregar o módulo.
+pa = ds = pafs = pq = None
+
+DEFAULT_EXPORT_DIR = Path('data/analytics/paragraphs')
+EXPORT_FORMATS = ('arrow', 'parquet')
+FILE_SUFFIXES = {'arrow': '.arrow', 'parquet': '.parquet'}
+# Partição por documento, no formato "hive" (doc=<nome>), para que o pyarrow.dataset a leia como coluna
+PARTITION_KEY = 'doc'
+
+# Colunas e tipos Arrow; uma linha por parágrafo ("artigo" é o título do artigo, nulo fora de artigos)
+COLUMNS = (
+    ('doc_id', 'string'),
+    ('nome_doc', 'string'),
+    ('revisao', 'string'),
+    ('elemento', 'int32'),
+    ('tipo', 'string'),
+    ('capitulo', 'string'),
+    ('secao', 'string'),
+    ('artigo', 'string'),
+    ('numero', 'string'),
+    ('pagina', 'int32'),
+    ('texto', 'string'),
+    ('texto_normalizado', 'string'),
+    ('fingerprint', 'int64'),
+)
+
+_UNSAFE_NAME_RE = re.compile(r'[^\w.-]+')
+
+def pyarrow_available() -> bool:
+    """Se o pyarrow está instalado, sem importá-lo."""
+    return pa is not None or importlib.util.find_spec('pyarrow') is not None
+
+def _require_pyarrow():
+    global pa, ds, pafs, pq
+    if pa is not None:
+        return
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.fs as pafs
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("A exportação colunar requer o pacote pyarrow (pip install pyarrow)") from None
+
+def schema():
+    _require_pyarrow()
+    return pa.schema([(name, getattr(pa, type_name)()) for name, type_name in COLUMNS])
+
+def _safe_name(value: str) -> str:
+    return _UNSAFE_NAME_RE.sub('_', str(value)).strip('_') or 'sem_nome'
+
+def paragraph_columns(document: dict, doc_key: str) -> dict[str, list]:
+    """
+    Achata "estrutura" (artigos com "paragrafos" e parágrafos soltos) em colunas, uma posição por
+    parágrafo. O texto normalizado e a impressão digital são os da deduplicação cruzada, então
+    as linhas podem ser cruzadas com o cache de deduplicação e entre revisões.
+    """
+    from deduplicate import fingerprint, paragraph_normalized_text
+    columns = {name: [] for name, _ in COLUMNS}
+    revision = document.get('versao')
+    for index, item in enumerate(document.get('estrutura', [])):
+        # Parágrafos fora de artigos vêm como o próprio elemento (tipo "paragrafo"); divisões não têm texto
+        if 'paragrafos' in item:
+            paragraphs = item['paragrafos']
+        else:
+            paragraphs = [item] if item.get('tipo') == 'paragrafo' else []
+        for paragraph in paragraphs:
+            normalized = paragraph_normalized_text(item, paragraph)
+            columns['doc_id'].append(document.get('doc_id') or doc_key)
+            columns['nome_doc'].append(document.get('nome_doc'))
+            columns['revisao'].append(None if revision is None else str(revision))
+            columns['elemento'].append(index)
+            columns['tipo'].append(item.get('tipo'))
+            columns['capitulo'].append(item.get('capitulo'))
+            columns['secao'].append(item.get('secao'))
+            columns['artigo'].append(item.get('titulo') if 'paragrafos' in item else None)
+            columns['numero'].append(paragraph.get('numero'))
+            columns['pagina'].append(paragraph.get('pagina'))
+            columns['texto'].append(paragraph.get('texto', ''))
+            columns['texto_normalizado'].append(normalized)
+            columns['fingerprint'].append(fingerprint(normalized))
+    return columns
+
+def export_document(document: dict, doc_key: str, export_dir: Path = DEFAULT_EXPORT_DIR,
+                    export_format: str = 'arrow') -> Path:
+    """
+    Grava os parágrafos do documento em <export_dir>/doc=<doc_key>/<revisão>.<arrow|parquet>.
+    Cada revisão é um arquivo da partição do documento; reexportar a mesma revisão substitui o
+    arquivo de uma vez (rename), então leitores nunca veem um arquivo pela metade.
+    'arrow' (IPC sem compressão) pode ser lido mapeado em memória sem cópia; 'parquet' ocupa menos disco.
+    """
+    _require_pyarrow()
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportação inválido: {export_format!r} (use 'arrow' ou 'parquet')")
+    table = pa.table(paragraph_columns(document, doc_key), schema=schema())
+
+    partition_dir = Path(export_dir) / f"{PARTITION_KEY}={_safe_name(doc_key)}"
+    partition_dir.mkdir(parents=True, exist_ok=True)
+    path = partition_dir / f"{_safe_name(document.get('versao') or 'sem_versao')}{FILE_SUFFIXES[export_format]}"
+    fd, tmp_path = tempfile.mkstemp(dir=partition_dir, prefix='.tmp-')
+    os.close(fd)
+    try:
+        if export_format == 'arrow':
+            with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            pq.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+def remove_document(doc_key: str, export_dir: Path = DEFAULT_EXPORT_DIR) -> int:
+    """Remove a partição do documento (todas as revisões). Retorna o número de arquivos removidos."""
+    partition_dir = Path(export_dir) / f"{PARTITION_KEY}={_safe_name(doc_key)}"
+    if not partition_dir.exists():
+        return 0
+    removed = 0
+    for path in partition_dir.iterdir():
+        path.unlink()
+        removed += 1
+    partition_dir.rmdir()
+    return removed
+
+def open_dataset(export_dir: Path = DEFAULT_EXPORT_DIR, export_format: str = 'arrow'):
+    """
+    O corpus exportado como um pyarrow.dataset, com a coluna "doc" vinda da partição.
+    Arquivos Arrow são abertos com mmap: to_table()/filtros leem as colunas direto do arquivo
+    mapeado, sem cópia e sem interpretar JSON. Ex.:
+
+        open_dataset().to_table(columns=['doc', 'pagina', 'texto'], filter=ds.field('doc') == 'Estatuto')
+    """
+    _require_pyarrow()
+    files = sorted(str(path) for path in Path(export_dir).glob(f"{PARTITION_KEY}=*/*{FILE_SUFFIXES[export_format]}"))
+    return ds.dataset(files, schema=schema().append(pa.field(PARTITION_KEY, pa.string())),
+                      format='ipc' if export_format == 'arrow' else 'parquet',
+                      filesystem=pafs.LocalFileSystem(use_mmap=True),
+                      partitioning=ds.partitioning(pa.schema([(PARTITION_KEY, pa.string())]), flavor='hive'),
+                      partition_base_dir=str(Path(export_dir)))
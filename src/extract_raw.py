@@ -1,143 +1,263 @@
 import re
+import math
 import pdfplumber
 from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from document import PDFDocument, open_document
+import instrumentation
 
-def _reconstruct_lines_from_words(page, x_tol=3, y_tol=3):
+# Quantas páginas iniciais entram na detecção de cabeçalho/rodapé (None = todas; como cada página
+# é extraída uma única vez, amostrar mais páginas não custa nova extração)
+HEADER_SAMPLE_PAGES = 10
+
+def _cluster_words(words, y_tol=3):
     """
-    Fallback: reconstrói linhas agrupando words por proximidade vertical (y0).
-    Retorna lista de linhas já ordenadas left-to-right, top-to-bottom.
+    Agrupa words em linhas por proximidade vertical (y0) em O(n log n).
+
+    Cada word entra na primeira linha criada cujo y de referência (o da word que abriu a linha)
+    esteja a até y_tol de distância; se não houver, abre uma nova linha. Como duas referências
+    distintas ficam sempre a mais de y_tol uma da outra, indexar as linhas em faixas de altura
+    y_tol limita a busca a poucas faixas vizinhas, em vez de percorrer todas as linhas.
+    Retorna [(y_ref, [(x, text), ...]), ...] ordenado top -> bottom e left -> right.
     """
-    words = page.extract_words()
-    if not words:
-        return []
+    lines_map = []  # lista de (y_ref, [words])
+    buckets = defaultdict(list)  # faixa de y -> índices em lines_map
 
-    # Agrupa por "linha" usando aproximação de y0
-    lines_map = []  # lista de (y_mid, [words])
     for w in words:
         # cada word tem 'top' e 'bottom' (ou 'doctop'), usar 'top' se disponível
         y = float(w.get("top") or w.get("doctop") or 0)
         x = float(w.get("x0") or 0)
         text = w.get("text", "")
 
-        placed = False
-        for idx, (y_ref, items) in enumerate(lines_map):
-            if abs(y_ref - y) <= y_tol:
-                items.append((x, text))
-                placed = True
-                break
-        if not placed:
+        if y_tol > 0:
+            key = math.floor(y / y_tol)
+            # ±2 faixas cobrem |y_ref - y| <= y_tol mesmo com arredondamento de ponto flutuante
+            neighbour_keys = range(key - 2, key + 3)
+        else:
+            key = y
+            neighbour_keys = (key,)
+
+        # Entre as linhas compatíveis, a criada primeiro (menor índice) — mesma escolha da busca linear
+        match = None
+        for k in neighbour_keys:
+            for idx in buckets.get(k, ()):
+                if abs(lines_map[idx][0] - y) <= y_tol and (match is None or idx < match):
+                    match = idx
+
+        if match is not None:
+            lines_map[match][1].append((x, text))
+        else:
+            buckets[key].append(len(lines_map))
             lines_map.append((y, [(x, text)]))
 
     # Ordena linhas top -> bottom (menor y -> topo) e palavras left->right
     lines_map.sort(key=lambda p: p[0])
-    lines = []
     for _, items in lines_map:
         items.sort(key=lambda it: it[0])
-        line = " ".join(t for _, t in items).strip()
-        if line:
-            lines.append(line)
-    return lines
+    return lines_map
 
-def extract_raw(pdf_path: str, header_height_ratio: float = 0.15, footer_height_ratio: float = 0.12) -> list[dict]:
+def _common_header_footer(candidates):
     """
-    Extrai texto bruto de um PDF, removendo cabeçalhos e rodapés e segmentando em blocos (parágrafos).
-    Possui fallback robusto caso page.extract_text retorne None.
+    A partir dos candidatos (primeira, última linha) de cada página, retorna
+    (common_header, common_footer) — apenas se aparecerem >2 vezes.
     """
-    all_text_blocks = []
     header_candidates = []
     footer_candidates = []
+    for candidate in candidates:
+        if candidate is None:
+            continue
+        header_candidates.append(candidate[0])
+        footer_candidates.append(candidate[1])
+
+    # Detecta os mais comuns (apenas se aparecerem >2 vezes)
+    common_header = None
+    common_footer = None
+    if header_candidates:
+        header_count = Counter(header_candidates).most_common(1)
+        if header_count and header_count[0][1] > 2:
+            common_header = header_count[0][0]
+    if footer_candidates:
+        footer_count = Counter(footer_candidates).most_common(1)
+        if footer_count and footer_count[0][1] > 2:
+            common_footer = footer_count[0][0]
+
+    return common_header, common_footer
+
+def _lines_to_blocks(lines, page_num, common_header, common_footer) -> list[dict]:
+    """
+    Remove o cabeçalho/rodapé comum das linhas de conteúdo de uma página e as segmenta em blocos.
+    """
+    # Remove cabeçalho/rodapé detectados (comparação por prefixo)
+    if common_header and lines and lines[0].startswith(common_header[:15]):
+        lines = lines[1:]
+    if common_footer and lines and lines[-1].startswith(common_footer[:15]):
+        lines = lines[:-1]
+
+    if not lines:
+        return []
+
+    # Junta linhas em um único texto para aplicar heurística semântica depois
+    page_text_clean = " ".join(lines)
+
+    # Heurística de parágrafos (divide por sentence boundaries + conectores comuns)
+    paragraph_candidates = re.split(
+        r'\.\n|(?=\b(Diante|Além disso|Assim|Portanto|Os números|Com base|Em seguida|Dessa forma|Por fim|Ciente|Dando continuidade)\b)',
+        page_text_clean
+        )
+
+    # Filtra e adiciona blocos robustos
+    blocks = []
+    for para in paragraph_candidates:
+        if not para:
+            continue
+        para = para.strip()
+        # elimina strings muito curtas (p. ex. letras soltas) — ajuste conforme necessidade
+        if len(para) < 30:
+            # se for título curto em maiúsculas, ainda pode ser útil
+            if para.isupper() and len(para) > 5:
+                pass
+            else:
+                continue
+        blocks.append({
+            "text": para,
+            "page": page_num
+        })
+    return blocks
+
+def _shard_pages(page_numbers: list[int], n_shards: int) -> list[list[int]]:
+    """Divide a lista de páginas em até n_shards fatias contíguas de tamanho semelhante."""
+    n_shards = max(1, min(n_shards, len(page_numbers)))
+    size, rest = divmod(len(page_numbers), n_shards)
+    shards = []
+    start = 0
+    for i in range(n_shards):
+        stop = start + size + (1 if i < rest else 0)
+        shards.append(page_numbers[start:stop])
+        start = stop
+    return shards
 
+def _page_lines_with_positions(page) -> list[tuple[float, float, str]]:
+    """
+    Extrai a página inteira uma só vez e retorna as linhas com a posição vertical,
+    [(top, bottom, texto), ...] de cima para baixo. Usa o fallback por words quando a página
+    não tem texto extraível por extract_text_lines.
+    """
+    text_lines = page.extract_text_lines(return_chars=False, x_tolerance=3, y_tolerance=3)
+    lines = [(line["top"], line["bottom"], line["text"].strip()) for line in text_lines if line["text"].strip()]
+    if lines:
+        return lines
+
+    instrumentation.increment("words_fallback")
+    words = page.extract_words()
+    # Sem bottom por linha no fallback: usa a altura da maior word de cada linha
+    heights = {}
+    for w in words:
+        top = float(w.get("top") or w.get("doctop") or 0)
+        heights[top] = max(heights.get(top, 0.0), float(w.get("bottom", top)) - top)
+    lines = []
+    for y_ref, items in _cluster_words(words):
+        text = " ".join(t for _, t in items).strip()
+        if text:
+            lines.append((y_ref, y_ref + heights.get(y_ref, 0.0), text))
+    return lines
+
+def _extract_page_lines(page, page_num) -> list[tuple[float, float, str]]:
+    with instrumentation.span("page", stage="extract_raw", page=page_num):
+        lines = _page_lines_with_positions(page)
+    instrumentation.increment("pages", stage="extract_raw")
+    return lines
+
+def _extract_lines_list(pdf_path, page_numbers) -> list[tuple[int, float, list]]:
+    """
+    Worker da extração paralela: abre o PDF no próprio processo e retorna
+    (page_num, altura, linhas posicionadas) das páginas informadas (1-based).
+    """
+    results = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_num in page_numbers:
+            page = pdf.pages[page_num - 1]
+            results.append((page_num, page.height, _extract_page_lines(page, page_num)))
+    return results
+
+def extract_page_lines(document: PDFDocument, page_numbers, workers: int = 1,
+                       min_pages_per_shard: int = 8) -> dict[int, tuple[float, list]]:
+    """
+    Extrai uma única vez, em tamanho cheio, as linhas posicionadas das páginas informadas
+    (números 1-based): {page_num: (altura da página, [(top, bottom, texto), ...])}.
+    Delas saem tanto os candidatos a cabeçalho/rodapé (_page_candidate) quanto os blocos de
+    conteúdo (_page_blocks), sem reextrair a página. Usada por extract_raw e pela reextração
+    incremental de revisões, que só reprocessa as páginas alteradas.
+    """
+    page_numbers = list(page_numbers)
+
+    # Duas faixas por processo ajudam a equilibrar páginas de custo desigual
+    n_shards = min(workers * 2, len(page_numbers) // max(1, min_pages_per_shard))
+    if workers <= 1 or n_shards <= 1:
+        pages = document.pages
+        return {n: (pages[n - 1].height, _extract_page_lines(pages[n - 1], n)) for n in page_numbers}
+
+    # Em paralelo: cada processo abre o PDF e extrai a sua fatia de páginas
+    page_lines = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [instrumentation.submit(executor, _extract_lines_list, document.path, shard)
+                   for shard in _shard_pages(page_numbers, n_shards)]
+        for future in futures:
+            for page_num, page_height, lines in instrumentation.result(future):
+                page_lines[page_num] = (page_height, lines)
+    return page_lines
+
+def _page_candidate(lines) -> tuple[str, str] | None:
+    """(primeira linha, última linha) da página inteira — candidatos a cabeçalho/rodapé — ou None se não há texto."""
+    return (lines[0][2], lines[-1][2]) if lines else None
+
+def _page_blocks(page_num, page_height, lines, common_header, common_footer,
+                 header_height_ratio, footer_height_ratio) -> list[dict]:
+    """
+    Blocos de conteúdo de uma página a partir das suas linhas posicionadas: ficam as linhas que
+    cruzam a faixa entre header_height_ratio e 1 - footer_height_ratio da altura (o equivalente
+    a recortar a página), sem o cabeçalho/rodapé comum.
+    """
+    content_top = page_height * header_height_ratio
+    content_bottom = page_height * (1 - footer_height_ratio)
+    content_lines = [text for top, bottom, text in lines if bottom > content_top and top < content_bottom]
+    blocks = _lines_to_blocks(content_lines, page_num, common_header, common_footer)
+    instrumentation.increment("blocks", len(blocks), stage="extract_raw")
+    return blocks
+
+def extract_raw(pdf_path: str | PDFDocument, header_height_ratio: float = 0.15, footer_height_ratio: float = 0.12,
+                workers: int = 1, min_pages_per_shard: int = 8,
+                header_sample_pages: int | None = HEADER_SAMPLE_PAGES) -> list[dict]:
+    """
+    Extrai texto bruto de um PDF, removendo cabeçalhos e rodapés e segmentando em blocos (parágrafos).
+    Possui fallback robusto caso a página não tenha texto extraível por linhas.
+
+    Cada página é extraída uma única vez, em tamanho cheio (extract_page_lines): a primeira e a
+    última linha alimentam a detecção de cabeçalho/rodapé e as linhas da faixa de conteúdo viram
+    os blocos. header_sample_pages define quantas páginas iniciais entram na detecção
+    (None = todas, sem custo extra).
+
+    Com workers > 1, as páginas são divididas em faixas contíguas (com pelo menos
+    min_pages_per_shard páginas cada) extraídas em processos paralelos, produzindo exatamente
+    a mesma saída do caminho serial.
+
+    pdf_path pode ser um PDFDocument compartilhado; nesse caso as páginas já interpretadas
+    ficam disponíveis para as etapas seguintes.
+    """
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            n_pages = len(pdf.pages)
-            # 1ª passada: coletar possíveis cabeçalhos/rodapés (até 10 páginas)
-            for page in pdf.pages[:min(n_pages, 10)]:
-                text = page.extract_text(x_tolerance=3, y_tolerance=3) or ""
-                if not text.strip():
-                    # fallback: tenta reconstruir a partir de words
-                    lines_fb = _reconstruct_lines_from_words(page)
-                    if not lines_fb:
-                        continue
-                    lines = lines_fb
-                else:
-                    lines = [ln.strip() for ln in text.split("\n") if ln and ln.strip()]
-
-                if len(lines) < 1:
-                    continue
-                header_candidates.append(lines[0])
-                footer_candidates.append(lines[-1])
-
-            # Detecta os mais comuns (apenas se aparecerem >2 vezes)
-            common_header = None
-            common_footer = None
-            if header_candidates:
-                header_count = Counter(header_candidates).most_common(1)
-                if header_count and header_count[0][1] > 2:
-                    common_header = header_count[0][0]
-            if footer_candidates:
-                footer_count = Counter(footer_candidates).most_common(1)
-                if footer_count and footer_count[0][1] > 2:
-                    common_footer = footer_count[0][0]
-
-            # 2ª passada: extração por página com crop + fallback e segmentação
-            for page_num, page in enumerate(pdf.pages, 1):
-                page_height = page.height
-                page_width = page.width
-
-                content_bbox = (
-                    0,
-                    page_height * header_height_ratio,
-                    page_width,
-                    page_height * (1 - footer_height_ratio)
-                )
-                content_page = page.crop(bbox=content_bbox)
-
-                page_text = content_page.extract_text(x_tolerance=3, y_tolerance=3)
-
-                # Se extract_text retornou None ou vazio, tenta reconstruir por words
-                if not page_text or not page_text.strip():
-                    lines = _reconstruct_lines_from_words(content_page)
-                else:
-                    # split seguro - garantimos page_text ser string
-                    lines = [ln.strip() for ln in page_text.split("\n") if ln and ln.strip()]
-
-                # Remove cabeçalho/rodapé detectados (comparação por prefixo)
-                if common_header and lines and lines[0].startswith(common_header[:15]):
-                    lines = lines[1:]
-                if common_footer and lines and lines[-1].startswith(common_footer[:15]):
-                    lines = lines[:-1]
-
-                if not lines:
-                    continue
-
-                # Junta linhas em um único texto para aplicar heurística semântica depois
-                page_text_clean = " ".join(lines)
-
-                # Heurística de parágrafos (divide por sentence boundaries + conectores comuns)
-                paragraph_candidates = re.split(
-                    r'\.\n|(?=\b(Diante|Além disso|Assim|Portanto|Os números|Com base|Em seguida|Dessa forma|Por fim|Ciente|Dando continuidade)\b)',
-                    page_text_clean
-                    )
-
-                # Filtra e adiciona blocos robustos
-                for para in paragraph_candidates:
-                    if not para:
-                        continue
-                    para = para.strip()
-                    # elimina strings muito curtas (p. ex. letras soltas) — ajuste conforme necessidade
-                    if len(para) < 30:
-                        # se for título curto em maiúsculas, ainda pode ser útil
-                        if para.isupper() and len(para) > 5:
-                            pass
-                        else:
-                            continue
-                    all_text_blocks.append({
-                        "text": para,
-                        "page": page_num
-                    })
+        with open_document(pdf_path) as document:
+            page_numbers = list(range(1, document.n_pages + 1))
+            page_lines = extract_page_lines(document, page_numbers, workers, min_pages_per_shard)
+
+            sample = page_numbers if header_sample_pages is None else page_numbers[:header_sample_pages]
+            common_header, common_footer = _common_header_footer(_page_candidate(page_lines[p][1]) for p in sample)
+
+            blocks = []
+            for page_num in page_numbers:
+                page_height, lines = page_lines[page_num]
+                blocks.extend(_page_blocks(page_num, page_height, lines, common_header, common_footer,
+                                           header_height_ratio, footer_height_ratio))
+            return blocks
 
     except Exception as e:
         print(f"❌ Erro ao processar PDF '{pdf_path}': {e}")
         return []
-
-    return all_text_blocks
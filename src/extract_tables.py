@@ -1,41 +1,425 @@
-import camelot
-import pandas as pd
+import json
+import time
+import hashlib
+import multiprocessing
+import multiprocessing.connection
+from collections import deque
+from document import PDFDocument, open_document
+from extract_raw import _shard_pages
+import instrumentation
 
-def extract_tables(pdf_path: str) -> list[list[list[str]]]:
+# Pré-filtro de páginas candidatas a tabela (medidas em pontos do PDF)
+MIN_RULING_LENGTH = 10    # Segmentos mais curtos não contam como linha de tabela
+MAX_RULING_WIDTH = 3      # Retângulos preenchidos mais finos que isso são linhas desenhadas
+MIN_GRID_CROSSINGS = 4    # Cruzamentos de linhas horizontais e verticais para haver uma grade
+MIN_ALIGNED_ROWS = 3      # Linhas de texto com colunas alinhadas para uma tabela sem grade
+COLUMN_GAP_RATIO = 1.5    # Espaço entre colunas, em alturas de caractere
+COLUMN_X_TOLERANCE = 4
+# Custo médio do Camelot por página nos PDFs de data/input, para estimar o tempo economizado
+# quando poucas páginas passaram por um dos flavors
+LATTICE_SECONDS_PER_PAGE = 0.5
+STREAM_SECONDS_PER_PAGE = 0.08
+# Páginas medidas (fora a primeira de cada tarefa) para usar o custo desta execução na estimativa
+MIN_RATE_PAGES = 3
+
+# Extração em tarefas paralelas: tempo máximo por página e o que fazer com as páginas que falham
+DEFAULT_PAGE_TIMEOUT = 60.0
+FAILURE_POLICIES = ('skip', 'retry', 'stream')
+
+def _page_rulings(page) -> tuple[list, list]:
     """
-    Extrai tabelas de um arquivo PDF e as retorna em um formato estruturado.
-    Tenta extrair usando os dois 'flavors' do Camelot (lattice e stream) para maximizar a precisão.
+    Linhas desenhadas na página, como (posição, início, fim): horizontais (y, x0, x1) e
+    verticais (x, top, bottom). Contam as linhas, as bordas de retângulos com traço e os
+    retângulos preenchidos finos; retângulos preenchidos largos são fundos (destaque de texto),
+    que o flavor lattice não reconhece como grade.
+    """
+    horizontal, vertical = [], []
+    for line in page.lines:
+        if line['width'] >= MIN_RULING_LENGTH and line['height'] <= MAX_RULING_WIDTH:
+            horizontal.append((line['top'], line['x0'], line['x1']))
+        elif line['height'] >= MIN_RULING_LENGTH and line['width'] <= MAX_RULING_WIDTH:
+            vertical.append((line['x0'], line['top'], line['bottom']))
+    for rect in page.rects:
+        x0, x1, top, bottom = rect['x0'], rect['x1'], rect['top'], rect['bottom']
+        if rect.get('stroke'):
+            if rect['width'] >= MIN_RULING_LENGTH:
+                horizontal += [(top, x0, x1), (bottom, x0, x1)]
+            if rect['height'] >= MIN_RULING_LENGTH:
+                vertical += [(x0, top, bottom), (x1, top, bottom)]
+        elif rect['height'] <= MAX_RULING_WIDTH and rect['width'] >= MIN_RULING_LENGTH:
+            horizontal.append(((top + bottom) / 2, x0, x1))
+        elif rect['width'] <= MAX_RULING_WIDTH and rect['height'] >= MIN_RULING_LENGTH:
+            vertical.append(((x0 + x1) / 2, top, bottom))
+    return horizontal, vertical
 
-    Args:
-        pdf_path (str): O caminho para o arquivo PDF.
+def _has_ruled_grid(page, tolerance: float = 2) -> bool:
+    """Se as linhas desenhadas da página se cruzam formando uma grade (candidata ao flavor lattice)."""
+    horizontal, vertical = _page_rulings(page)
+    if len(horizontal) < 2 or len(vertical) < 2:
+        return False
+    import numpy as np
+    h = np.array(horizontal)
+    v = np.array(vertical)
+    crossings = ((v[None, :, 0] >= h[:, None, 1] - tolerance) & (v[None, :, 0] <= h[:, None, 2] + tolerance) &
+                 (h[:, None, 0] >= v[None, :, 1] - tolerance) & (h[:, None, 0] <= v[None, :, 2] + tolerance))
+    return int(crossings.sum()) >= MIN_GRID_CROSSINGS
+
+def _has_aligned_columns(page) -> bool:
+    """
+    Se a página tem texto em colunas (candidata ao flavor stream): pelo menos MIN_ALIGNED_ROWS
+    linhas de texto divididas por espaços largos em dois ou mais trechos que começam nas mesmas
+    posições horizontais. Texto corrido, mesmo justificado, forma um único trecho por linha.
+    """
+    words = page.extract_words(x_tolerance=3, y_tolerance=3)
+    if not words:
+        return False
+    words.sort(key=lambda w: (w['top'], w['x0']))
+    lines = []
+    for word in words:
+        if lines and word['top'] - lines[-1][0]['top'] <= 3:
+            lines[-1].append(word)
+        else:
+            lines.append([word])
+
+    # Início (x0) dos trechos de cada linha com mais de uma coluna
+    rows = []
+    for line in lines:
+        line.sort(key=lambda w: w['x0'])
+        starts = [line[0]['x0']]
+        for previous, word in zip(line, line[1:]):
+            gap_limit = COLUMN_GAP_RATIO * max(previous['bottom'] - previous['top'], 1)
+            if word['x0'] - previous['x1'] > gap_limit:
+                starts.append(word['x0'])
+        if len(starts) > 1:
+            rows.append([round(x / COLUMN_X_TOLERANCE) for x in starts])
+    if len(rows) < MIN_ALIGNED_ROWS:
+        return False
+
+    # Colunas: posições que se repetem em várias linhas; a tabela precisa de duas ou mais
+    column_rows = {}
+    for row_id, starts in enumerate(rows):
+        for x in set(starts):
+            for key in (x - 1, x, x + 1):
+                column_rows.setdefault(key, set()).add(row_id)
+    columns = {x for x, row_ids in column_rows.items() if len(row_ids) >= MIN_ALIGNED_ROWS}
+    aligned_rows = sum(1 for starts in rows if len({x for x in starts if x in columns}) >= 2)
+    return aligned_rows >= MIN_ALIGNED_ROWS
+
+def table_candidate_pages(document: PDFDocument, pages='all') -> dict:
+    """
+    Pré-filtro barato (só o layout já interpretado pelo pdfplumber) das páginas que podem ter tabelas.
 
     Returns:
-        list[list[list[str]]]: Uma lista de tabelas, onde cada tabela é uma lista de linhas,
-                                e cada linha é uma lista de strings (células).
+        dict: {"lattice": [...], "stream": [...]} com as páginas (1-based) que têm uma grade de
+              linhas desenhadas e as que têm texto em colunas alinhadas.
     """
-    all_tables_data = []
+    if pages == 'all':
+        pages = range(1, document.n_pages + 1)
+    candidates = {"lattice": [], "stream": []}
+    for page_num in pages:
+        page = document.pages[page_num - 1]
+        if _has_ruled_grid(page):
+            candidates["lattice"].append(page_num)
+        if _has_aligned_columns(page):
+            candidates["stream"].append(page_num)
+    return candidates
 
-    try:
-        tables_lattice = camelot.read_pdf(pdf_path, pages='all', flavor='lattice', suppress_stdout=True)
-        for table in tables_lattice:
-            df = table.df
-            all_tables_data.append(df.values.tolist())
-    except Exception as e:
-        print(f"Aviso: Erro ao extrair tabelas com flavor='lattice': {e}")
+def _read_page(pdf_path: str, page: int, flavor: str) -> list[dict]:
+    """Uma chamada do Camelot em um flavor, em uma única página."""
+    # Importado só aqui: o Camelot traz OpenCV e pandas, que custam segundos na inicialização de cada
+    # processo e não são necessários quando nenhuma página passa pelo Camelot (ou as tabelas são puladas)
+    import camelot
+    tables = camelot.read_pdf(pdf_path, pages=str(page), flavor=flavor, suppress_stdout=True)
+    return [{"page": int(table.page), "flavor": flavor, "rows": table.df.values.tolist()} for table in tables]
+
+def _table_task(pdf_path: str, flavor: str, pages: list[int], conn):
+    """
+    Worker de uma faixa de páginas: lê as páginas uma a uma e envia (página, tabelas, erro, segundos)
+    pelo pipe assim que cada uma termina, para o processo principal saber em qual página está.
+    """
+    for page in pages:
+        start = time.perf_counter()
+        try:
+            conn.send((page, _read_page(pdf_path, page, flavor), None, time.perf_counter() - start))
+        except Exception as e:
+            conn.send((page, [], f"{type(e).__name__}: {e}", time.perf_counter() - start))
+    conn.close()
+
+def _run_table_tasks(pdf_path: str, flavor: str, pages: list[int], workers: int = 1,
+                     page_timeout: float | None = DEFAULT_PAGE_TIMEOUT) -> tuple[dict, dict, float]:
+    """
+    Executa o Camelot nas páginas informadas, em tarefas por faixa de páginas contíguas.
+
+    Cada tarefa roda em um processo próprio (até workers ao mesmo tempo); se uma página passa de
+    page_timeout segundos, o processo é encerrado, a página é marcada como falha e o resto da faixa
+    volta para a fila em uma nova tarefa. Sem limite de tempo e com um único worker, as páginas
+    são lidas no próprio processo.
+
+    Returns:
+        ({página: [tabelas]}, {página: erro}, soma dos segundos gastos por página,
+         [segundos de cada página que não foi a primeira da sua tarefa])
+        A primeira página de uma tarefa também paga a importação do Camelot no processo; as demais
+        medem só o custo por página, que é o que deixa de ser gasto com uma página pulada.
+    """
+    results, failures = {}, {}
+    seconds = 0.0
+    warm_seconds = []
+    if not pages:
+        return results, failures, seconds, warm_seconds
+
+    if workers <= 1 and page_timeout is None:
+        for page in pages:
+            start = time.perf_counter()
+            try:
+                results[page] = _read_page(pdf_path, page, flavor)
+            except Exception as e:
+                failures[page] = f"{type(e).__name__}: {e}"
+            page_seconds = time.perf_counter() - start
+            seconds += page_seconds
+            if page != pages[0]:
+                warm_seconds.append(page_seconds)
+            error = failures[page].split(':')[0] if page in failures else None
+            instrumentation.record_span("page", page_seconds, error=error, stage="extract_tables", flavor=flavor,
+                                        page=page)
+        return results, failures, seconds, warm_seconds
+
+    ctx = multiprocessing.get_context()
+    # Duas faixas por processo ajudam a equilibrar páginas de custo desigual
+    pending = deque(_shard_pages(list(pages), max(1, workers) * 2))
+    running = {}  # pipe de leitura -> {"process", "pages" restantes, "last" progresso}
+
+    def stop(reader, error: str = None):
+        task = running.pop(reader)
+        if error is not None:
+            task["process"].terminate()
+            page = task["pages"].popleft()
+            failures[page] = error
+            if task["pages"]:
+                pending.appendleft(list(task["pages"]))
+        task["process"].join()
+        reader.close()
 
     try:
-        tables_stream = camelot.read_pdf(pdf_path, pages='all', flavor='stream', suppress_stdout=True)
-        for table in tables_stream:
-            df = table.df
+        while pending or running:
+            while pending and len(running) < max(1, workers):
+                shard = pending.popleft()
+                reader, writer = ctx.Pipe(duplex=False)
+                process = ctx.Process(target=_table_task, args=(pdf_path, flavor, shard, writer))
+                process.start()
+                writer.close()
+                running[reader] = {"process": process, "pages": deque(shard), "last": time.monotonic(),
+                                   "first": True}
+
+            wait_s = 1.0
+            if page_timeout is not None:
+                next_deadline = min(task["last"] + page_timeout for task in running.values())
+                wait_s = min(wait_s, max(0.0, next_deadline - time.monotonic()))
+            for reader in multiprocessing.connection.wait(list(running), timeout=wait_s):
+                task = running[reader]
+                try:
+                    page, tables, error, page_seconds = reader.recv()
+                except EOFError:
+                    # O processo terminou sem enviar a página atual (p. ex. falha do Ghostscript/OpenCV)
+                    stop(reader, "processo do Camelot encerrado inesperadamente")
+                    continue
+                task["pages"].popleft()
+                task["last"] = time.monotonic()
+                seconds += page_seconds
+                if not task["first"]:
+                    warm_seconds.append(page_seconds)
+                task["first"] = False
+                # A página foi lida em outro processo: a duração medida lá vira o span dela
+                instrumentation.record_span("page", page_seconds, error=error.split(':')[0] if error else None,
+                                            stage="extract_tables", flavor=flavor, page=page)
+                if error is None:
+                    results[page] = tables
+                else:
+                    failures[page] = error
+                if not task["pages"]:
+                    stop(reader)
 
-            if df.values.tolist() not in all_tables_data:
-                all_tables_data.append(df.values.tolist())
-    except Exception as e:
-        print(f"Aviso: Erro ao extrair tabelas com flavor='stream': {e}")
+            if page_timeout is not None:
+                now = time.monotonic()
+                for reader, task in list(running.items()):
+                    if now - task["last"] > page_timeout:
+                        seconds += page_timeout
+                        instrumentation.record_span("page", page_timeout, error="timeout", stage="extract_tables",
+                                                    flavor=flavor, page=task["pages"][0])
+                        stop(reader, f"tempo esgotado ({page_timeout:g}s)")
+    finally:
+        for reader in list(running):
+            running[reader]["process"].terminate()
+            running.pop(reader)["process"].join()
+            reader.close()
+    return results, failures, seconds, warm_seconds
 
-    cleaned_tables = []
-    for table in all_tables_data:
-        if len(table) > 1 and any(cell.strip() for row in table for cell in row):
-            cleaned_tables.append(table)
+def _run_flavor(pdf_path: str, flavor: str, pages: list[int], workers: int, page_timeout: float | None,
+                on_failure: str) -> tuple[dict, dict, float, list[float]]:
+    """_run_table_tasks com a política 'retry': as páginas que falharam são tentadas mais uma vez."""
+    results, failures, seconds, warm_seconds = _run_table_tasks(pdf_path, flavor, pages, workers, page_timeout)
+    if on_failure == 'retry' and failures:
+        retried, failures, retry_seconds, retry_warm = _run_table_tasks(pdf_path, flavor, sorted(failures), workers,
+                                                                        page_timeout)
+        results.update(retried)
+        seconds += retry_seconds
+        warm_seconds += retry_warm
+    return results, failures, seconds, warm_seconds
+
+def _seconds_per_page(warm_seconds: list[float], default: float) -> float:
+    """Custo por página medido nesta execução, ou o padrão do flavor se poucas páginas foram medidas."""
+    return sum(warm_seconds) / len(warm_seconds) if len(warm_seconds) >= MIN_RATE_PAGES else default
+
+def scan_tables(pdf_path: str | PDFDocument, pages='all', prefilter: bool = True, workers: int = 1,
+                page_timeout: float | None = DEFAULT_PAGE_TIMEOUT, on_failure: str = 'stream') -> dict:
+    """
+    Executa o Camelot nas páginas informadas e retorna as tabelas brutas com um relatório da extração.
 
-    return cleaned_tables
\ No newline at end of file
+    Com prefilter, o lattice (que rasteriza cada página) só roda nas páginas com grade de linhas
+    desenhadas e o stream só nas páginas com texto em colunas onde o lattice não encontrou tabela;
+    as demais páginas não passam pelo Camelot. Sem prefilter, os dois flavors rodam em todas as páginas.
+    As páginas são divididas em tarefas paralelas (workers processos), com page_timeout segundos
+    por página (None = sem limite). on_failure define o que fazer com uma página que falhou ou
+    passou do tempo: 'skip' (fica sem tabelas), 'retry' (tenta mais uma vez) ou 'stream'
+    (se o lattice falhou, a página passa pelo stream).
+    O tempo economizado é estimado pelo custo médio por página de cada flavor nesta execução, sem a
+    primeira página de cada tarefa (que inclui a importação do Camelot, paga de qualquer forma); com
+    menos de MIN_RATE_PAGES páginas medidas, vale LATTICE_SECONDS_PER_PAGE/STREAM_SECONDS_PER_PAGE.
+
+    Returns:
+        dict: {"raw_tables": [...] (em ordem de página), "pages_total": int, "pages_scanned": int,
+               "pages_skipped": int, "lattice_pages": int, "stream_pages": int, "prefilter_s": float,
+               "camelot_s": float, "estimated_saved_s": float, "timeouts": int,
+               "failures": [{"page", "flavor", "error"}], "failed_pages": [...]}
+    """
+    if on_failure not in FAILURE_POLICIES:
+        raise ValueError(f"on_failure inválido: {on_failure!r} (use {', '.join(FAILURE_POLICIES)})")
+    with open_document(pdf_path) as document:
+        page_list = list(range(1, document.n_pages + 1)) if pages == 'all' else list(pages)
+        start = time.perf_counter()
+        with instrumentation.span("table_prefilter"):
+            if prefilter:
+                candidates = table_candidate_pages(document, page_list)
+            else:
+                candidates = {"lattice": page_list, "stream": page_list}
+        prefilter_s = time.perf_counter() - start
+        path = document.path
+
+    lattice_pages = candidates["lattice"]
+    with instrumentation.span("camelot", flavor="lattice"):
+        lattice, lattice_failures, lattice_s, lattice_warm = _run_flavor(path, "lattice", lattice_pages, workers, page_timeout,
+                                                           on_failure)
+    stream_pages = set(candidates["stream"])
+    if prefilter:
+        stream_pages -= {page for page, tables in lattice.items() if tables}
+    if on_failure == 'stream':
+        stream_pages |= set(lattice_failures)
+    stream_pages = sorted(stream_pages)
+    with instrumentation.span("camelot", flavor="stream"):
+        stream, stream_failures, stream_s, stream_warm = _run_flavor(path, "stream", stream_pages, workers, page_timeout,
+                                                        on_failure)
+
+    raw_tables = []
+    for page in page_list:
+        raw_tables += lattice.get(page, []) + stream.get(page, [])
+    failures = [{"page": page, "flavor": flavor, "error": error}
+                for flavor, flavor_failures in (("lattice", lattice_failures), ("stream", stream_failures))
+                for page, error in sorted(flavor_failures.items())]
+    for failure in failures:
+        print(f"Aviso: Erro ao extrair tabelas da página {failure['page']} com flavor='{failure['flavor']}': "
+              f"{failure['error']}")
+
+    scanned = set(lattice_pages) | set(stream_pages)
+    timeouts = sum(1 for failure in failures if failure["error"].startswith("tempo esgotado"))
+    for flavor, flavor_pages, flavor_results in (("lattice", lattice_pages, lattice), ("stream", stream_pages, stream)):
+        instrumentation.increment("pages", len(flavor_pages), stage="extract_tables", flavor=flavor)
+        instrumentation.increment("tables", sum(len(tables) for tables in flavor_results.values()), flavor=flavor)
+    instrumentation.increment("table_pages_skipped", len(page_list) - len(scanned))
+    instrumentation.increment("table_failures", len(failures) - timeouts)
+    instrumentation.increment("table_timeouts", timeouts)
+    lattice_per_page = _seconds_per_page(lattice_warm, LATTICE_SECONDS_PER_PAGE)
+    stream_per_page = _seconds_per_page(stream_warm, STREAM_SECONDS_PER_PAGE)
+    saved = (lattice_per_page * (len(page_list) - len(lattice_pages))
+             + stream_per_page * (len(page_list) - len(stream_pages)) - prefilter_s)
+    return {
+        "raw_tables": raw_tables,
+        "pages_total": len(page_list),
+        "pages_scanned": len(scanned),
+        "pages_skipped": len(page_list) - len(scanned),
+        "lattice_pages": len(lattice_pages),
+        "stream_pages": len(stream_pages),
+        "prefilter_s": round(prefilter_s, 3),
+        "camelot_s": round(lattice_s + stream_s, 3),
+        "estimated_saved_s": round(saved, 3) if prefilter else 0.0,
+        "timeouts": timeouts,
+        "failures": failures,
+        "failed_pages": sorted({failure["page"] for failure in failures}),
+    }
+
+def extract_raw_tables(pdf_path: str | PDFDocument, pages='all', prefilter: bool = True, workers: int = 1,
+                       page_timeout: float | None = DEFAULT_PAGE_TIMEOUT, on_failure: str = 'stream') -> list[dict]:
+    """
+    Executa o Camelot (lattice e stream) nas páginas informadas e retorna as tabelas brutas,
+    antes da deduplicação entre flavors e da limpeza, com a página de origem de cada uma.
+    Com prefilter, só as páginas candidatas passam pelo Camelot (ver scan_tables).
+
+    Args:
+        pdf_path (str | PDFDocument): O caminho para o arquivo PDF ou o documento compartilhado.
+        pages (str | list[int]): 'all' ou a lista de páginas (1-based) a processar.
+
+    Returns:
+        list[dict]: Entradas {"page": int, "flavor": "lattice" | "stream", "rows": list[list[str]]}.
+    """
+    return scan_tables(pdf_path, pages, prefilter, workers, page_timeout, on_failure)["raw_tables"]
+
+def _table_hash(rows: list[list[str]]) -> bytes:
+    return hashlib.sha1(json.dumps(rows, ensure_ascii=False).encode('utf-8')).digest()
+
+def merge_tables(raw_tables: list[dict]) -> list[dict]:
+    """
+    Junta as tabelas brutas em ordem de página (na mesma página, lattice antes de stream),
+    descartando tabelas vazias ou de uma única linha e as que repetem o conteúdo de uma tabela
+    anterior (comparação pelo hash das células). Como a ordem vem só da página, tabelas
+    extraídas em execuções diferentes podem ser juntadas.
+
+    Returns:
+        list[dict]: Entradas {"page": int, "flavor": str, "rows": list[list[str]]}.
+    """
+    merged = []
+    seen = set()
+    for table in sorted(raw_tables, key=lambda t: (t["page"], t["flavor"] != "lattice")):
+        rows = table["rows"]
+        if len(rows) <= 1 or not any(cell.strip() for row in rows for cell in row):
+            continue
+        key = _table_hash(rows)
+        if key in seen:
+            continue
+        seen.add(key)
+        merged.append({"page": table["page"], "flavor": table["flavor"], "rows": rows})
+    return merged
+
+def merge_raw_tables(raw_tables: list[dict]) -> list[list[list[str]]]:
+    """Tabelas de merge_tables no formato final (só as células)."""
+    return [table["rows"] for table in merge_tables(raw_tables)]
+
+def extract_tables(pdf_path: str | PDFDocument, prefilter: bool = True, workers: int = 1,
+                   page_timeout: float | None = DEFAULT_PAGE_TIMEOUT, on_failure: str = 'stream') -> list[list[list[str]]]:
+    """
+    Extrai tabelas de um arquivo PDF e as retorna em um formato estruturado.
+    Tenta extrair usando os dois 'flavors' do Camelot (lattice e stream) para maximizar a precisão,
+    só nas páginas que o pré-filtro aponta como candidatas (prefilter=False analisa todas).
+
+    Args:
+        pdf_path (str | PDFDocument): O caminho para o arquivo PDF ou o documento compartilhado
+                                      da execução. O Camelot precisa de um arquivo em disco
+                                      (o flavor lattice rasteriza as páginas), então recebe o caminho.
+        prefilter (bool): Se o Camelot roda só nas páginas candidatas a tabela.
+        workers (int): Processos que executam as tarefas por faixa de páginas.
+        page_timeout (float | None): Segundos por página antes de a tarefa ser interrompida.
+        on_failure (str): 'skip', 'retry' ou 'stream' para páginas que falharam (ver scan_tables).
+
+    Returns:
+        list[list[list[str]]]: Uma lista de tabelas, em ordem de página, onde cada tabela é uma lista de linhas,
+                                e cada linha é uma lista de strings (células).
+    """
+    return merge_raw_tables(extract_raw_tables(pdf_path, prefilter=prefilter, workers=workers,
+                                               page_timeout=page_timeout, on_failure=on_failure))
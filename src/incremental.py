@@ -0,0 +1,197 @@
+import os
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+from pdfminer.pdftypes import resolve1, PDFStream
+from document import PDFDocument
+from extract_raw import HEADER_SAMPLE_PAGES, _common_header_footer, _page_blocks, _page_candidate, extract_page_lines
+from extract_tables import scan_tables, DEFAULT_PAGE_TIMEOUT
+from stage_cache import CACHE_VERSION
+import instrumentation
+
+def page_fingerprint(page) -> str:
+    """
+    Impressão digital de uma página: hash dos content streams decodificados, das dimensões,
+    da rotação, dos XObjects e das fontes referenciadas. Páginas com a mesma impressão digital
+    produzem os mesmos blocos de texto e as mesmas tabelas.
+    """
+    page_obj = page.page_obj
+    h = hashlib.sha1()
+    # Dimensões arredondadas: reescritores de PDF costumam mudar a precisão dos números
+    mediabox = tuple(round(float(v), 2) for v in page_obj.mediabox)
+    h.update(repr((mediabox, page_obj.rotate)).encode())
+    for stream in page_obj.contents:
+        stream = resolve1(stream)
+        if isinstance(stream, PDFStream):
+            h.update(stream.get_data())
+
+    resources = resolve1(page_obj.resources) or {}
+    xobjects = resolve1(resources.get('XObject')) or {}
+    for name in sorted(xobjects, key=str):
+        xobject = resolve1(xobjects[name])
+        h.update(str(name).encode())
+        if isinstance(xobject, PDFStream):
+            # Formulários contêm texto (decodifica); imagens basta comparar os bytes brutos
+            subtype = resolve1(xobject.get('Subtype'))
+            is_form = getattr(subtype, 'name', None) == 'Form'
+            h.update(xobject.get_data() if is_form else xobject.get_rawdata() or b'')
+    fonts = resolve1(resources.get('Font')) or {}
+    for name in sorted(fonts, key=str):
+        font = resolve1(fonts[name])
+        base_font = resolve1(font.get('BaseFont')) if isinstance(font, dict) else None
+        h.update(f"{name}:{getattr(base_font, 'name', base_font)}".encode())
+    return h.hexdigest()
+
+def manifest_path_for(output_dir: Path, base_name: str) -> Path:
+    """Manifesto de páginas salvo ao lado da saída: <base>_pages.json."""
+    return Path(output_dir) / f"{base_name}_pages.json"
+
+def load_manifest(manifest_path: Path) -> dict | None:
+    """Carrega o manifesto de páginas de uma execução anterior, se existir."""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def save_manifest(manifest: dict, manifest_path: Path):
+    """Grava o manifesto de forma atômica."""
+    manifest_path = Path(manifest_path)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=manifest_path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+def extract_incremental(document: PDFDocument, previous_manifest: dict = None,
+                        header_height_ratio: float = 0.15, footer_height_ratio: float = 0.12,
+                        workers: int = 1, extract_tables: bool = True,
+                        header_sample_pages: int | None = HEADER_SAMPLE_PAGES,
+                        table_timeout: float | None = DEFAULT_PAGE_TIMEOUT, table_failure: str = 'stream') -> dict:
+    """
+    Extrai blocos de texto e tabelas reaproveitando as páginas inalteradas de uma revisão anterior.
+
+    Cada página é identificada pela sua impressão digital (page_fingerprint), não pelo número,
+    então inserir ou remover páginas não invalida o restante. Só as páginas cujo conteúdo mudou
+    passam por extract_raw/Camelot; as demais são copiadas do manifesto anterior com o novo
+    número de página. Como em extract_raw, cada página reextraída é lida uma única vez: as mesmas
+    linhas dão o candidato a cabeçalho/rodapé (nas header_sample_pages páginas iniciais) e os
+    blocos. O reaproveitamento só acontece se os parâmetros, a versão do código e o
+    cabeçalho/rodapé comum forem os mesmos da execução anterior. Sem manifesto anterior,
+    o resultado é idêntico ao de extract_raw + extract_raw_tables.
+    As tabelas de páginas cuja extração falhou ou passou de table_timeout (ver scan_tables)
+    ficam marcadas no manifesto e são extraídas de novo na próxima execução.
+
+    Returns:
+        dict: {"blocks": [...], "raw_tables": [...], "manifest": {...},
+               "pages_extracted": int, "pages_reused": int,
+               "table_report": relatório do pré-filtro de tabelas nas páginas reextraídas (ver scan_tables)}
+    """
+    params = {
+        "header_height_ratio": header_height_ratio,
+        "footer_height_ratio": footer_height_ratio,
+        "tables": extract_tables,
+        "header_sample_pages": header_sample_pages,
+        "version": CACHE_VERSION,
+    }
+    previous_pages = {}
+    if previous_manifest and previous_manifest.get("params") == params:
+        for entry in previous_manifest.get("paginas", []):
+            previous_pages.setdefault(entry["fingerprint"], entry)
+
+    pages = document.pages
+    n_pages = len(pages)
+    with instrumentation.span("page_fingerprints"):
+        fingerprints = [page_fingerprint(page) for page in pages]
+
+    with instrumentation.span("extract_raw"):
+        sample_pages = range(1, (n_pages if header_sample_pages is None else min(n_pages, header_sample_pages)) + 1)
+        # Extrai as páginas alteradas e as da amostra de cabeçalho/rodapé sem candidato no manifesto;
+        # para as demais páginas da amostra, reaproveita o candidato já calculado
+        page_lines = extract_page_lines(document, [
+            p for p in range(1, n_pages + 1)
+            if fingerprints[p - 1] not in previous_pages
+            or (p in sample_pages and "candidato" not in previous_pages[fingerprints[p - 1]])
+        ], workers)
+        candidates = {}
+        for page_num in sample_pages:
+            if page_num in page_lines:
+                candidates[page_num] = _page_candidate(page_lines[page_num][1])
+            else:
+                candidate = previous_pages[fingerprints[page_num - 1]]["candidato"]
+                candidates[page_num] = tuple(candidate) if candidate else None
+        common_header, common_footer = _common_header_footer(candidates[p] for p in sorted(candidates))
+
+        # Blocos já extraídos dependem do cabeçalho/rodapé removido: se mudou, nada é reaproveitado
+        if previous_manifest and (previous_manifest.get("cabecalho"), previous_manifest.get("rodape")) != (common_header, common_footer):
+            previous_pages = {}
+
+        changed_pages = [p for p in range(1, n_pages + 1) if fingerprints[p - 1] not in previous_pages]
+        # Só quando o cabeçalho/rodapé mudou sobram páginas alteradas ainda não extraídas
+        page_lines.update(extract_page_lines(document, [p for p in changed_pages if p not in page_lines], workers))
+
+        new_blocks = {}
+        for page_num in changed_pages:
+            page_height, lines = page_lines[page_num]
+            new_blocks[page_num] = [block["text"] for block in _page_blocks(
+                page_num, page_height, lines, common_header, common_footer, header_height_ratio, footer_height_ratio)]
+    instrumentation.increment("pages_reused", n_pages - len(changed_pages), stage="extract_raw")
+    # Tabelas: páginas alteradas e as que ficaram incompletas na execução anterior
+    table_pages = [p for p in range(1, n_pages + 1)
+                   if fingerprints[p - 1] not in previous_pages or previous_pages[fingerprints[p - 1]].get("tabelas_incompletas")]
+    new_tables = {}
+    table_report = None
+    if extract_tables:
+        instrumentation.increment("pages_reused", n_pages - len(table_pages), stage="extract_tables")
+    if extract_tables and table_pages:
+        with instrumentation.span("extract_tables"):
+            table_scan = scan_tables(document, table_pages, workers=workers, page_timeout=table_timeout,
+                                     on_failure=table_failure)
+        for table in table_scan.pop("raw_tables"):
+            new_tables.setdefault(table["page"], []).append({"flavor": table["flavor"], "rows": table["rows"]})
+        table_report = table_scan
+
+    changed = set(changed_pages)
+    rescanned = set(table_pages)
+    failed_pages = set(table_report["failed_pages"]) if table_report else set()
+    blocks = []
+    raw_tables = []
+    manifest_pages = []
+    for page_num in range(1, n_pages + 1):
+        fingerprint = fingerprints[page_num - 1]
+        if page_num in changed:
+            page_texts = new_blocks.get(page_num, [])
+        else:
+            page_texts = previous_pages[fingerprint]["blocos"]
+        if page_num in rescanned or not extract_tables:
+            page_tables = new_tables.get(page_num, [])
+        else:
+            page_tables = previous_pages[fingerprint].get("tabelas", [])
+
+        blocks.extend({"text": text, "page": page_num} for text in page_texts)
+        raw_tables.extend({"page": page_num, **table} for table in page_tables)
+
+        entry = {"pagina": page_num, "fingerprint": fingerprint, "blocos": page_texts, "tabelas": page_tables}
+        if page_num in failed_pages:
+            entry["tabelas_incompletas"] = True
+        if page_num in candidates:
+            entry["candidato"] = list(candidates[page_num]) if candidates[page_num] else None
+        manifest_pages.append(entry)
+
+    manifest = {
+        "documento": document.name,
+        "content_hash": document.content_hash,
+        "params": params,
+        "cabecalho": common_header,
+        "rodape": common_footer,
+        "paginas": manifest_pages,
+    }
+    return {
+        "blocks": blocks,
+        "raw_tables": raw_tables,
+        "manifest": manifest,
+        "pages_extracted": len(changed_pages),
+        "pages_reused": n_pages - len(changed_pages),
+        "table_report": table_report,
+    }
@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import tempfile
+import cProfile
+import contextvars
+from pathlib import Path
+from collections import defaultdict
+from contextlib import contextmanager
+
+# pyinstrument é opcional: sem ele, o perfil das etapas usa o cProfile da biblioteca padrão
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+# Prefixo das métricas no formato Prometheus
+METRIC_PREFIX = 'pipeline'
+# Rótulos que identificam uma ocorrência (p. ex. a página): ficam só nos eventos do log JSON, não
+# nas métricas agregadas, para não criar uma série Prometheus por página
+EVENT_ONLY_LABELS = ('page',)
+# Limite de eventos guardados por processo; os excedentes só entram nas métricas agregadas
+MAX_EVENTS = 100_000
+PROFILERS = ('cprofile', 'pyinstrument')
+
+# Configuração do perfil por etapa. Fica também no ambiente para valer nos processos filhos
+# (lote e extração paralela), inclusive os iniciados com spawn.
+PROFILE_STAGES_ENV = 'PIPELINE_PROFILE_STAGES'
+PROFILE_DIR_ENV = 'PIPELINE_PROFILE_DIR'
+PROFILER_ENV = 'PIPELINE_PROFILER'
+
+_context = contextvars.ContextVar('instrumentation_labels', default={})
+_profiling = False
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items() if v is not None))
+
+class MetricsRegistry:
+    """
+    Métricas de um processo: contadores e durações agregadas por (nome, rótulos), mais a lista de
+    eventos (um por span, com início, duração e todos os rótulos) para o log JSON.
+    snapshot() produz um dict serializável, que merge() soma em outro registro: é assim que as
+    métricas dos processos filhos voltam para o processo principal.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.spans = {}  # (nome, rótulos) -> [quantidade, soma dos segundos, máximo]
+        self.events = []
+        self.dropped_events = 0
+
+    def increment(self, name: str, value: float = 1, labels: dict = None):
+        self.counters[(name, _labels_key(labels or {}))] += value
+
+    def record_span(self, name: str, seconds: float, labels: dict = None, start: float = None, error: str = None):
+        labels = labels or {}
+        key = (name, _labels_key({k: v for k, v in labels.items() if k not in EVENT_ONLY_LABELS}))
+        stats = self.spans.setdefault(key, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        stats[2] = max(stats[2], seconds)
+        if len(self.events) >= MAX_EVENTS:
+            self.dropped_events += 1
+            return
+        event = {"ts": round(start if start is not None else time.time() - seconds, 6), "event": "span",
+                 "name": name, "seconds": round(seconds, 6), "pid": os.getpid(),
+                 **{k: v for k, v in labels.items() if v is not None}}
+        if error is not None:
+            event["error"] = error
+        self.events.append(event)
+
+    def snapshot(self) -> dict:
+        return {
+            "counters": [[name, dict(key), value] for (name, key), value in self.counters.items()],
+            "spans": [[name, dict(key), *stats] for (name, key), stats in self.spans.items()],
+            "events": list(self.events),
+            "dropped_events": self.dropped_events,
+        }
+
+    def merge(self, snapshot: dict):
+        for name, labels, value in snapshot.get("counters", []):
+            self.counters[(name, _labels_key(labels))] += value
+        for name, labels, count, total, maximum in snapshot.get("spans", []):
+            stats = self.spans.setdefault((name, _labels_key(labels)), [0, 0.0, 0.0])
+            stats[0] += count
+            stats[1] += total
+            stats[2] = max(stats[2], maximum)
+        room = MAX_EVENTS - len(self.events)
+        events = snapshot.get("events", [])
+        self.events.extend(events[:max(0, room)])
+        self.dropped_events += snapshot.get("dropped_events", 0) + max(0, len(events) - max(0, room))
+
+_registry = MetricsRegistry()
+
+def registry() -> MetricsRegistry:
+    """Registro de métricas em uso neste processo."""
+    return _registry
+
+@contextmanager
+def collecting():
+    """
+    Troca o registro do processo por um novo enquanto o bloco executa e o entrega ao final, sem
+    somá-lo ao anterior. Usado para devolver as métricas de um documento junto com o resultado.
+    """
+    global _registry
+    previous, _registry = _registry, MetricsRegistry()
+    try:
+        yield _registry
+    finally:
+        _registry = previous
+
+def current_labels() -> dict:
+    return dict(_context.get())
+
+@contextmanager
+def context(**labels):
+    """Rótulos acrescentados a todos os spans e contadores registrados dentro do bloco (p. ex. doc=...)."""
+    token = _context.set({**_context.get(), **labels})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+def increment(name: str, value: float = 1, **labels):
+    """Soma value ao contador name, com os rótulos do contexto mais os informados."""
+    if value:
+        _registry.increment(name, value, {**_context.get(), **labels})
+
+def record_span(name: str, seconds: float, error: str = None, **labels):
+    """Registra uma duração medida fora de um span (p. ex. a de uma página lida em outro processo)."""
+    _registry.record_span(name, seconds, {**_context.get(), **labels}, error=error)
+
+@contextmanager
+def span(name: str, **labels):
+    """
+    Mede a duração do bloco e a registra com o nome e os rótulos informados (e os do contexto).
+    Se o bloco levanta uma exceção, o evento ganha "error" com o tipo dela. Com o perfil ativado
+    para name (configure_profiling), o bloco roda sob o profiler.
+    """
+    labels = {**_context.get(), **labels}
+    profiler = _start_profiler(name)
+    start_wall = time.time()
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        if profiler is not None:
+            _stop_profiler(profiler, name, labels)
+        _registry.record_span(name, seconds, labels, start=start_wall, error=error)
+
+def merge(snapshot: dict):
+    """Soma ao registro do processo as métricas de outro (MetricsRegistry.snapshot())."""
+    if snapshot:
+        _registry.merge(snapshot)
+
+def reset():
+    global _registry
+    _registry = MetricsRegistry()
+
+def run_collecting(labels: dict, fn, *args):
+    """Executa fn(*args) em um processo filho e devolve (resultado, métricas registradas)."""
+    with collecting() as metrics, context(**labels):
+        result = fn(*args)
+    return result, metrics.snapshot()
+
+def submit(executor, fn, *args):
+    """executor.submit que leva os rótulos do contexto e traz de volta as métricas do processo filho (ver result)."""
+    return executor.submit(run_collecting, current_labels(), fn, *args)
+
+def result(future):
+    """Resultado de uma tarefa de submit(); as métricas dela entram no registro deste processo."""
+    value, snapshot = future.result()
+    merge(snapshot)
+    return value
+
+# --- Perfil por etapa ---
+
+def configure_profiling(stages: list[str], profile_dir: Path = Path('data/profiles'), profiler: str = 'cprofile'):
+    """
+    Ativa o perfil (cProfile ou pyinstrument) dos spans com os nomes informados. Cada execução
+    de um span perfilado grava <profile_dir>/<span>-<doc>-<pid>-<n>.prof (cProfile, para pstats
+    ou snakeviz) ou .html (pyinstrument). Sem stages, desativa.
+    """
+    if profiler not in PROFILERS:
+        raise ValueError(f"Profiler inválido: {profiler!r} (use {', '.join(PROFILERS)})")
+    if profiler == 'pyinstrument' and pyinstrument is None:
+        raise RuntimeError("O perfil com pyinstrument requer o pacote pyinstrument (pip install pyinstrument)")
+    if not stages:
+        os.environ.pop(PROFILE_STAGES_ENV, None)
+        return
+    os.environ[PROFILE_STAGES_ENV] = ','.join(stages)
+    os.environ[PROFILE_DIR_ENV] = str(profile_dir)
+    os.environ[PROFILER_ENV] = profiler
+
+def _start_profiler(name: str):
+    global _profiling
+    # Um único profiler por vez: spans perfilados aninhados ficam dentro do perfil do externo
+    if _profiling or name not in os.environ.get(PROFILE_STAGES_ENV, '').split(','):
+        return None
+    _profiling = True
+    if os.environ.get(PROFILER_ENV) == 'pyinstrument' and pyinstrument is not None:
+        profiler = pyinstrument.Profiler()
+        profiler.start()
+    else:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+def _stop_profiler(profiler, name: str, labels: dict):
+    global _profiling
+    profile_dir = Path(os.environ.get(PROFILE_DIR_ENV, 'data/profiles'))
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    stem = '-'.join(str(part) for part in (name, labels.get('doc'), os.getpid()) if part is not None)
+    n = sum(1 for _ in profile_dir.glob(f"{stem}-*")) + 1
+    try:
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            profiler.dump_stats(profile_dir / f"{stem}-{n}.prof")
+        else:
+            profiler.stop()
+            (profile_dir / f"{stem}-{n}.html").write_text(profiler.output_html(), encoding='utf-8')
+    finally:
+        _profiling = False
+
+# --- Exportação ---
+
+def write_json_log(path: Path, metrics: MetricsRegistry = None, **fields):
+    """
+    Acrescenta ao arquivo (JSON Lines) um evento por span e, ao final, um evento "summary" com os
+    contadores e as durações agregadas. fields (p. ex. o resumo do lote) entram no "summary".
+    """
+    metrics = metrics or _registry
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    snapshot = metrics.snapshot()
+    summary = {
+        "ts": round(time.time(), 6), "event": "summary", **fields,
+        "counters": [{"name": name, **labels, "value": value} for name, labels, value in snapshot["counters"]],
+        "spans": [{"name": name, **labels, "count": count, "seconds": round(total, 6), "max_seconds": round(maximum, 6)}
+                  for name, labels, count, total, maximum in snapshot["spans"]],
+        "dropped_events": snapshot["dropped_events"],
+    }
+    with open(path, 'a', encoding='utf-8') as f:
+        for event in sorted(snapshot["events"], key=lambda event: event["ts"]):
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+
+def _escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels) + '}'
+
+def prometheus_text(metrics: MetricsRegistry = None) -> str:
+    """
+    Métricas no formato de texto do Prometheus: durações dos spans como pipeline_span_seconds
+    (summary com _count e _sum, e o máximo em pipeline_span_seconds_max) e cada contador como
+    pipeline_<nome>_total.
+    """
+    metrics = metrics or _registry
+    lines = []
+    if metrics.spans:
+        lines += [f"# HELP {METRIC_PREFIX}_span_seconds Duração das etapas e páginas do pipeline.",
+                  f"# TYPE {METRIC_PREFIX}_span_seconds summary"]
+        for (name, key), (count, total, _) in sorted(metrics.spans.items()):
+            labels = _format_labels((('span', name),) + key)
+            lines.append(f"{METRIC_PREFIX}_span_seconds_count{labels} {count}")
+            lines.append(f"{METRIC_PREFIX}_span_seconds_sum{labels} {total:.6f}")
+        lines += [f"# HELP {METRIC_PREFIX}_span_seconds_max Maior duração de um span.",
+                  f"# TYPE {METRIC_PREFIX}_span_seconds_max gauge"]
+        for (name, key), (_, _, maximum) in sorted(metrics.spans.items()):
+            lines.append(f"{METRIC_PREFIX}_span_seconds_max{_format_labels((('span', name),) + key)} {maximum:.6f}")
+
+    by_name = defaultdict(list)
+    for (name, key), value in metrics.counters.items():
+        by_name[name].append((key, value))
+    for name in sorted(by_name):
+        metric = f"{METRIC_PREFIX}_{name}_total"
+        lines.append(f"# TYPE {metric} counter")
+        for key, value in sorted(by_name[name]):
+            lines.append(f"{metric}{_format_labels(key)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+def write_prometheus(path: Path, metrics: MetricsRegistry = None):
+    """Grava prometheus_text() de forma atômica (formato do textfile collector do node_exporter)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text(metrics))
+    os.replace(tmp_path, path)
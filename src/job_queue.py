@@ -0,0 +1,208 @@
+import time
+import sqlite3
+from pathlib import Path
+from contextlib import contextmanager
+
+DEFAULT_QUEUE_PATH = Path('data/cache/ingest_queue.sqlite')
+
+# Tentativas por job antes de marcá-lo como falho; entre elas, espera RETRY_BACKOFF_S * 2**(tentativa - 1)
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF_S = 30.0
+# Envelhecimento da prioridade: cada AGING_S segundos na fila equivalem a uma página a menos, para que
+# um documento grande não espere para sempre atrás de um fluxo contínuo de documentos pequenos
+AGING_S = 60.0
+# Jobs concluídos mais recentes usados nas estatísticas de latência
+LATENCY_WINDOW = 500
+
+# Estados de um job: pendente -> processando -> concluido | falhou (ou de volta a pendente, para nova
+# tentativa); substituido quando o arquivo mudou antes de ser processado e um job mais novo o substituiu
+STATUSES = ('pendente', 'processando', 'concluido', 'falhou', 'substituido')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    pages INTEGER,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    output TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_path ON jobs (path, id);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, not_before);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);
+"""
+
+class JobQueue:
+    """
+    Fila de ingestão persistente (SQLite em modo WAL), usada pelo daemon de watcher.py.
+
+    Cada job é um PDF (caminho + hash do conteúdo): o mesmo arquivo só volta para a fila se o
+    conteúdo for diferente do seu job mais recente (inclusive quando volta a uma versão já
+    processada, A -> B -> A), e uma versão ainda pendente é substituída pela mais nova. A fila sobrevive a
+    reinícios; jobs que estavam em processamento quando o daemon parou voltam a pendentes
+    (requeue_interrupted). claim entrega primeiro os documentos com menos páginas (ou menores, se o
+    número de páginas não é conhecido), com envelhecimento (AGING_S) para não deixar os grandes
+    esperando indefinidamente. Falhas são tentadas de novo até max_attempts, com espera exponencial.
+    """
+
+    def __init__(self, db_path: Path = DEFAULT_QUEUE_PATH, timeout: float = 30.0):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None: as transações são abertas explicitamente em _transaction
+        self.conn = sqlite3.connect(self.db_path, timeout=timeout, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+        self._migrate()
+        self.conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        """Transação de escrita: BEGIN IMMEDIATE reserva o banco e espera outros escritores."""
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.conn
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def _migrate(self):
+        """
+        Filas criadas por versões anteriores tinham UNIQUE (path, content_hash), que impedia
+        enfileirar de novo uma versão já vista do arquivo: a tabela é recriada sem a restrição.
+        """
+        row = self.conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'jobs'").fetchone()
+        if row is None or 'UNIQUE' not in row["sql"]:
+            return
+        with self._transaction() as conn:
+            conn.execute("ALTER TABLE jobs RENAME TO jobs_old")
+            for index in ('jobs_status', 'jobs_finished'):
+                conn.execute(f"DROP INDEX IF EXISTS {index}")
+            # executescript confirmaria a transação; os comandos do esquema vão um a um
+            for statement in _SCHEMA.split(';'):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute("INSERT INTO jobs SELECT * FROM jobs_old")
+            conn.execute("DROP TABLE jobs_old")
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # --- Enfileiramento ---
+
+    @staticmethod
+    def _is_latest(conn, path: Path, content_hash: str) -> bool:
+        row = conn.execute("SELECT content_hash FROM jobs WHERE path = ? ORDER BY id DESC LIMIT 1",
+                           (str(path),)).fetchone()
+        return row is not None and row["content_hash"] == content_hash
+
+    def contains(self, path: Path, content_hash: str) -> bool:
+        """Esta versão do arquivo é a do job mais recente do caminho (em qualquer estado)?"""
+        return self._is_latest(self.conn, path, content_hash)
+
+    def enqueue(self, path: Path, content_hash: str, size: int, pages: int = None) -> int | None:
+        """
+        Enfileira uma versão do arquivo. Retorna o id do job, ou None se essa versão já é a do job
+        mais recente do caminho. Versões anteriores do mesmo caminho ainda pendentes passam a 'substituido'.
+        """
+        with self._transaction() as conn:
+            if self._is_latest(conn, path, content_hash):
+                return None
+            conn.execute("UPDATE jobs SET status = 'substituido', finished_at = ? WHERE path = ? AND status = 'pendente'",
+                         (time.time(), str(path)))
+            cursor = conn.execute(
+                "INSERT INTO jobs (path, content_hash, size, pages, status, enqueued_at) VALUES (?, ?, ?, ?, 'pendente', ?)",
+                (str(path), content_hash, size, pages, time.time()))
+            return cursor.lastrowid
+
+    def requeue_interrupted(self) -> int:
+        """Jobs em processamento de uma execução anterior interrompida voltam a pendentes."""
+        with self._transaction() as conn:
+            return conn.execute("UPDATE jobs SET status = 'pendente', started_at = NULL "
+                                "WHERE status = 'processando'").rowcount
+
+    # --- Processamento ---
+
+    def claim(self) -> dict | None:
+        """Marca como em processamento e retorna o próximo job pronto (menor documento primeiro)."""
+        now = time.time()
+        with self._transaction() as conn:
+            # Sem número de páginas, estima pelo tamanho (~50 KB por página)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'pendente' AND not_before <= ? "
+                "ORDER BY COALESCE(pages, size / 50000) - (? - enqueued_at) / ?, enqueued_at LIMIT 1",
+                (now, now, AGING_S)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status = 'processando', attempts = attempts + 1, started_at = ? WHERE id = ?",
+                         (now, row["id"]))
+        return {**dict(row), "status": 'processando', "attempts": row["attempts"] + 1, "started_at": now}
+
+    def complete(self, job_id: int, output: Path):
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET status = 'concluido', finished_at = ?, output = ?, error = NULL WHERE id = ?",
+                         (time.time(), str(output), job_id))
+
+    def fail(self, job_id: int, error: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+             retry_backoff: float = DEFAULT_RETRY_BACKOFF_S, retry: bool = True) -> bool:
+        """
+        Registra a falha de um job. Se ainda há tentativas (e retry), ele volta a pendente após a espera
+        exponencial e o retorno é True; senão fica como 'falhou'.
+        """
+        with self._transaction() as conn:
+            attempts = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()["attempts"]
+            if retry and attempts < max_attempts:
+                conn.execute("UPDATE jobs SET status = 'pendente', not_before = ?, error = ? WHERE id = ?",
+                             (time.time() + retry_backoff * 2 ** (attempts - 1), error, job_id))
+                return True
+            conn.execute("UPDATE jobs SET status = 'falhou', finished_at = ?, error = ? WHERE id = ?",
+                         (time.time(), error, job_id))
+            return False
+
+    # --- Estado ---
+
+    def stats(self, window: int = LATENCY_WINDOW) -> dict:
+        """
+        Profundidade da fila (jobs por estado), idade do job pendente mais antigo e latência
+        (da entrada na fila ao fim) e espera (da entrada ao início) dos últimos window jobs concluídos.
+        """
+        now = time.time()
+        counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        oldest = self.conn.execute("SELECT MIN(enqueued_at) FROM jobs WHERE status = 'pendente'").fetchone()[0]
+        rows = self.conn.execute(
+            "SELECT finished_at - enqueued_at, started_at - enqueued_at FROM jobs WHERE status = 'concluido' "
+            "ORDER BY finished_at DESC LIMIT ?", (window,)).fetchall()
+        latencies = sorted(row[0] for row in rows)
+        waits = [row[1] for row in rows if row[1] is not None]
+
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3) if latencies else None
+
+        return {
+            "jobs": {status: counts.get(status, 0) for status in STATUSES},
+            "pendente_mais_antigo_s": round(now - oldest, 1) if oldest else None,
+            "latencia_s": {"p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0),
+                           "media": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                           "amostras": len(latencies)},
+            "espera_media_s": round(sum(waits) / len(waits), 3) if waits else None,
+        }
+
+    def failed_jobs(self, limit: int = 20) -> list[dict]:
+        rows = self.conn.execute("SELECT * FROM jobs WHERE status = 'falhou' ORDER BY finished_at DESC LIMIT ?",
+                                 (limit,)).fetchall()
+        return [dict(row) for row in rows]
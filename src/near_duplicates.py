@@ -0,0 +1,56 @@
+import zlib
+import numpy as np
+
+# Primo logo acima de 2^32: (a * x + b) % _PRIME cabe em uint64 sem overflow para x, a, b < 2^32
+_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+def shingles(text: str, size: int = 1) -> set[int]:
+    """
+    Conjunto de shingles (n-gramas de palavras) de um texto já normalizado, como hashes de 32 bits.
+    Textos com menos palavras que size viram um único shingle.
+    """
+    words = text.split()
+    if len(words) <= size:
+        return {zlib.crc32(" ".join(words).encode('utf-8'))} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)}
+
+class MinHasher:
+    """
+    Assinaturas MinHash e faixas LSH do texto normalizado dos parágrafos, usadas pelo índice de
+    quase-duplicatas de DedupStore (tabelas paragraphs e bands de dedup_store.py).
+
+    Cada parágrafo vira uma assinatura de num_perm mínimos de hashes permutados; a fração de
+    posições iguais entre duas assinaturas estima a similaridade de Jaccard dos shingles.
+    As assinaturas são divididas em bands faixas de rows posições: dois parágrafos só são
+    comparados se coincidirem em pelo menos uma faixa inteira, então a busca não compara cada
+    parágrafo novo com todo o corpus. Com 128 permutações em 32 faixas de 4, um par com
+    similaridade 0,75 vira candidato com probabilidade > 99,99%, e um par com 0,3 em ~23%.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, shingle_size: int = 1, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm deve ser múltiplo de bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, 2**32, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 2**32, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        """Assinatura MinHash (num_perm valores uint32) do texto normalizado."""
+        hashes = np.fromiter(shingles(text, self.shingle_size), dtype=np.uint64)
+        if hashes.size == 0:
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint32)
+        permuted = (np.outer(hashes, self._a) + self._b) % _PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def band_keys(self, signature: np.ndarray) -> list[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def params(self) -> dict:
+        """Parâmetros guardados pelo DedupStore: assinaturas de parâmetros diferentes não são comparáveis."""
+        return {"num_perm": self.num_perm, "bands": self.bands, "shingle_size": self.shingle_size,
+                "seed_a": int(self._a[0]), "seed_b": int(self._b[0])}
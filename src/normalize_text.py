@@ -1,7 +1,269 @@
 import re
 import string
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Iterable, Iterator
 from unidecode import unidecode
 
+_HYPHEN_BREAK_RE = re.compile(r'-\n\s*')
+_WHITESPACE_RE = re.compile(r'\s+')
+_WORD_RE = re.compile(r'\w+')
+_PUNCTUATION_TRANSLATOR = str.maketrans('', '', string.punctuation)
+_PUNCTUATION = frozenset(string.punctuation)
+
+def _trie_regex(keys) -> str:
+    """
+    Monta uma expressão regular em forma de trie (prefixos comuns fatorados) para as chaves.
+    Os quantificadores gulosos fazem o casamento mais longo ser tentado primeiro, o mesmo
+    efeito de ordenar a alternância da maior para a menor chave.
+    """
+    trie = {}
+    for key in keys:
+        node = trie
+        for char in key.lower():
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node) -> str:
+        is_end = '' in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char != '']
+        if not branches:
+            return ''
+        if len(branches) == 1 and not is_end:
+            return branches[0]
+        body = '(?:' + '|'.join(branches) + ')'
+        return body + '?' if is_end else body
+
+    return build(trie)
+
+def _sub_tracked(pattern, repl, text: str, src: list[int]) -> tuple[str, list[int]]:
+    """
+    Equivalente a pattern.sub(repl, text) que também atualiza src (posição no texto original
+    de cada caractere). Os caracteres de uma substituição apontam para o início do trecho substituído.
+    """
+    pieces = []
+    new_src = []
+    last = 0
+    for match in pattern.finditer(text):
+        start, end = match.span()
+        pieces.append(text[last:start])
+        new_src.extend(src[last:start])
+        replacement = repl(match) if callable(repl) else repl
+        pieces.append(replacement)
+        new_src.extend([src[start]] * len(replacement))
+        last = end
+    if not pieces:
+        return text, src
+    pieces.append(text[last:])
+    new_src.extend(src[last:])
+    return ''.join(pieces), new_src
+
+def _map_chars_tracked(fn, text: str, src: list[int]) -> tuple[str, list[int]]:
+    """Aplica fn caractere a caractere (fn pode expandir ou remover caracteres), atualizando src."""
+    pieces = []
+    new_src = []
+    for char, position in zip(text, src):
+        mapped = fn(char)
+        pieces.append(mapped)
+        new_src.extend([position] * len(mapped))
+    return ''.join(pieces), new_src
+
+def _compact_offsets(src: list[int], source_length: int) -> list[list[int]]:
+    """
+    Compacta o mapa caractere -> posição original em âncoras [pos_normalizada, pos_original].
+    Entre duas âncoras a posição cresce de um em um, limitada à posição da âncora seguinte menos 1,
+    então trechos expandidos (siglas) ficam dentro do trecho de origem sem precisar de uma âncora
+    por caractere. A última âncora é sempre [len(normalizado), len(original)].
+    """
+    anchors = []
+    anchor_norm = anchor_src = previous = None
+    for i, position in enumerate(src):
+        expected = None if anchor_norm is None else anchor_src + (i - anchor_norm)
+        # Continuação de uma expansão (mesma origem do caractere anterior) não precisa de âncora
+        if position != expected and position != previous:
+            anchors.append([i, position])
+            anchor_norm, anchor_src = i, position
+        previous = position
+    anchors.append([len(src), source_length])
+    return anchors
+
+def map_to_source(offsets: list[list[int]], position: int) -> int:
+    """Converte uma posição do texto normalizado na posição correspondente do texto original."""
+    k = bisect_right(offsets, position, key=lambda anchor: anchor[0]) - 1
+    if k < 0:
+        return 0
+    anchor_norm, anchor_src = offsets[k]
+    if k + 1 < len(offsets):
+        next_src = offsets[k + 1][1]
+        return min(anchor_src + (position - anchor_norm), max(anchor_src, next_src - 1))
+    return anchor_src
+
+def map_to_normalized(offsets: list[list[int]], position: int) -> int:
+    """
+    Converte uma posição do texto original na primeira posição do texto normalizado que vem
+    dela ou depois dela (útil para recortar o trecho normalizado de um pedaço do original).
+    """
+    k = bisect_right(offsets, position, key=lambda anchor: anchor[1]) - 1
+    if k < 0:
+        return 0
+    anchor_norm, anchor_src = offsets[k]
+    if k + 1 < len(offsets):
+        return min(anchor_norm + (position - anchor_src), offsets[k + 1][0])
+    return anchor_norm
+
+class Normalizer:
+    """
+    Normalizador reutilizável, construído uma única vez a partir dos dicionários.
+
+    Produz exatamente o mesmo resultado de normalize_text, mas em vez de compilar um padrão e
+    varrer o texto inteiro uma vez por chave, junta as chaves em poucas expressões compiladas em
+    forma de trie (casamento mais longo primeiro, como hoje), substituindo todos os termos de
+    cada grupo em uma única passada. As chaves só ficam no mesmo grupo quando não compartilham palavras com as chaves
+    e expansões anteriores do grupo — caso contrário a ordem sequencial original poderia mudar
+    o resultado (uma expansão contendo outra sigla, siglas sobrepostas etc.) e a chave abre um
+    novo grupo. Com os dicionários atuais, quase tudo cabe em uma passada.
+
+    O objeto pode ser serializado (pickle) e enviado a processos do pool.
+    """
+
+    def __init__(self, acronyms: dict = None, standardization_map: dict = None):
+        # A padronização vem primeiro para evitar conflitos com siglas (mesma regra de normalize_text).
+        combined_map = {**(standardization_map or {}), **(acronyms or {})}
+        # Ordena as chaves por comprimento, da maior para a menor, para evitar substituições parciais
+        sorted_keys = sorted(combined_map.keys(), key=len, reverse=True)
+        self.phases = self._build_phases(sorted_keys, combined_map)
+
+    @staticmethod
+    def _build_phases(sorted_keys, combined_map) -> list[tuple[re.Pattern, dict, list]]:
+        groups = []
+        current = []
+        current_tokens = set()
+        for key in sorted_keys:
+            # Expande escapes da string de substituição como re.sub faria
+            value = re.sub(r'\A', combined_map[key], '', count=1)
+            key_tokens = set(_WORD_RE.findall(key.lower()))
+            value_tokens = set(_WORD_RE.findall(value.lower()))
+            # Chaves que não começam/terminam com letra ou dígito têm fronteiras (\b) atípicas: grupo próprio
+            isolated = not (key and _WORD_RE.match(key[0]) and _WORD_RE.match(key[-1]))
+            if current and (isolated or key_tokens & current_tokens):
+                groups.append(current)
+                current = []
+                current_tokens = set()
+            current.append((key, value))
+            current_tokens |= key_tokens | value_tokens
+            if isolated:
+                groups.append(current)
+                current = []
+                current_tokens = set()
+        if current:
+            groups.append(current)
+
+        phases = []
+        for group in groups:
+            pattern = re.compile(r'\b' + _trie_regex(key for key, _ in group) + r'\b', flags=re.IGNORECASE)
+            lookup = {}
+            for key, value in group:
+                # Chaves iguais a menos de maiúsculas: vale a primeira, como na alternância original
+                lookup.setdefault(key.lower(), value)
+            phases.append((pattern, lookup, group))
+        return phases
+
+    @staticmethod
+    def _replacement(match, lookup, group) -> str:
+        value = lookup.get(match.group(0).lower())
+        if value is None:
+            # Equivalências de IGNORECASE que lower() não cobre: procura a chave como re.sub faria
+            for key, candidate in group:
+                if re.fullmatch(re.escape(key), match.group(0), flags=re.IGNORECASE):
+                    return candidate
+            return match.group(0)
+        return value
+
+    def expand_terms(self, text: str) -> str:
+        """Etapa 2: expansão de siglas e padronização de termos."""
+        for pattern, lookup, group in self.phases:
+            text = pattern.sub(lambda m: self._replacement(m, lookup, group), text)
+        return text
+
+    def normalize(self, raw_text: str) -> str:
+        """Aplica as mesmas etapas de normalize_text ao texto informado."""
+        # Etapa 1: Correção de hifenização e quebras de linha
+        # Remove o hífen no final de uma linha e junta a palavra com a continuação na próxima linha.
+        # Ex: "gradua-\nção" -> "graduação"
+        normalized_text = _HYPHEN_BREAK_RE.sub('', raw_text)
+        # Substitui quebras de linha por espaço para unificar o texto em um fluxo contínuo.
+        normalized_text = normalized_text.replace('\n', ' ')
+
+        # Etapa 2: Expansão de siglas e padronização de termos (uma passada por grupo de chaves)
+        normalized_text = self.expand_terms(normalized_text)
+
+        # Etapa 3: Conversão para minúsculas
+        normalized_text = normalized_text.lower()
+
+        # Etapa 4: Remoção de acentos
+        # Translitera caracteres acentuados para suas versões não acentuadas (ex: 'ção' -> 'cao').
+        normalized_text = unidecode(normalized_text)
+
+        # Etapa 5: Remoção de pontuação
+        normalized_text = normalized_text.translate(_PUNCTUATION_TRANSLATOR)
+
+        # Etapa 6: Normalização de espaços em branco
+        # Substitui múltiplos espaços, tabulações, etc., por um único espaço e remove espaços no início/fim.
+        normalized_text = _WHITESPACE_RE.sub(' ', normalized_text).strip()
+
+        return normalized_text
+
+    def normalize_with_offsets(self, raw_text: str) -> tuple[str, list[list[int]]]:
+        """
+        Mesmo resultado de normalize, acompanhado de um mapa compacto de posições de volta ao
+        texto original (ver map_to_source / map_to_normalized).
+        """
+        src = list(range(len(raw_text)))
+        # Etapa 1: hifenização e quebras de linha (a troca de '\n' por espaço não muda posições)
+        text, src = _sub_tracked(_HYPHEN_BREAK_RE, '', raw_text, src)
+        text = text.replace('\n', ' ')
+
+        # Etapa 2: expansão de siglas e padronização de termos
+        for pattern, lookup, group in self.phases:
+            text, src = _sub_tracked(pattern, lambda m: self._replacement(m, lookup, group), text, src)
+
+        # Etapa 3: minúsculas (só alguns caracteres raros mudam de tamanho)
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            lowered, src = _map_chars_tracked(str.lower, text, src)
+        text = lowered
+
+        # Etapa 4: remoção de acentos (unidecode é caractere a caractere; texto ASCII não muda)
+        if not text.isascii():
+            text, src = _map_chars_tracked(unidecode, text, src)
+
+        # Etapa 5: remoção de pontuação
+        kept = [i for i, char in enumerate(text) if char not in _PUNCTUATION]
+        if len(kept) != len(text):
+            text = ''.join(text[i] for i in kept)
+            src = [src[i] for i in kept]
+
+        # Etapa 6: espaços em branco
+        text, src = _sub_tracked(_WHITESPACE_RE, ' ', text, src)
+        stripped = text.strip()
+        if stripped:
+            start = len(text) - len(text.lstrip())
+            src = src[start:start + len(stripped)]
+        else:
+            src = []
+
+        return stripped, _compact_offsets(src, len(raw_text))
+
+    __call__ = normalize
+
+@lru_cache(maxsize=8)
+def _cached_normalizer(acronyms_items: tuple, standardization_items: tuple) -> Normalizer:
+    return Normalizer(dict(acronyms_items), dict(standardization_items))
+
+def get_normalizer(acronyms: dict = None, standardization_map: dict = None) -> Normalizer:
+    """Retorna um Normalizer para os dicionários informados, reaproveitando os já construídos."""
+    return _cached_normalizer(tuple((acronyms or {}).items()), tuple((standardization_map or {}).items()))
+
 def normalize_text(
     raw_text: str,
     acronyms: dict = None,
@@ -27,51 +289,19 @@ def normalize_text(
 
     Returns:
         str: O texto normalizado e limpo.
+
+    As etapas são executadas por um Normalizer (ver a classe acima), construído uma vez por
+    combinação de dicionários e reaproveitado nas chamadas seguintes.
+    """
+    return get_normalizer(acronyms, standardization_map).normalize(raw_text)
+
+def normalize_blocks(text_blocks: Iterable[dict], normalizer: Normalizer) -> Iterator[dict]:
+    """
+    Normaliza os blocos de extract_raw um a um, como gerador: a memória fica proporcional a um
+    bloco, e não ao documento inteiro. Cada bloco gerado mantém as chaves originais ("text",
+    "page", ...) e ganha "normalized" (o texto normalizado) e "offsets" (mapa compacto de
+    posições do texto normalizado para o original, ver map_to_source).
     """
-    if acronyms is None:
-        acronyms = {}
-    if standardization_map is None:
-        standardization_map = {}
-
-    # Etapa 1: Correção de hifenização e quebras de linha
-    # Remove o hífen no final de uma linha e junta a palavra com a continuação na próxima linha.
-    # Ex: "gradua-\nção" -> "graduação"
-    normalized_text = re.sub(r'-\n\s*', '', raw_text)
-    # Substitui quebras de linha por espaço para unificar o texto em um fluxo contínuo.
-    normalized_text = normalized_text.replace('\n', ' ')
-
-    # Etapa 2: Expansão de siglas e padronização de termos
-    # Unifica os dois dicionários para uma única passada de substituição.
-    # A padronização vem primeiro para evitar conflitos com siglas.
-    combined_map = {**standardization_map, **acronyms}
-
-    # Ordena as chaves por comprimento, da maior para a menor, para evitar substituições parciais
-    # Ex: substituir "BCC" antes de uma hipotética sigla "BC".
-    sorted_keys = sorted(combined_map.keys(), key=len, reverse=True)
-
-    for key in sorted_keys:
-        # Usa \b (word boundary) para garantir que estamos substituindo a palavra/sigla inteira.
-        # re.escape trata caracteres especiais que possam existir na chave (ex: pontos em U.S.A.).
-        pattern = r'\b' + re.escape(key) + r'\b'
-        # Usa re.IGNORECASE para capturar variações como 'ppc' ou 'PPC'.
-        normalized_text = re.sub(pattern, combined_map[key], normalized_text, flags=re.IGNORECASE)
-
-    # Etapa 3: Conversão para minúsculas
-    # Padroniza todo o texto para caixa baixa, facilitando comparações e processamento.
-    normalized_text = normalized_text.lower()
-
-    # Etapa 4: Remoção de acentos
-    # Translitera caracteres acentuados para suas versões não acentuadas (ex: 'ção' -> 'cao').
-    normalized_text = unidecode(normalized_text)
-
-    # Etapa 5: Remoção de pontuação
-    # Cria um tradutor que remove todos os caracteres de pontuação definidos em string.punctuation.
-    # Esta é uma abordagem "agressiva". Em alguns cenários, pode ser útil manter hífens ou outros sinais.
-    translator = str.maketrans('', '', string.punctuation)
-    normalized_text = normalized_text.translate(translator)
-
-    # Etapa 6: Normalização de espaços em branco
-    # Substitui múltiplos espaços, tabulações, etc., por um único espaço e remove espaços no início/fim.
-    normalized_text = re.sub(r'\s+', ' ', normalized_text).strip()
-
-    return normalized_text
+    for block in text_blocks:
+        normalized, offsets = normalizer.normalize_with_offsets(block["text"])
+        yield {**block, "normalized": normalized, "offsets": offsets}
@@ -0,0 +1,201 @@
+import json
+import gzip
+import zlib
+from pathlib import Path
+
+# Serializador e compressão opcionais: orjson é bem mais rápido que o json da biblioteca padrão,
+# e zstandard comprime melhor e mais rápido que gzip. Sem eles, a saída continua funcionando.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Versão do formato de registros da saída JSONL
+FORMAT_VERSION = 1
+COMPRESSION_SUFFIXES = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+def dumps(record: dict) -> bytes:
+    """Registro -> uma linha JSON em UTF-8 (sem o \\n)."""
+    if orjson is not None:
+        return orjson.dumps(record)
+    return json.dumps(record, ensure_ascii=False).encode('utf-8')
+
+def loads(line: bytes):
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+def output_path_for(output_dir: Path, base_name: str, compression: str = None) -> Path:
+    """Caminho da saída de um documento: <base>_output.jsonl, com .gz/.zst se comprimido."""
+    return Path(output_dir) / f"{base_name}_output.jsonl{COMPRESSION_SUFFIXES[compression]}"
+
+def _compression_from_suffix(path: Path) -> str | None:
+    return {'.gz': 'gzip', '.zst': 'zstd'}.get(Path(path).suffix)
+
+def _require_zstd():
+    if zstandard is None:
+        raise RuntimeError("Compressão zstd requer o pacote zstandard (pip install zstandard)")
+
+def _open_writer(path: Path, compression: str = None):
+    """Abre o arquivo para escrita com a compressão informada, como um fluxo binário."""
+    if compression is None:
+        return open(path, 'wb')
+    if compression == 'gzip':
+        return gzip.open(path, 'wb')
+    if compression == 'zstd':
+        _require_zstd()
+        return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'), closefd=True)
+    raise ValueError(f"Compressão inválida: {compression!r} (use 'gzip' ou 'zstd')")
+
+def _read_chunks(path: Path, chunk_size: int = 1 << 16):
+    """
+    Conteúdo descomprimido do arquivo em pedaços. Um arquivo ainda sendo escrito (ou interrompido)
+    não tem o final do fluxo comprimido: o que já foi descarregado é lido e o resto é ignorado.
+    """
+    compression = _compression_from_suffix(path)
+    if compression == 'gzip':
+        # wbits 16 + MAX_WBITS: formato gzip (cabeçalho e rodapé), como o escrito por gzip.open
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif compression == 'zstd':
+        _require_zstd()
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+    else:
+        decompressor = None
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            yield decompressor.decompress(chunk) if decompressor else chunk
+
+def _iter_lines(path: Path):
+    """Linhas completas (terminadas em \\n) do arquivo; uma última linha incompleta é descartada."""
+    pending = b""
+    for chunk in _read_chunks(path):
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()
+        yield from lines
+
+class JSONLWriter:
+    """
+    Escreve a saída de um documento como JSONL, um registro por linha, à medida que as etapas o produzem:
+
+        {"registro": "documento", ...metadados...}     cabeçalho (sempre a primeira linha)
+        {"registro": "elemento", "indice": i, ...}     um por item de "estrutura" (artigo, parágrafo...)
+        {"registro": "hierarquia", "hierarquia": [...], "indice": {...}}   árvore e índice de posições
+        {"registro": "tabela", "indice": j, "pagina": p, "linhas": [...]}
+        {"registro": "chunk", "indice": k, "texto": ..., "hash": ...}   com a etapa de chunks (ver chunking.py)
+        {"registro": "fim", "elementos": n, "tabelas": m}
+
+    O registro "fim" só é escrito em close(); um arquivo sem ele está incompleto (o processamento
+    ainda está em andamento ou foi interrompido), mas as linhas já escritas podem ser lidas.
+    Com compression 'gzip' ou 'zstd' a saída é comprimida em fluxo; leitores podem descomprimir e
+    interpretar linha a linha com memória constante (ver iter_records).
+    """
+
+    def __init__(self, path: Path, compression: str = None):
+        self.path = Path(path)
+        self.compression = compression
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = _open_writer(self.path, compression)
+        self.n_elements = 0
+        self.n_tables = 0
+        self.n_chunks = 0
+
+    def write(self, record: dict):
+        self._file.write(dumps(record) + b"\n")
+
+    def write_header(self, metadata: dict):
+        self.write({"registro": "documento", "formato": FORMAT_VERSION, **metadata})
+
+    def write_element(self, item: dict):
+        self.write({"registro": "elemento", "indice": self.n_elements, **item})
+        self.n_elements += 1
+
+    def write_index(self, index: dict):
+        """Hierarquia e índice de posições de "estrutura" (detect_structure.build_index)."""
+        self.write({"registro": "hierarquia", **index})
+
+    def write_table(self, rows: list[list[str]], page: int = None):
+        self.write({"registro": "tabela", "indice": self.n_tables, "pagina": page, "linhas": rows})
+        self.n_tables += 1
+
+    def write_chunk(self, chunk: dict):
+        """Chunk para recuperação; a linha k de <base>_embeddings.npy é o vetor do chunk k."""
+        self.write({"registro": "chunk", "indice": self.n_chunks, **chunk})
+        self.n_chunks += 1
+
+    def flush(self):
+        """Descarrega o que já foi escrito (fim de uma etapa), para leitores do arquivo parcial."""
+        if self.compression == 'zstd':
+            self._file.flush(zstandard.FLUSH_BLOCK)
+        else:
+            self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        self.write({"registro": "fim", "elementos": self.n_elements, "tabelas": self.n_tables})
+        self._file.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        elif self._file is not None:
+            # Sem o registro "fim": o arquivo fica marcado como incompleto
+            self._file.close()
+            self._file = None
+
+def iter_records(path: Path):
+    """Lê os registros de uma saída JSONL (comprimida ou não) um a um, sem carregar o arquivo."""
+    for line in _iter_lines(Path(path)):
+        if line.strip():
+            yield loads(line)
+
+def read_output(path: Path) -> dict:
+    """
+    Carrega uma saída no formato de documento único (o do json.dump anterior), aceitando
+    tanto a saída JSONL por registros quanto a de um único objeto JSON indentado.
+    Tabelas ganham "tables_pages" com a página de cada uma. Um arquivo JSONL sem o registro
+    "fim" ganha "incompleto": True.
+    """
+    path = Path(path)
+    try:
+        first = loads(next(_iter_lines(path), b""))
+    except ValueError:
+        first = None
+    if not (isinstance(first, dict) and first.get("registro") == "documento"):
+        return loads(b"".join(_read_chunks(path)))
+
+    document = {"estrutura": []}
+    tables, tables_pages = [], []
+    complete = False
+    for record in iter_records(path):
+        kind = record.pop("registro", None)
+        if kind == "documento":
+            record.pop("formato", None)
+            document = {**record, **document}
+        elif kind == "elemento":
+            record.pop("indice", None)
+            document["estrutura"].append(record)
+        elif kind == "hierarquia":
+            document.update(record)
+        elif kind == "tabela":
+            tables.append(record["linhas"])
+            tables_pages.append(record.get("pagina"))
+        elif kind == "chunk":
+            record.pop("indice", None)
+            document.setdefault("chunks", []).append(record)
+        elif kind == "fim":
+            complete = True
+    if tables:
+        document["tables"] = tables
+        document["tables_pages"] = tables_pages
+    if not complete:
+        document["incompleto"] = True
+    return document
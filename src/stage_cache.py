@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+import instrumentation
+
+# Versão do código das etapas. Incrementar sempre que a saída de alguma etapa mudar,
+# para que resultados antigos do cache não sejam reaproveitados.
+CACHE_VERSION = "7"
+
+DEFAULT_CACHE_DIR = Path('data/cache/stages')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_MISSING = object()
+
+def hash_bytes(data: bytes) -> str:
+    """Hash de conteúdo (SHA-256) usado como identidade de um PDF ou dicionário."""
+    return hashlib.sha256(data).hexdigest()
+
+def hash_json(value) -> str:
+    """Hash estável de um valor serializável em JSON (parâmetros, dicionários...)."""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hash_bytes(payload.encode('utf-8'))
+
+class StageCache:
+    """
+    Cache em disco, endereçado por conteúdo, para as saídas das etapas do pipeline.
+
+    A chave de cada entrada combina o hash do PDF, o nome da etapa, os parâmetros da etapa
+    e CACHE_VERSION. Cada entrada é um arquivo JSON em <cache_dir>/<etapa>/<hash_pdf>-<hash_params>.json,
+    gravado de forma atômica para que vários processos possam usar o mesmo diretório.
+    A remoção por tamanho descarta primeiro as entradas usadas há mais tempo (mtime é
+    atualizado a cada acerto).
+    """
+
+    def __init__(self, cache_dir: Path = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES, enabled: bool = True):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, stage: str, content_hash: str, params: dict) -> Path:
+        params_hash = hash_json({"params": params or {}, "version": CACHE_VERSION})
+        return self.cache_dir / stage / f"{content_hash}-{params_hash[:16]}.json"
+
+    def get(self, stage: str, content_hash: str, params: dict = None, default=None):
+        """Retorna o valor guardado ou default. Conta acertos e falhas."""
+        if not self.enabled:
+            return default
+        entry_path = self._entry_path(stage, content_hash, params)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            instrumentation.increment("stage_cache_misses", stage=stage)
+            return default
+        self.hits += 1
+        instrumentation.increment("stage_cache_hits", stage=stage)
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return value
+
+    def set(self, stage: str, content_hash: str, params: dict, value):
+        """Grava o valor de forma atômica (arquivo temporário + os.replace)."""
+        if not self.enabled:
+            return
+        entry_path = self._entry_path(stage, content_hash, params)
+        entry_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=entry_path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f, ensure_ascii=False)
+            os.replace(tmp_path, entry_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def get_or_compute(self, stage: str, content_hash: str, params: dict, compute):
+        """Retorna a saída em cache da etapa ou executa compute() e guarda o resultado."""
+        value = self.get(stage, content_hash, params, default=_MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(stage, content_hash, params, value)
+        return value
+
+    def _entries(self) -> list[Path]:
+        if not self.cache_dir.exists():
+            return []
+        return [p for p in self.cache_dir.glob('*/*.json') if p.is_file()]
+
+    def size_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self._entries())
+
+    def evict(self, max_bytes: int = None) -> int:
+        """Remove as entradas menos usadas até o cache caber em max_bytes. Retorna quantas removeu."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = []
+        total = 0
+        for entry_path in self._entries():
+            st = entry_path.stat()
+            entries.append((st.st_mtime, st.st_size, entry_path))
+            total += st.st_size
+
+        removed = 0
+        for _, size, entry_path in sorted(entries, key=lambda e: e[0]):
+            if total <= max_bytes:
+                break
+            try:
+                entry_path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def invalidate(self, content_hash: str = None, stage: str = None) -> int:
+        """
+        Remove entradas do cache: todas, as de um PDF (content_hash), as de uma etapa,
+        ou a combinação dos dois filtros. Retorna quantas entradas removeu.
+        """
+        removed = 0
+        for entry_path in self._entries():
+            if stage and entry_path.parent.name != stage:
+                continue
+            if content_hash and not entry_path.name.startswith(f"{content_hash}-"):
+                continue
+            entry_path.unlink()
+            removed += 1
+        return removed
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses}
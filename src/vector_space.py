@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+DEFAULT_SPACE_DIR = Path('data/cache/tfidf_space')
+
+class _Segment:
+    """Parágrafos de um documento: contagens de termos em CSR (arrays mapeados em memória)."""
+
+    def __init__(self, segment_dir: Path):
+        with open(segment_dir / 'meta.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.dir = segment_dir
+        self.document = meta['document']
+        self.rows = meta['rows']
+        self.n_rows = len(self.rows)
+        self.data = np.load(segment_dir / 'data.npy', mmap_mode='r')
+        self.indices = np.load(segment_dir / 'indices.npy', mmap_mode='r')
+        self.indptr = np.load(segment_dir / 'indptr.npy', mmap_mode='r')
+        # Frequência de documento do segmento (termos presentes e em quantos parágrafos)
+        self.df_terms = np.load(segment_dir / 'df_terms.npy')
+        self.df_counts = np.load(segment_dir / 'df_counts.npy')
+
+    def block(self, start: int, stop: int, n_features: int) -> sparse.csr_matrix:
+        """Linhas [start, stop) como CSR; só esse trecho dos arrays mapeados é lido do disco."""
+        lo, hi = int(self.indptr[start]), int(self.indptr[stop])
+        indptr = np.asarray(self.indptr[start:stop + 1], dtype=np.int64) - lo
+        return sparse.csr_matrix((np.asarray(self.data[lo:hi]), np.asarray(self.indices[lo:hi]), indptr),
+                                 shape=(stop - start, n_features))
+
+class HashedTfidfSpace:
+    """
+    Espaço vetorial TF-IDF persistente para a deduplicação semântica.
+
+    Os termos são mapeados por hashing (HashingVectorizer), então não há vocabulário a ajustar:
+    cada parágrafo é vetorizado uma única vez, quando o seu documento é gravado. Cada documento
+    vira um segmento em <space_dir>/segments com as contagens em CSR (data/indices/indptr.npy,
+    abertos com mmap) e a sua frequência de documento; o IDF é recalculado na consulta somando
+    as frequências dos segmentos, no mesmo formato do TfidfVectorizer (smooth_idf, max_df, norma L2).
+    A busca percorre os segmentos em blocos de linhas, guardando só os k melhores por parágrafo,
+    então a memória não depende do tamanho do corpus.
+    """
+
+    def __init__(self, space_dir: Path = DEFAULT_SPACE_DIR, n_features: int = 2 ** 20, max_df: float = 0.9):
+        self.space_dir = Path(space_dir)
+        self.n_features = n_features
+        self.max_df = max_df
+        # Mesma tokenização do TfidfVectorizer; só contagens (o IDF e a norma entram na consulta)
+        self.vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None,
+                                            dtype=np.float32)
+
+    def _counts(self, texts: list[str]) -> sparse.csr_matrix:
+        if not texts:
+            return sparse.csr_matrix((0, self.n_features), dtype=np.float32)
+        counts = self.vectorizer.transform(texts).tocsr()
+        counts.sort_indices()
+        return counts
+
+    # --- Segmentos ---
+
+    def _segments_dir(self) -> Path:
+        return self.space_dir / 'segments' / str(self.n_features)
+
+    def _document_key(self, doc_name: str) -> str:
+        return hashlib.sha1(doc_name.encode('utf-8')).hexdigest()[:16]
+
+    def _generations(self) -> dict[str, list[Path]]:
+        """Diretórios de segmento por documento (<chave>.<geração>), do mais novo para o mais antigo."""
+        generations = {}
+        segments_dir = self._segments_dir()
+        if not segments_dir.exists():
+            return generations
+        for path in segments_dir.iterdir():
+            key, _, generation = path.name.partition('.')
+            if path.is_dir() and generation.isdigit():
+                generations.setdefault(key, []).append(path)
+        for paths in generations.values():
+            paths.sort(key=lambda p: int(p.name.partition('.')[2]), reverse=True)
+        return generations
+
+    def segments(self, exclude_document: str = None) -> list[_Segment]:
+        segments = []
+        for paths in self._generations().values():
+            try:
+                segment = _Segment(paths[0])
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            if segment.document != exclude_document:
+                segments.append(segment)
+        return segments
+
+    def documents(self) -> set[str]:
+        return {segment.document for segment in self.segments()}
+
+    def add_document(self, doc_name: str, texts: list[str], rows: list[dict] = None):
+        """
+        Vetoriza os parágrafos do documento e grava o segmento (substitui o anterior do mesmo documento).
+        rows guarda, para cada parágrafo, os dados usados nos relatórios (artigo, prévia...).
+        """
+        counts = self._counts(texts)
+        # Em cada linha os índices são únicos, então a contagem por termo é a frequência de documento
+        df_terms, df_counts = np.unique(counts.indices, return_counts=True)
+
+        segments_dir = self._segments_dir()
+        segments_dir.mkdir(parents=True, exist_ok=True)
+        tmp_dir = Path(tempfile.mkdtemp(dir=segments_dir, prefix='tmp-'))
+        try:
+            np.save(tmp_dir / 'data.npy', counts.data.astype(np.float32))
+            np.save(tmp_dir / 'indices.npy', counts.indices.astype(np.int32))
+            np.save(tmp_dir / 'indptr.npy', counts.indptr.astype(np.int64))
+            np.save(tmp_dir / 'df_terms.npy', df_terms.astype(np.int32))
+            np.save(tmp_dir / 'df_counts.npy', df_counts.astype(np.int32))
+            with open(tmp_dir / 'meta.json', 'w', encoding='utf-8') as f:
+                json.dump({'document': doc_name, 'rows': rows or [{} for _ in texts]}, f, ensure_ascii=False)
+            # A nova geração aparece de uma vez (rename); leitores usam sempre a mais nova
+            os.rename(tmp_dir, segments_dir / f"{self._document_key(doc_name)}.{time.time_ns()}")
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        for old in self._generations().get(self._document_key(doc_name), [])[1:]:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def remove_document(self, doc_name: str):
+        for path in self._generations().get(self._document_key(doc_name), []):
+            shutil.rmtree(path, ignore_errors=True)
+
+    # --- Consulta ---
+
+    def _idf(self, segments: list[_Segment], query_counts: sparse.csr_matrix) -> np.ndarray:
+        df = np.zeros(self.n_features, dtype=np.int64)
+        n_docs = query_counts.shape[0]
+        for segment in segments:
+            np.add.at(df, segment.df_terms, segment.df_counts)
+            n_docs += segment.n_rows
+        query_terms, query_df = np.unique(query_counts.indices, return_counts=True)
+        np.add.at(df, query_terms, query_df)
+        idf = (np.log((1 + n_docs) / (1 + df)) + 1).astype(np.float32)
+        # max_df do TfidfVectorizer: termos presentes em quase todos os parágrafos não contam
+        idf[df > self.max_df * n_docs] = 0
+        return idf
+
+    def _weight(self, counts: sparse.csr_matrix, idf: np.ndarray) -> sparse.csr_matrix:
+        return normalize(counts.multiply(idf).tocsr(), norm='l2', copy=False)
+
+    def top_k(self, texts: list[str], k: int = 10, threshold: float = 0.0, exclude_document: str = None,
+              block_rows: int = 4096) -> list[list[tuple[float, str, dict]]]:
+        """
+        Para cada texto, os até k parágrafos guardados mais parecidos (cosseno TF-IDF >= threshold),
+        como listas de (similaridade, documento, dados da linha) em ordem decrescente.
+        """
+        if not texts:
+            return []
+        segments = self.segments(exclude_document)
+        query_counts = self._counts(texts)
+        idf = self._idf(segments, query_counts)
+        query = self._weight(query_counts, idf)
+
+        n_queries = len(texts)
+        best_scores = np.full((n_queries, k), -1.0, dtype=np.float32)
+        best_refs = np.full((n_queries, k, 2), -1, dtype=np.int64)
+        for segment_id, segment in enumerate(segments):
+            for start in range(0, segment.n_rows, block_rows):
+                stop = min(start + block_rows, segment.n_rows)
+                block = self._weight(segment.block(start, stop, self.n_features), idf)
+                scores = (query @ block.T).toarray()
+                refs = np.empty((n_queries, stop - start, 2), dtype=np.int64)
+                refs[..., 0] = segment_id
+                refs[..., 1] = np.arange(start, stop)
+                # Junta os k melhores anteriores com o bloco e mantém só os k maiores
+                all_scores = np.concatenate([best_scores, scores], axis=1)
+                all_refs = np.concatenate([best_refs, refs], axis=1)
+                if all_scores.shape[1] > k:
+                    keep = np.argpartition(-all_scores, k - 1, axis=1)[:, :k]
+                    best_scores = np.take_along_axis(all_scores, keep, axis=1)
+                    best_refs = np.take_along_axis(all_refs, keep[..., None], axis=1)
+                else:
+                    best_scores, best_refs = all_scores, all_refs
+
+        results = []
+        for i in range(n_queries):
+            matches = []
+            for j in np.argsort(-best_scores[i]):
+                score = float(best_scores[i, j])
+                if score < threshold or score <= 0:
+                    break
+                segment = segments[best_refs[i, j, 0]]
+                matches.append((score, segment.document, segment.rows[best_refs[i, j, 1]]))
+            results.append(matches)
+        return results
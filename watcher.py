@@ -0,0 +1,378 @@
+import os
+import sys
+import glob
+import time
+import queue
+import signal
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+sys.path.append(str(Path(__file__).parent / 'src'))
+
+import instrumentation
+from main import run_extraction_stages, finalize_document, load_dictionaries, INPUT_DIR, OUTPUT_DIR, DICTIONARIES_PATH
+from document import PDFDocument
+from stage_cache import StageCache
+from incremental import manifest_path_for
+from extract_tables import DEFAULT_PAGE_TIMEOUT
+from export_columnar import DEFAULT_EXPORT_DIR
+from job_queue import JobQueue, DEFAULT_QUEUE_PATH, DEFAULT_MAX_ATTEMPTS, DEFAULT_RETRY_BACKOFF_S
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+DEFAULT_POLL_INTERVAL_S = 2.0
+# Um arquivo só entra na fila depois de ficar este tempo sem mudar de tamanho nem de data
+DEFAULT_SETTLE_S = 2.0
+# Sem o marcador %%EOF no fim, espera até este tempo antes de enfileirar assim mesmo (PDF malformado)
+MAX_SETTLE_S = 60.0
+# Com watchdog, a pasta ainda é varrida inteira de tempos em tempos (eventos podem se perder)
+RESCAN_INTERVAL_S = 60.0
+DEFAULT_REPORT_INTERVAL_S = 30.0
+# Arquivos finalizados são gravados aqui e movidos para a pasta de saída com os.replace
+STAGING_DIR_NAME = '.staging'
+
+
+def _init_worker():
+    """Nos workers, Ctrl+C e SIGTERM ficam com o processo principal, que espera os jobs em andamento."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+
+def _looks_complete(path: Path) -> bool:
+    """O arquivo termina com o marcador %%EOF (um PDF copiado pela metade ainda não tem o trailer)."""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 1024))
+            return b'%%EOF' in f.read()
+    except OSError:
+        return False
+
+
+class _ChangedPaths(FileSystemEventHandler):
+    """Eventos do watchdog: só anota os caminhos alterados; a estabilização acontece em FolderWatcher.poll."""
+
+    def __init__(self):
+        self.paths = queue.SimpleQueue()
+
+    def on_any_event(self, event):
+        for attribute in ('src_path', 'dest_path'):
+            path = getattr(event, attribute, None)
+            if path and str(path).lower().endswith('.pdf'):
+                self.paths.put(Path(path))
+
+
+class FolderWatcher:
+    """
+    Detecta PDFs novos ou alterados em uma pasta, ignorando os que ainda estão sendo gravados.
+
+    Com o pacote watchdog, reage aos eventos do sistema de arquivos (com uma varredura completa a cada
+    RESCAN_INTERVAL_S); sem ele, varre a pasta a cada chamada de poll. Um arquivo fica pronto quando
+    o tamanho e a data de modificação não mudam por settle segundos e ele termina com %%EOF
+    (ou depois de MAX_SETTLE_S estável, mesmo sem o marcador).
+    """
+
+    def __init__(self, directory: Path, settle: float = DEFAULT_SETTLE_S, use_watchdog: bool = True):
+        self.directory = Path(directory)
+        self.settle = settle
+        self.seen = {}      # caminho -> (tamanho, mtime) da última versão entregue
+        self.pending = {}   # caminho -> ((tamanho, mtime), desde quando está assim)
+        self.handler = None
+        self.observer = None
+        self.last_scan = 0.0
+        if use_watchdog and Observer is not None:
+            self.handler = _ChangedPaths()
+            self.observer = Observer()
+            self.observer.schedule(self.handler, str(self.directory), recursive=False)
+            self.observer.start()
+
+    @property
+    def mode(self) -> str:
+        return 'watchdog' if self.observer is not None else 'polling'
+
+    def stop(self):
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+
+    def _candidates(self, now: float) -> set[Path]:
+        candidates = set(self.pending)
+        if self.observer is None or now - self.last_scan >= RESCAN_INTERVAL_S:
+            candidates.update(self.directory.glob('*.pdf'))
+            self.last_scan = now
+        else:
+            while True:
+                try:
+                    candidates.add(self.handler.paths.get_nowait())
+                except queue.Empty:
+                    break
+        return candidates
+
+    def poll(self) -> list[Path]:
+        """PDFs que ficaram prontos desde a última chamada."""
+        now = time.time()
+        ready = []
+        for path in sorted(self._candidates(now)):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                self.pending.pop(path, None)
+                self.seen.pop(path, None)
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if signature == self.seen.get(path):
+                continue
+            previous = self.pending.get(path)
+            if previous is None or previous[0] != signature:
+                self.pending[path] = (signature, now)
+                continue
+            stable_for = now - previous[1]
+            if stable_for >= self.settle and (stable_for >= MAX_SETTLE_S or _looks_complete(path)):
+                del self.pending[path]
+                self.seen[path] = signature
+                ready.append(path)
+        return ready
+
+
+class IngestDaemon:
+    """
+    Ingestão contínua: os PDFs que aparecem ou mudam em input_dir entram na fila persistente
+    (job_queue.JobQueue) e são processados por um pool de workers processos, os menores primeiro.
+
+    As etapas 1 a 4 rodam nos workers; a deduplicação e a gravação rodam neste processo, um documento
+    por vez, com o mesmo CrossDocumentDeduplication aberto. A saída é gravada em output_dir/.staging
+    e movida para output_dir com os.replace, então quem lê a pasta de saída nunca vê um arquivo pela
+    metade. Falhas são tentadas de novo (max_attempts, com espera exponencial); um worker que morre
+    (BrokenProcessPool) derruba só os jobs em andamento, e o pool é recriado.
+    A cada report_interval segundos, mostra a profundidade da fila e a latência (e, com metrics_prom,
+    grava as métricas do Prometheus com os gauges da fila).
+    """
+
+    def __init__(self, input_dir: Path = INPUT_DIR, output_dir: Path = OUTPUT_DIR,
+                 dictionaries_path: Path = DICTIONARIES_PATH, workers: int = 2, page_workers: int = 1,
+                 cache: StageCache = None, semantic_method: str = 'minhash',
+                 table_timeout: float | None = DEFAULT_PAGE_TIMEOUT, table_failure: str = 'stream',
+                 output_format: str = 'json', compression: str = None, export_format: str = None,
+                 export_dir: Path = DEFAULT_EXPORT_DIR, skip_stages: tuple = (),
+                 queue_path: Path = DEFAULT_QUEUE_PATH, poll_interval: float = DEFAULT_POLL_INTERVAL_S,
+                 settle: float = DEFAULT_SETTLE_S, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 retry_backoff: float = DEFAULT_RETRY_BACKOFF_S,
+                 report_interval: float = DEFAULT_REPORT_INTERVAL_S, metrics_prom: Path = None,
+                 use_watchdog: bool = True, chunker=None):
+        self.input_dir = Path(input_dir)
+        self.output_dir = Path(output_dir)
+        self.staging_dir = self.output_dir / STAGING_DIR_NAME
+        self.dictionaries_path = Path(dictionaries_path)
+        self.workers = max(1, workers)
+        self.page_workers = page_workers
+        self.cache = cache
+        self.semantic_method = semantic_method
+        self.table_timeout = table_timeout
+        self.table_failure = table_failure
+        self.output_format = output_format
+        self.compression = compression
+        self.export_format = export_format
+        self.export_dir = export_dir
+        self.skip_stages = tuple(skip_stages)
+        self.queue_path = Path(queue_path)
+        self.poll_interval = poll_interval
+        self.settle = settle
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.report_interval = report_interval
+        self.metrics_prom = metrics_prom
+        self.use_watchdog = use_watchdog
+        self.chunker = chunker
+        self.stopping = False
+        self._dictionaries = ({}, {})
+        self._dictionaries_mtime = None
+
+    def stop(self, *args):
+        """Para de enfileirar e de iniciar jobs; os que estão em andamento terminam (ver run)."""
+        self.stopping = True
+
+    def dictionaries(self) -> tuple[dict, dict]:
+        """Dicionários de normalização; só são relidos se o arquivo mudou desde a última leitura."""
+        try:
+            mtime = self.dictionaries_path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._dictionaries_mtime or self._dictionaries_mtime is None:
+            self._dictionaries = load_dictionaries(self.dictionaries_path, verbose=self._dictionaries_mtime is None)
+            self._dictionaries_mtime = mtime
+        return self._dictionaries
+
+    # --- Laço principal ---
+
+    def run(self):
+        """Processa a pasta até SIGINT/SIGTERM; os jobs ainda na fila ficam para a próxima execução."""
+        self.input_dir.mkdir(parents=True, exist_ok=True)
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        job_queue = JobQueue(self.queue_path)
+        requeued = job_queue.requeue_interrupted()
+        watcher = FolderWatcher(self.input_dir, self.settle, self.use_watchdog)
+        deduplicator = None
+        if 'deduplicate' not in self.skip_stages:
+            from deduplicate import CrossDocumentDeduplication
+            deduplicator = CrossDocumentDeduplication(self.semantic_method)
+        self.dictionaries()
+        executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+        in_flight = {}
+        last_report = time.time()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        print(f"Observando '{self.input_dir}' ({watcher.mode}) -> '{self.output_dir}' | "
+              f"{self.workers} workers | fila em '{self.queue_path}'"
+              + (f" | {requeued} job(s) interrompido(s) de volta à fila" if requeued else ""))
+        try:
+            while not self.stopping or in_flight:
+                if not self.stopping:
+                    for path in watcher.poll():
+                        self._enqueue(job_queue, path)
+                    while len(in_flight) < self.workers:
+                        job = job_queue.claim()
+                        if job is None:
+                            break
+                        future = self._submit(executor, job_queue, job)
+                        if future is not None:
+                            in_flight[future] = job
+
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(self.poll_interval)
+                    done = ()
+                broken = False
+                for future in done:
+                    broken |= self._finish(job_queue, in_flight.pop(future), future, deduplicator)
+                if broken:
+                    # Os demais jobs do pool quebrado também falharam; voltam para a fila
+                    for future, job in in_flight.items():
+                        self._fail(job_queue, job, "worker encerrado inesperadamente")
+                    in_flight.clear()
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker)
+
+                if time.time() - last_report >= self.report_interval:
+                    self.report(job_queue, len(in_flight))
+                    last_report = time.time()
+        finally:
+            executor.shutdown(wait=True)
+            watcher.stop()
+            self.report(job_queue, 0)
+            job_queue.close()
+            if self.cache is not None:
+                self.cache.evict()
+            print("Ingestão encerrada.")
+
+    def _enqueue(self, job_queue: JobQueue, path: Path):
+        try:
+            document = PDFDocument(path)
+        except OSError as e:
+            print(f"❌ {path.name}: {e}")
+            return
+        with document:
+            if job_queue.contains(path, document.content_hash):
+                return
+            try:
+                pages = document.n_pages
+            except Exception:
+                # Ilegível aqui também falhará no worker, onde a falha fica registrada no job
+                pages = None
+            job_id = job_queue.enqueue(path, document.content_hash, len(document.data), pages)
+        if job_id is not None:
+            instrumentation.increment("jobs_enqueued")
+            print(f"-> {path.name} na fila ({pages if pages is not None else '?'} páginas)")
+
+    def _submit(self, executor: ProcessPoolExecutor, job_queue: JobQueue, job: dict):
+        path = Path(job["path"])
+        if not path.exists():
+            job_queue.fail(job["id"], "arquivo removido da pasta de entrada", retry=False)
+            return None
+        acronyms, standardization_map = self.dictionaries()
+        return executor.submit(run_extraction_stages, str(path), acronyms, standardization_map, False,
+                               self.page_workers, self.cache, manifest_path_for(self.output_dir, path.stem), None,
+                               self.table_timeout, self.table_failure, self.skip_stages)
+
+    def _finish(self, job_queue: JobQueue, job: dict, future, deduplicator) -> bool:
+        """Finaliza o job cuja extração terminou. Retorna True se o pool de processos quebrou."""
+        path = Path(job["path"])
+        try:
+            extracted = future.result()
+            instrumentation.merge({**extracted["metrics"], "events": []})
+            with instrumentation.collecting() as doc_metrics:
+                _, staged_path = finalize_document(
+                    path, extracted, self.staging_dir, verbose=False, semantic_method=self.semantic_method,
+                    output_format=self.output_format, compression=self.compression,
+                    export_format=self.export_format, export_dir=self.export_dir, skip_stages=self.skip_stages,
+                    deduplicator=deduplicator, chunker=self.chunker)
+            # O processo fica no ar indefinidamente: os eventos por página não são acumulados
+            instrumentation.merge({**doc_metrics.snapshot(), "events": []})
+            # Arquivos auxiliares (p. ex. <base>_embeddings.npy) antes da saída, que sinaliza o documento pronto
+            for staged in self.staging_dir.glob(f"{glob.escape(path.stem)}_*"):
+                if staged != staged_path:
+                    os.replace(staged, self.output_dir / staged.name)
+            output_path = self.output_dir / staged_path.name
+            os.replace(staged_path, output_path)
+        except BrokenProcessPool:
+            self._fail(job_queue, job, "worker encerrado inesperadamente")
+            return True
+        except Exception as e:
+            self._fail(job_queue, job, f"{type(e).__name__}: {e}")
+            return False
+        job_queue.complete(job["id"], output_path)
+        latency = time.time() - job["enqueued_at"]
+        instrumentation.record_span("job", latency)
+        instrumentation.increment("jobs_completed")
+        print(f"✔ {path.name} ({extracted['n_pages']} páginas, {latency:.1f}s desde a entrada na fila) -> {output_path}")
+        return False
+
+    def _fail(self, job_queue: JobQueue, job: dict, error: str):
+        retrying = job_queue.fail(job["id"], error, self.max_attempts, self.retry_backoff)
+        instrumentation.increment("jobs_retried" if retrying else "jobs_failed")
+        attempt = f"tentativa {job['attempts']}/{self.max_attempts}"
+        print(f"❌ {Path(job['path']).name} ({attempt}): {error}" + ("; nova tentativa agendada" if retrying else ""))
+
+    # --- Estado ---
+
+    def report(self, job_queue: JobQueue, in_flight: int):
+        stats = job_queue.stats()
+        latency = stats["latencia_s"]
+        print(f"Fila: {stats['jobs']['pendente']} pendente(s) | {in_flight} em processamento | "
+              f"{stats['jobs']['concluido']} concluído(s) | {stats['jobs']['falhou']} falha(s) | "
+              f"latência p50 {latency['p50']}s, p95 {latency['p95']}s")
+        if self.metrics_prom:
+            write_prometheus(self.metrics_prom, stats, in_flight)
+
+
+def write_prometheus(path: Path, stats: dict, in_flight: int):
+    """Métricas do processo (ver instrumentation.prometheus_text) mais os gauges da fila, gravados de forma atômica."""
+    prefix = instrumentation.METRIC_PREFIX
+    lines = [f"# TYPE {prefix}_queue_jobs gauge"]
+    lines += [f'{prefix}_queue_jobs{{status="{status}"}} {count}' for status, count in stats["jobs"].items()]
+    lines += [f"# TYPE {prefix}_jobs_in_progress gauge", f"{prefix}_jobs_in_progress {in_flight}"]
+    if stats["pendente_mais_antigo_s"] is not None:
+        lines += [f"# TYPE {prefix}_queue_oldest_pending_seconds gauge",
+                  f"{prefix}_queue_oldest_pending_seconds {stats['pendente_mais_antigo_s']}"]
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    tmp_path.write_text(instrumentation.prometheus_text() + "\n".join(lines) + "\n", encoding='utf-8')
+    os.replace(tmp_path, path)
+
+
+def queue_status(queue_path: Path = DEFAULT_QUEUE_PATH) -> dict:
+    """Estado da fila persistente, sem iniciar o daemon (python main.py --queue-status)."""
+    with JobQueue(queue_path) as job_queue:
+        return {**job_queue.stats(), "falhas_recentes": [
+            {"arquivo": job["path"], "tentativas": job["attempts"], "erro": job["error"]}
+            for job in job_queue.failed_jobs(10)
+        ]}
+